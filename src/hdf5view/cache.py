@@ -0,0 +1,969 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the caches used to avoid reading the same
+data from the HDF5 file more than once.
+"""
+
+import itertools
+
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+import psutil
+
+from .chunks import read_data
+from .indexing import split_selection
+
+
+# Size in bytes aimed for by the tiles of datasets which are not
+# chunked, e.g. contiguous or compact datasets.
+DEFAULT_TILE_BYTES = 1 << 20
+
+
+def default_tile_shape(shape, itemsize, tile_bytes=DEFAULT_TILE_BYTES):
+    """
+    Returns a tile shape for a dataset that has no chunks. The
+    trailing axes are filled first, so that each tile is a
+    contiguous run of the dataset of about tile_bytes bytes.
+
+    Parameters
+    ----------
+    shape : TUPLE
+        Shape of the dataset.
+    itemsize : INT
+        Size in bytes of one element of the dataset.
+    tile_bytes : INT, optional
+        Size in bytes aimed for by each tile.
+
+    Returns
+    -------
+    tile_shape : TUPLE
+        Shape of each tile, e.g. (262, 500) for a float64
+        dataset of shape (3000, 500).
+
+    """
+    remaining = max(1, tile_bytes // max(1, itemsize))
+    tile_shape = []
+
+    for length in reversed(shape):
+        n = min(length, remaining) if length else 1
+        tile_shape.insert(0, max(1, n))
+        remaining = max(1, remaining // max(1, n))
+
+    return tuple(tile_shape)
+
+
+class MemoryBudget:
+    """
+    Process-wide budget of the memory taken by the caches of all the
+    open files and tabs.
+
+    The caches register with the budget and take a tick from it
+    whenever they use an entry, so the uses of all the caches are
+    ordered. When the caches together take more than max_bytes, the
+    least recently used entry of all is dropped, repeatedly, until
+    they are within budget. max_bytes defaults to FRACTION of the
+    physical memory.
+
+    A registered cache has an nbytes attribute and the methods
+    oldest, returning the tick of its least recently used entry
+    which may be dropped or None, drop_oldest, dropping that entry,
+    and forget, dropping everything read from a file.
+    """
+    FRACTION = 0.25
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or self.default_max_bytes()
+        self.caches = []
+        self.ticks = 0
+        self.evictions = 0
+
+    @classmethod
+    def default_max_bytes(cls):
+        return int(cls.FRACTION * psutil.virtual_memory().total)
+
+    def register(self, cache):
+        cache.budget = self
+        self.caches.append(cache)
+
+    def touch(self):
+        """
+        Returns the tick of a use of a cache entry
+        """
+        self.ticks += 1
+        return self.ticks
+
+    @property
+    def nbytes(self):
+        return sum(cache.nbytes for cache in self.caches)
+
+    def set_max_bytes(self, max_bytes):
+        """
+        Change the budget, evicting entries if necessary
+        """
+        self.max_bytes = max_bytes
+        self.enforce()
+
+    def enforce(self):
+        """
+        Drop the least recently used entries of all the
+        caches until they are within budget.
+        """
+        nbytes = self.nbytes
+
+        while nbytes > self.max_bytes:
+            candidates = [(cache.oldest(), i) for i, cache in enumerate(self.caches)]
+            candidates = [c for c in candidates if c[0] is not None]
+
+            if not candidates:
+                break
+
+            cache = self.caches[min(candidates)[1]]
+            before = cache.nbytes
+            cache.drop_oldest()
+            nbytes -= before - cache.nbytes
+            self.evictions += 1
+
+    def forget(self, filename):
+        """
+        Drop everything read from a file, e.g. when it is closed
+        """
+        for cache in self.caches:
+            cache.forget(filename)
+
+
+class TileCache:
+    """
+    Least recently used cache of tiles read from HDF5 datasets.
+
+    The tiles of a chunked dataset are its HDF5 chunks, so
+    reading a tile decompresses exactly one chunk and no chunk
+    is decompressed twice while its tile is in the cache. Datasets
+    without chunks are split into tiles of default_tile_shape.
+
+    The tiles of datasets with a compound dtype may be kept field by
+    field, each as a contiguous array, so that showing another field
+    only reads that field.
+
+    The cache is limited to max_bytes bytes, and to the memory_budget
+    if registered with it. When it is full the least recently used
+    tiles are evicted. The number of lookups served from the cache
+    (hits) and from the file (misses) are counted.
+    """
+    def __init__(self, max_bytes=256 * (1 << 20)):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.tiles = OrderedDict()
+        self.tile_shapes = {}
+        self.budget = None
+        self.ticks = {}
+
+    def set_max_bytes(self, max_bytes):
+        """
+        Change the byte budget of the cache, evicting tiles
+        if necessary.
+        """
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self):
+        """
+        Remove all the tiles from the cache
+        """
+        self.tiles.clear()
+        self.tile_shapes.clear()
+        self.ticks.clear()
+        self.nbytes = 0
+
+    def evict(self):
+        """
+        Evict the least recently used tiles until the cache
+        is within its byte budget.
+        """
+        while self.nbytes > self.max_bytes and self.tiles:
+            self.drop_oldest()
+
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def touch(self, key):
+        if self.budget is not None:
+            self.ticks[key] = self.budget.touch()
+
+    def oldest(self):
+        return self.ticks.get(next(iter(self.tiles))) if self.tiles else None
+
+    def drop_oldest(self):
+        key, tile = self.tiles.popitem(last=False)
+        self.ticks.pop(key, None)
+        self.nbytes -= tile.nbytes
+
+    def forget(self, filename):
+        for key in [k for k in self.tiles if k[0] == filename]:
+            self.ticks.pop(key, None)
+            self.nbytes -= self.tiles.pop(key).nbytes
+
+        for key in [k for k in self.tile_shapes if k[0] == filename]:
+            del self.tile_shapes[key]
+
+    def drop_partial_tiles(self, node):
+        """
+        Drop the tiles of the dataset node which were cut short by
+        the end of the dataset when they were read, so that the data
+        appended to them since is read when the dataset has grown.
+        """
+        tile_shape = tuple(self.tile_shape(node))
+        prefix = (node.file.filename, node.name)
+
+        for key in [k for k, tile in self.tiles.items()
+                    if k[:2] == prefix and tile.shape[:len(tile_shape)] != tile_shape]:
+            self.ticks.pop(key, None)
+            self.nbytes -= self.tiles.pop(key).nbytes
+
+    def tile_shape(self, node):
+        """
+        Returns the shape of the tiles of the dataset node.
+        """
+        key = (node.file.filename, node.name)
+        shape = self.tile_shapes.get(key)
+
+        if shape is None:
+            shape = node.chunks or default_tile_shape(node.shape,
+                                                      node.dtype.itemsize)
+            self.tile_shapes[key] = shape
+
+        return shape
+
+    def tile_selection(self, node, tile_index):
+        """
+        Returns the selection which reads the tile of the dataset
+        node at tile_index from the file.
+        """
+        tile_shape = self.tile_shape(node)
+        return tuple(slice(i * c, min((i + 1) * c, n))
+                     for i, c, n in zip(tile_index, tile_shape, node.shape))
+
+    def tile_index(self, node, index):
+        """
+        Returns the index of the tile holding the element of the
+        dataset node at index, which must be a tuple of ints with
+        one per axis.
+        """
+        tile_shape = self.tile_shape(node)
+        return tuple((i + n if i < 0 else i) // c
+                     for i, c, n in zip(index, tile_shape, node.shape))
+
+    def lookup(self, node, tile_index, field=None):
+        """
+        Returns the tile of the dataset node at tile_index, or of
+        one field of it, if it is in the cache, otherwise None.
+        Nothing is read.
+        """
+        key = (node.file.filename, node.name, tile_index, field)
+        tile = self.tiles.get(key)
+
+        if tile is not None:
+            self.hits += 1
+            self.tiles.move_to_end(key)
+            self.touch(key)
+
+        return tile
+
+    def put(self, node, tile_index, tile, field=None):
+        """
+        Add a tile of the dataset node, or of one field of it, read
+        elsewhere, e.g. on a worker thread, to the cache.
+        """
+        key = (node.file.filename, node.name, tile_index, field)
+
+        if key in self.tiles:
+            self.nbytes -= self.tiles.pop(key).nbytes
+
+        self.misses += 1
+        self.tiles[key] = tile
+        self.nbytes += tile.nbytes
+        self.touch(key)
+        self.evict()
+
+    def get_tile(self, node, tile_index, field=None):
+        """
+        Returns the tile of the dataset node at tile_index,
+        reading it from the file if it is not in the cache.
+
+        Parameters
+        ----------
+        node : h5py.Dataset
+            The dataset.
+        tile_index : TUPLE
+            Position of the tile in the grid of tiles, e.g. (2, 0)
+            is the third tile along the first axis.
+        field : STR, optional
+            The field of a dataset with a compound dtype. Only
+            this field is read.
+
+        Returns
+        -------
+        tile : numpy.ndarray
+            The data in the tile.
+
+        """
+        tile = self.lookup(node, tile_index, field)
+
+        if tile is None:
+            sel = self.tile_selection(node, tile_index)
+            if field is None:
+                tile = read_data(node, sel)
+            else:
+                tile = np.asarray(node.fields(field)[sel])
+            self.put(node, tile_index, tile, field)
+
+        return tile
+
+    def get_value(self, node, index, read=True, field=None):
+        """
+        Returns the element of the dataset node at index,
+        which must be a tuple of ints with one per axis, or
+        the given field of it.
+
+        If read is False and the tile holding the element is
+        not in the cache, None is returned instead of reading it.
+        """
+        tile_shape = self.tile_shape(node)
+        index = [i + n if i < 0 else i for i, n in zip(index, node.shape)]
+        tile_index = tuple(i // c for i, c in zip(index, tile_shape))
+
+        if read:
+            tile = self.get_tile(node, tile_index, field)
+        else:
+            tile = self.lookup(node, tile_index, field)
+            if tile is None:
+                return None
+
+        return tile[tuple(i % c for i, c in zip(index, tile_shape))]
+
+    def pieces(self, node, sel):
+        """
+        Splits a selection of the dataset node along the tile
+        grid, see split_selection.
+        """
+        return split_selection(node.shape, self.tile_shape(node), sel)
+
+    def tiles_for(self, node, sel):
+        """
+        Returns the indices of the tiles of the dataset node
+        touched by the selection sel.
+        """
+        pieces, _ = self.pieces(node, sel)
+        return [tuple(p[0] for p in combo) for combo in itertools.product(*pieces)]
+
+    def missing_tiles(self, node, sel, field=None):
+        """
+        Returns the indices of the tiles of the dataset node, or of
+        one field of it, touched by the selection sel which are not
+        in the cache.
+        """
+        prefix = (node.file.filename, node.name)
+        return [t for t in self.tiles_for(node, sel) if prefix + (t, field) not in self.tiles]
+
+    def read(self, node, sel, field=None):
+        """
+        Returns node[sel], or node[sel][field], assembled from the
+        tiles of the dataset which the selection touches.
+
+        Parameters
+        ----------
+        node : h5py.Dataset
+            The dataset.
+        sel : TUPLE
+            Tuple of ints and/or slices, with one entry per axis
+            of the dataset, as returned by get_dims_from_str.
+        field : STR, optional
+            The field of a dataset with a compound dtype.
+
+        Returns
+        -------
+        numpy.ndarray
+            The selected data.
+
+        """
+        pieces, out_shape = self.pieces(node, sel)
+
+        dtype = node.dtype if field is None else node.dtype.fields[field][0]
+        out = np.empty(out_shape, dtype=dtype)
+
+        for combo in itertools.product(*pieces):
+            tile = self.get_tile(node, tuple(p[0] for p in combo), field)
+            out_key = tuple(p[2] for p in combo if p[2] is not None)
+            out[out_key] = tile[tuple(p[1] for p in combo)]
+
+        return out
+
+
+# The tile cache shared by all the models
+tile_cache = TileCache()
+
+
+def normalize_selection(shape, sel):
+    """
+    Returns a hashable form of the selection sel of a dataset of
+    the given shape, with slices replaced by the equivalent range
+    objects and negative ints made positive.
+    """
+    norm = []
+
+    for s, n in zip(sel, shape):
+        if isinstance(s, slice):
+            norm.append(range(*s.indices(n)))
+        else:
+            norm.append(s + n if s < 0 else s)
+
+    return tuple(norm)
+
+
+def relative_index(outer, inner):
+    """
+    Returns the index which selects the normalized selection inner
+    from the array read with the normalized selection outer, or None
+    if outer does not contain inner, or if either has a negative
+    step, which h5py cannot read.
+
+    Parameters
+    ----------
+    outer, inner : TUPLE
+        Selections of the same dataset as returned by
+        normalize_selection.
+
+    Returns
+    -------
+    TUPLE or None
+        e.g. (slice(2, 5, 1), 3) for outer (0, range(0, 10),
+        range(0, 10)) and inner (0, range(2, 5), 3).
+
+    """
+    if len(outer) != len(inner):
+        return None
+
+    index = []
+
+    for o, i in zip(outer, inner):
+        if isinstance(o, int):
+            if o != i:
+                return None
+
+        elif isinstance(i, int):
+            if i not in o:
+                return None
+            index.append(o.index(i))
+
+        elif len(i) == 0:
+            index.append(slice(0, 0))
+
+        elif i.step < 0 or o.step < 0:
+            return None
+
+        else:
+            if i.step % o.step or i[0] not in o or i[-1] not in o:
+                return None
+            start = o.index(i[0])
+            index.append(slice(start, o.index(i[-1]) + 1, i.step // o.step))
+
+    return tuple(index)
+
+
+class SliceStore:
+    """
+    Slices of datasets read by the models, shared between all the
+    models and tabs, so that a hyperslab is read and held in memory
+    once however many views show it.
+
+    Slices are keyed by (file, path, selection, fields). A request
+    is served from any stored slice, or read in flight, which
+    contains it, e.g. a plot of one column of an image which is
+    already shown is a view of the stored image.
+
+    Each model (owner) holds at most one slice at a time. The slices
+    are reference counted and dropped as soon as no owner holds them,
+    so the memory_budget counts them but cannot evict them.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.pending = {}
+        self.held = {}
+        self.loaders = set()
+        self.reads = 0
+        self.budget = None
+
+    def make_key(self, node, sel, fields=None):
+        return (node.file.filename, node.name,
+                normalize_selection(node.shape, sel),
+                tuple(fields) if fields else None)
+
+    @property
+    def nbytes(self):
+        return sum(entry[0].nbytes for entry in self.entries.values())
+
+    def oldest(self):
+        return None
+
+    def drop_oldest(self):
+        pass
+
+    def forget(self, filename):
+        """
+        Drop the slices of a file and the requests for them
+        """
+        for owner, key in list(self.held.items()):
+            if key[0] == filename:
+                self.release(owner)
+
+        for key in [k for k in self.pending if k[0] == filename]:
+            loader, _ = self.pending.pop(key)
+            loader.cancel(('slice', key))
+
+    def find(self, key, entries):
+        """
+        Returns (key, index, fields) of the entry of entries which
+        contains the slice given by key, or None.
+        """
+        if key in entries:
+            return key, None, None
+
+        filename, path, sel, fields = key
+
+        for other in entries:
+            if other[:2] != (filename, path):
+                continue
+
+            if fields and other[3] and not set(fields) <= set(other[3]):
+                continue
+
+            if other[3] and not fields:
+                continue
+
+            index = relative_index(other[2], sel)
+
+            if index is not None:
+                return other, index, fields if fields != other[3] else None
+
+        return None
+
+    def view(self, array, index, fields):
+        """
+        Returns the part of a stored array given by index/fields
+        """
+        if index is not None:
+            array = array[index]
+        if fields:
+            array = array[list(fields)]
+        return array
+
+    def get(self, node, sel, fields=None):
+        """
+        Returns node[sel] if it is contained in a stored slice,
+        otherwise None. Nothing is read.
+        """
+        found = self.find(self.make_key(node, sel, fields), self.entries)
+
+        if found is None:
+            return None
+
+        key, index, fields = found
+        return self.view(self.entries[key][0], index, fields)
+
+    def request(self, owner, node, sel, loader, callback, fn, *args,
+                fields=None, message=None):
+        """
+        Ask for the slice node[sel] (with only the given fields of a
+        compound dataset) on behalf of owner. callback is called with
+        the slice, which owner then holds, either now if it is stored,
+        or when the read containing it has finished. If neither, the
+        read is started on the loader as fn(worker, *args).
+
+        Any earlier request by owner which has not been answered
+        yet is withdrawn.
+        """
+        self.withdraw(owner)
+
+        key = self.make_key(node, sel, fields)
+
+        found = self.find(key, self.entries)
+        if found is not None:
+            self.hold(owner, found[0])
+            callback(self.view(self.entries[found[0]][0], *found[1:]))
+            return
+
+        found = self.find(key, self.pending)
+        if found is not None:
+            self.pending[found[0]][1].append((owner, callback) + found[1:])
+            return
+
+        if loader not in self.loaders:
+            self.loaders.add(loader)
+            loader.job_done.connect(self.handle_job_done)
+
+        self.reads += 1
+        self.pending[key] = (loader, [(owner, callback, None, None)])
+        loader.load(('slice', key), partial(self.handle_loaded, key),
+                    fn, *args, message=message)
+
+    def withdraw(self, owner):
+        """
+        Withdraw the unanswered request of owner, cancelling
+        the read if nobody else is waiting for it.
+        """
+        for key, (loader, waiters) in list(self.pending.items()):
+            waiters[:] = [w for w in waiters if w[0] is not owner]
+            if not waiters:
+                self.pending.pop(key)
+                loader.cancel(('slice', key))
+
+    def hold(self, owner, key):
+        """
+        Make owner hold the stored slice key instead of
+        the one it held before.
+        """
+        if self.held.get(owner) == key:
+            return
+
+        self.entries[key][1] += 1
+        self.release(owner)
+        self.held[owner] = key
+
+    def release(self, owner):
+        """
+        Release the slice held by owner, if any, dropping it
+        if nobody else holds it.
+        """
+        key = self.held.pop(owner, None)
+
+        if key is None:
+            return
+
+        entry = self.entries[key]
+        entry[1] -= 1
+
+        if entry[1] <= 0:
+            self.entries.pop(key)
+
+    def handle_loaded(self, key, array):
+        _, waiters = self.pending.pop(key, (None, []))
+
+        if not waiters:
+            return
+
+        self.entries[key] = [array, 0]
+
+        for owner, callback, index, fields in waiters:
+            self.hold(owner, key)
+            callback(self.view(array, index, fields))
+
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def handle_job_done(self, job_key):
+        # the read was cancelled or failed
+        if isinstance(job_key, tuple) and job_key[0] == 'slice':
+            self.pending.pop(job_key[1], None)
+
+
+class FieldCache:
+    """
+    Least recently used cache of the fields of slices of datasets
+    with a compound dtype, kept field by field as contiguous arrays,
+    so that adding a field to a plot reads only that field.
+
+    Fields are keyed by (file, path, selection, field) and a lookup
+    is served from any stored slice of the field containing it. The
+    cache is limited to max_bytes bytes, and to the memory_budget if
+    registered with it.
+    """
+    def __init__(self, max_bytes=256 * (1 << 20)):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.columns = OrderedDict()
+        self.budget = None
+        self.ticks = {}
+
+    def make_key(self, node, sel, field):
+        return (node.file.filename, node.name, normalize_selection(node.shape, sel), field)
+
+    def get(self, node, sel, field):
+        """
+        Returns node[sel][field] if it is contained in a stored
+        slice of the field, otherwise None. Nothing is read.
+        """
+        filename, path, norm, _ = key = self.make_key(node, sel, field)
+
+        if key in self.columns:
+            found, index = key, None
+        else:
+            for found in self.columns:
+                if found[0] == filename and found[1] == path and found[3] == field:
+                    index = relative_index(found[2], norm)
+                    if index is not None:
+                        break
+            else:
+                return None
+
+        self.columns.move_to_end(found)
+        self.touch(found)
+        column = self.columns[found]
+
+        return column if index is None else column[index]
+
+    def put(self, node, sel, field, column):
+        """
+        Store node[sel][field], read elsewhere
+        """
+        key = self.make_key(node, sel, field)
+
+        if key in self.columns:
+            self.nbytes -= self.columns.pop(key).nbytes
+
+        self.columns[key] = column
+        self.nbytes += column.nbytes
+        self.touch(key)
+        self.evict()
+
+    def evict(self):
+        while self.nbytes > self.max_bytes and self.columns:
+            self.drop_oldest()
+
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def touch(self, key):
+        if self.budget is not None:
+            self.ticks[key] = self.budget.touch()
+
+    def oldest(self):
+        return self.ticks.get(next(iter(self.columns))) if self.columns else None
+
+    def drop_oldest(self):
+        key, column = self.columns.popitem(last=False)
+        self.ticks.pop(key, None)
+        self.nbytes -= column.nbytes
+
+    def forget(self, filename):
+        for key in [k for k in self.columns if k[0] == filename]:
+            self.ticks.pop(key, None)
+            self.nbytes -= self.columns.pop(key).nbytes
+
+    def clear(self):
+        self.columns.clear()
+        self.ticks.clear()
+        self.nbytes = 0
+
+
+def assemble_fields(node, columns, names):
+    """
+    Returns a structured array with the given fields of the
+    compound dtype of node, from a dict of their columns.
+    """
+    dtype = np.dtype([(name, node.dtype.fields[name][0]) for name in names])
+    out = np.empty(len(columns[names[0]]), dtype=dtype)
+
+    for name in names:
+        out[name] = columns[name]
+
+    return out
+
+
+class FrameBuffer:
+    """
+    Bounded buffer of the image frames most recently shown or
+    prefetched, so that scrolling back and forth through a stack
+    of images is served from memory.
+
+    The buffer holds at most max_frames frames and max_bytes bytes,
+    within the memory_budget if registered with it. When it is full
+    the least recently used frame is dropped.
+    """
+    def __init__(self, max_frames=64, max_bytes=256 * (1 << 20)):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.frames = OrderedDict()
+        self.budget = None
+        self.ticks = {}
+
+    def make_key(self, node, dims):
+        return (node.file.filename, node.name, normalize_selection(node.shape, dims))
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def get(self, key):
+        """
+        Returns the frame with the given key, or None
+        """
+        frame = self.frames.get(key)
+
+        if frame is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.frames.move_to_end(key)
+            self.touch(key)
+
+        return frame
+
+    def put(self, key, frame):
+        """
+        Add a frame, dropping the oldest frames if necessary
+        """
+        if key in self.frames:
+            self.nbytes -= self.frames.pop(key).nbytes
+
+        self.frames[key] = frame
+        self.nbytes += frame.nbytes
+        self.touch(key)
+
+        while self.frames and (len(self.frames) > self.max_frames
+                               or self.nbytes > self.max_bytes):
+            self.drop_oldest()
+
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def touch(self, key):
+        if self.budget is not None:
+            self.ticks[key] = self.budget.touch()
+
+    def oldest(self):
+        return self.ticks.get(next(iter(self.frames))) if self.frames else None
+
+    def drop_oldest(self):
+        key, frame = self.frames.popitem(last=False)
+        self.ticks.pop(key, None)
+        self.nbytes -= frame.nbytes
+
+    def forget(self, filename):
+        for key in [k for k in self.frames if k[0] == filename]:
+            self.ticks.pop(key, None)
+            self.nbytes -= self.frames.pop(key).nbytes
+
+    def clear(self):
+        self.frames.clear()
+        self.ticks.clear()
+        self.nbytes = 0
+
+
+class ImagePyramid:
+    """
+    The levels of detail read so far of one large image.
+
+    Level n holds the image with every n-th row and column, n being
+    a power of two. The overview is the whole image at the coarsest
+    level, and the finer levels are read in square tiles of TILE
+    pixels, only where the user has zoomed in.
+    """
+    TILE = 512
+
+    def __init__(self, step):
+        self.step = step
+        self.overview = None
+        self.tiles = {}
+        self.nbytes = 0
+
+    def set_overview(self, overview):
+        if self.overview is not None:
+            self.nbytes -= self.overview.nbytes
+        self.overview = overview
+        self.nbytes += overview.nbytes
+
+    def put(self, level, tile_index, tile):
+        old = self.tiles.pop((level, tile_index), None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self.tiles[(level, tile_index)] = tile
+        self.nbytes += tile.nbytes
+
+    def get(self, level, tile_index):
+        return self.tiles.get((level, tile_index))
+
+
+class PyramidCache:
+    """
+    Keeps the ImagePyramid of each large image that has been shown,
+    so that going back to an image does not read it again.
+
+    When the pyramids take more than max_bytes, or the memory_budget
+    is exceeded, those least recently used are dropped.
+    """
+    def __init__(self, max_bytes=512 * (1 << 20)):
+        self.max_bytes = max_bytes
+        self.pyramids = OrderedDict()
+        self.budget = None
+        self.ticks = {}
+
+    @property
+    def nbytes(self):
+        return sum(p.nbytes for p in self.pyramids.values())
+
+    def get(self, node, dims, step):
+        """
+        Returns the pyramid of node[dims], creating it if needed
+        """
+        key = (node.file.filename, node.name, normalize_selection(node.shape, dims), step)
+
+        pyramid = self.pyramids.get(key)
+
+        if pyramid is None:
+            pyramid = self.pyramids[key] = ImagePyramid(step)
+        else:
+            self.pyramids.move_to_end(key)
+
+        if self.budget is not None:
+            self.ticks[key] = self.budget.touch()
+
+        return pyramid
+
+    def evict(self):
+        """
+        Drop the least recently used pyramids, but never
+        the most recent one.
+        """
+        while len(self.pyramids) > 1 and self.nbytes > self.max_bytes:
+            self.drop_oldest()
+
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def oldest(self):
+        if len(self.pyramids) <= 1:
+            return None
+        return self.ticks.get(next(iter(self.pyramids)))
+
+    def drop_oldest(self):
+        key, _ = self.pyramids.popitem(last=False)
+        self.ticks.pop(key, None)
+
+    def forget(self, filename):
+        for key in [k for k in self.pyramids if k[0] == filename]:
+            self.ticks.pop(key, None)
+            del self.pyramids[key]
+
+    def clear(self):
+        self.pyramids.clear()
+        self.ticks.clear()
+
+
+# The caches shared by all the models
+slice_store = SliceStore()
+field_cache = FieldCache()
+frame_buffer = FrameBuffer()
+pyramid_cache = PyramidCache()
+
+# The budget of the memory taken by all the caches
+memory_budget = MemoryBudget()
+memory_budget.register(tile_cache)
+memory_budget.register(slice_store)
+memory_budget.register(field_cache)
+memory_budget.register(frame_buffer)
+memory_budget.register(pyramid_cache)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the reading of compressed chunked datasets with
+the chunks decompressed in parallel, as HDF5 decompresses the chunks
+of a read one at a time on a single core.
+"""
+
+import itertools
+import os
+import zlib
+
+from collections import deque
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    wait,
+)
+
+import h5py
+import numpy as np
+
+from .indexing import split_selection
+
+
+# The filters which ChunkReader can undo itself
+SUPPORTED_FILTERS = {
+    h5py.h5z.FILTER_DEFLATE,
+    h5py.h5z.FILTER_SHUFFLE,
+}
+
+# Reads touching fewer chunks than this are left to h5py, as
+# decompressing a few chunks in parallel does not make up for
+# handing them to the threads.
+MIN_CHUNKS = 4
+
+
+def unshuffle(data, itemsize):
+    """
+    Undoes the shuffle filter, which stores the first bytes of all
+    the elements of a chunk, then the second bytes and so on.
+    """
+    planes = np.frombuffer(data, dtype=np.uint8)
+    n = len(planes) // itemsize
+    out = np.empty(len(planes), dtype=np.uint8)
+    out[:n * itemsize].reshape(n, itemsize)[...] = planes[:n * itemsize].reshape(itemsize, n).T
+    out[n * itemsize:] = planes[n * itemsize:]
+    return out
+
+
+class ChunkReader:
+    """
+    Reads selections of chunked datasets compressed with the deflate
+    (gzip) filter, and optionally the shuffle filter, by reading the
+    raw chunks with read_direct_chunk and decompressing them on a
+    thread pool into the output array. zlib and numpy release the GIL
+    while they work, and only the raw reads, which are cheap, hold
+    the lock of h5py.
+
+    On a single core ChunkReader is slower than h5py, even with the
+    shuffle filter, so it is only used with more than one thread.
+    Datasets using other filters, or whose values are not plain
+    numbers, are read by h5py as usual.
+
+    Parameters
+    ----------
+    threads : INT, optional
+        The number of threads decompressing chunks, by default the
+        number of cores.
+    """
+    def __init__(self, threads=None):
+        self.threads = threads or os.cpu_count() or 1
+
+        # the threads are only started by the first chunks submitted
+        self.executor = None
+        if self.threads > 1:
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='chunks')
+
+    def pipeline(self, node):
+        """
+        Returns the ids of the filters of the chunked dataset node,
+        in the order they were applied when writing, or None if it
+        cannot be read by the ChunkReader.
+        """
+        if not node.chunks or node.dtype.kind not in 'biufc' or node.dtype.shape:
+            return None
+
+        dcpl = node.id.get_create_plist()
+        filters = [dcpl.get_filter(i)[0] for i in range(dcpl.get_nfilters())]
+
+        if h5py.h5z.FILTER_DEFLATE not in filters or not set(filters) <= SUPPORTED_FILTERS:
+            return None
+
+        return filters
+
+    def supports(self, node):
+        """
+        Returns True if node can be read by the ChunkReader, and
+        there is more than one thread to decompress its chunks.
+        """
+        return (self.executor is not None
+                and isinstance(node, h5py.Dataset)
+                and self.pipeline(node) is not None)
+
+    def chunk_count(self, node, sel):
+        """
+        Returns the number of chunks of node touched by node[sel]
+        """
+        count = 1
+
+        for s, c, n in zip(sel, node.chunks, node.shape):
+            if isinstance(s, slice):
+                r = range(*s.indices(n))
+                if not r:
+                    return 0
+                # no chunk is skipped unless the step is at least a chunk
+                count *= min(len(r), r[-1] // c - r[0] // c + 1)
+
+        return count
+
+    def read(self, node, sel, out=None):
+        """
+        Returns node[sel], read by decompressing its chunks in
+        parallel, see supports.
+
+        Parameters
+        ----------
+        node : h5py.Dataset
+            The dataset.
+        sel : TUPLE
+            Tuple of ints and/or slices, with one entry per axis
+            of the dataset, as returned by get_dims_from_str.
+        out : numpy.ndarray, optional
+            The array the data is written to, with the shape of
+            node[sel]. A new array is made if not given.
+
+        Returns
+        -------
+        numpy.ndarray
+            out
+
+        """
+        filters = self.pipeline(node)
+        file_dtype = node.id.get_type().dtype
+        chunks = node.chunks
+
+        pieces, out_shape = split_selection(node.shape, chunks, sel)
+
+        if out is None:
+            out = np.empty(out_shape, dtype=node.dtype)
+
+        combos = list(itertools.product(*pieces))
+
+        # raw chunks waiting to be decompressed are held in memory,
+        # so only a few are read ahead of the threads
+        pending = deque()
+
+        try:
+            for combo in combos:
+                offset = tuple(p[0] * c for p, c in zip(combo, chunks))
+                local = tuple(p[1] for p in combo)
+                out_key = tuple(p[2] for p in combo if p[2] is not None)
+
+                try:
+                    mask, data = node.id.read_direct_chunk(offset)
+                except RuntimeError:
+                    # the chunk has not been written
+                    out[out_key] = node.fillvalue
+                    continue
+
+                args = (data, mask, filters, file_dtype, chunks, local, out, out_key)
+
+                if len(combos) == 1 or self.executor is None:
+                    self.decode(*args)
+                    continue
+
+                pending.append(self.executor.submit(self.decode, *args))
+
+                if len(pending) >= 2 * self.threads:
+                    pending.popleft().result()
+
+            while pending:
+                pending.popleft().result()
+
+        except BaseException:
+            # no thread may still write to out once read has returned
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            raise
+
+        return out
+
+    @staticmethod
+    def decode(data, mask, filters, file_dtype, chunks, local, out, out_key):
+        """
+        Undoes the filters of a raw chunk which were not skipped
+        when it was written (see the filter mask of H5Dread_chunk)
+        and copies the selected part of the chunk to out.
+        """
+        for i in reversed(range(len(filters))):
+            if mask & (1 << i):
+                continue
+
+            if filters[i] == h5py.h5z.FILTER_DEFLATE:
+                data = zlib.decompress(data)
+            else:
+                data = unshuffle(data, file_dtype.itemsize)
+
+        chunk = np.frombuffer(data, dtype=file_dtype, count=int(np.prod(chunks)))
+        out[out_key] = chunk.reshape(chunks)[local]
+
+
+# The chunk reader shared by all the workers
+chunk_reader = ChunkReader()
+
+
+def read_data(node, sel, out=None):
+    """
+    Returns node[sel], written to out if given, with the chunks
+    decompressed in parallel if the chunk_reader supports the
+    dataset and the read touches at least MIN_CHUNKS chunks.
+    """
+    if chunk_reader.supports(node) and chunk_reader.chunk_count(node, sel) >= MIN_CHUNKS:
+        return chunk_reader.read(node, sel, out)
+
+    if out is None:
+        return np.asarray(node[sel])
+
+    out[...] = node[sel]
+    return out
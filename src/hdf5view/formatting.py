@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the formatting of the values of datasets as
+the text shown in the tables, the tooltips and copied to the
+clipboard.
+"""
+
+import numpy as np
+
+
+class ValueFormat:
+    """
+    Turns blocks of values into display strings in one pass per
+    block, with numpy doing the conversion instead of str() being
+    called on each value.
+
+    Parameters
+    ----------
+    precision : INT or None
+        Number of significant digits of floats (digits after the
+        point in scientific notation). None shows the shortest
+        text which reads back as the same number, i.e. str(value),
+        or the precision of the dtype in scientific notation.
+    scientific : BOOL
+        Show floats in scientific notation.
+    hex_ints : BOOL
+        Show integers in hexadecimal.
+    """
+    def __init__(self, precision=None, scientific=False, hex_ints=False):
+        self.precision = precision
+        self.scientific = scientific
+        self.hex_ints = hex_ints
+
+    def float_format(self, dtype):
+        """
+        Returns the %-format of the floats of the given dtype, or
+        None if they are shown as str() shows them.
+        """
+        precision = self.precision
+
+        if self.scientific:
+            if precision is None:
+                precision = np.finfo(dtype).precision
+            return f'%.{precision}e'
+
+        if precision is None:
+            return None
+
+        return f'%.{precision}g'
+
+    def format_block(self, values, cell_axes=0):
+        """
+        Returns the display strings of an array of values.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            The values.
+        cell_axes : INT, optional
+            The number of trailing axes of values held by each cell,
+            e.g. 1 for the (r, g, b) values of the pixels of an image.
+
+        Returns
+        -------
+        numpy.ndarray
+            The strings, with the shape of values less the cell axes.
+
+        """
+        shape = values.shape[:values.ndim - cell_axes]
+
+        if cell_axes or values.dtype.kind in 'OV':
+            # arrays, variable length and opaque data: value by value
+            cells = values.reshape((-1,) + values.shape[len(shape):])
+            strings = np.empty(len(cells), dtype=object)
+            strings[:] = [self.format_value(cell) for cell in cells]
+            return strings.reshape(shape)
+
+        kind = values.dtype.kind
+
+        if kind == 'S':
+            return np.char.decode(values, 'utf-8', 'replace')
+
+        if kind in 'iu' and self.hex_ints:
+            return np.char.mod('%#x', values)
+
+        if kind == 'f':
+            fmt = self.float_format(values.dtype)
+            if fmt is not None:
+                return np.char.mod(fmt, values)
+
+        if kind == 'c':
+            fmt = self.float_format(values.real.dtype)
+            if fmt is not None:
+                real = np.char.mod(fmt, values.real)
+                imag = np.char.mod(fmt.replace('%', '%+'), values.imag)
+                return np.char.add(np.char.add(np.char.add('(', real), imag), 'j)')
+
+        return values.astype(str)
+
+    def format_value(self, value):
+        """
+        Returns the display string of a single value, e.g. an
+        attribute or the value of a scalar dataset.
+        """
+        if isinstance(value, bytes):
+            return value.decode('utf-8', 'replace')
+
+        if isinstance(value, str):
+            return value
+
+        if isinstance(value, np.ndarray) and value.ndim:
+            if value.dtype.kind in 'OV':
+                return str(value)
+            # only the values printed are formatted, as large arrays are summarized
+            return np.array2string(value, formatter={'all': self.format_value})
+
+        array = np.asarray(value)
+
+        if array.dtype.kind in 'OV' or array.ndim:
+            return str(value)
+
+        return str(self.format_block(array.reshape(1))[0])
+
+
+# The format shared by all the tables
+value_format = ValueFormat()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the index mapping used to relate positions in
+a sliced view of a dataset (rows and columns of a table, points of
+a plot) back to indices of the dataset itself.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Size in bytes of the pieces that the loader and the scan processes
+# read at a time. Progress is reported and cancellation checked
+# between pieces.
+PIECE_BYTES = 8 * (1 << 20)
+
+
+class IndexMapper:
+    """
+    Maps positions in the view of a dataset given by dims back to
+    indices of the dataset, using slice arithmetic only, so that
+    the cost of a lookup does not depend on the size of the dataset.
+
+    The axes of the view are the axes of the dataset indexed by a
+    slice in dims, in order, e.g. for dims (0, slice(None), slice(2,
+    None, 2)) view axis 0 is dataset axis 1 and view axis 1 is
+    dataset axis 2.
+
+    Labels (the source index as a string) are kept in a small cache
+    as they are requested repeatedly when headers are repainted.
+    """
+    MAX_LABELS = 4096
+
+    def __init__(self, shape, dims):
+        self.shape = tuple(shape)
+        self.dims = tuple(dims)
+
+        self.view_axes = [i for i, d in enumerate(self.dims) if isinstance(d, slice)]
+        self.ranges = [range(*self.dims[i].indices(self.shape[i])) for i in self.view_axes]
+        self.view_shape = tuple(len(r) for r in self.ranges)
+
+        self.labels = OrderedDict()
+
+    def source_index(self, view_axis, position):
+        """
+        Returns the index along dataset axis view_axes[view_axis]
+        of the given position along the view axis.
+        """
+        return self.ranges[view_axis][position]
+
+    def source_indices(self, view_axis):
+        """
+        Returns all the source indices along the view axis as
+        an array, e.g. for use as the x values of a plot.
+        """
+        r = self.ranges[view_axis]
+        return np.arange(r.start, r.stop, r.step)
+
+    def axis_index(self, axis, position):
+        """
+        Returns the index along dataset axis `axis` of the given
+        position of the view. If the axis is not part of the view,
+        i.e. it is indexed by an int in dims, that int is returned.
+        """
+        d = self.dims[axis]
+
+        if isinstance(d, slice):
+            return self.ranges[self.view_axes.index(axis)][position]
+
+        return d + self.shape[axis] if d < 0 else d
+
+    def label(self, view_axis, position):
+        """
+        Returns the source index of the position along the view
+        axis as a string, for use as a header label.
+        """
+        key = (view_axis, position)
+        label = self.labels.get(key)
+
+        if label is None:
+            label = str(self.source_index(view_axis, position))
+            self.labels[key] = label
+            if len(self.labels) > self.MAX_LABELS:
+                self.labels.popitem(last=False)
+
+        return label
+
+    def axis_label(self, axis, position):
+        """
+        As label, but for a dataset axis, see axis_index.
+        """
+        d = self.dims[axis]
+
+        if isinstance(d, slice):
+            return self.label(self.view_axes.index(axis), position)
+
+        return str(self.axis_index(axis, position))
+
+    def describe(self, axis):
+        """
+        Returns a short description of the indices selected along
+        dataset axis `axis`, e.g. '2, 4, ..., 98 (49 of 100)'.
+        """
+        d = self.dims[axis]
+        n = self.shape[axis]
+
+        if not isinstance(d, slice):
+            return f"{self.axis_index(axis, 0)} (1 of {n})"
+
+        r = self.ranges[self.view_axes.index(axis)]
+
+        if len(r) == 0:
+            return f"none (0 of {n})"
+        if len(r) == 1:
+            return f"{r[0]} (1 of {n})"
+        if len(r) == 2:
+            return f"{r[0]}, {r[1]} (2 of {n})"
+
+        return f"{r[0]}, {r[1]}, ..., {r[-1]} ({len(r)} of {n})"
+
+
+def split_selection(shape, block_shape, sel):
+    """
+    Splits a selection of a dataset along a grid of blocks, e.g.
+    the tiles of a TileCache or the chunks of the dataset.
+
+    Parameters
+    ----------
+    shape : TUPLE
+        The shape of the dataset.
+    block_shape : TUPLE
+        The shape of the blocks.
+    sel : TUPLE
+        Tuple of ints and/or slices, with one entry per axis
+        of the dataset, as returned by get_dims_from_str.
+
+    Returns
+    -------
+    pieces : LIST
+        For each axis, the blocks touched by the selection as a
+        list of (block index, slice or index within the block,
+        slice of the output array or None if the axis is
+        indexed by an int).
+    out_shape : LIST
+        Shape of node[sel].
+
+    """
+    pieces = []
+    out_shape = []
+
+    for s, c, n in zip(sel, block_shape, shape):
+        if isinstance(s, slice):
+            r = range(*s.indices(n))
+            if r.step < 1:
+                raise ValueError("Step must be >= 1 (got %d)" % r.step)
+
+            out_shape.append(len(r))
+            axis_pieces = []
+            pos = 0
+
+            while pos < len(r):
+                start = r[pos]
+                t = start // c
+                count = min(len(r) - pos, ((t + 1) * c - 1 - start) // r.step + 1)
+                local = start - t * c
+                axis_pieces.append((t,
+                                    slice(local, local + (count - 1) * r.step + 1, r.step),
+                                    slice(pos, pos + count)))
+                pos += count
+
+            pieces.append(axis_pieces)
+
+        else:
+            i = s + n if s < 0 else s
+            pieces.append([(i // c, i % c, None)])
+
+    return pieces, out_shape
+
+
+def partition_selection(node, sel, size):
+    """
+    Splits the selection sel of the dataset node along its first
+    sliced axis into pieces of about size bytes, which are whole
+    multiples of the chunks of the dataset, if it has any.
+
+    Parameters
+    ----------
+    node : h5py.Dataset
+        The dataset.
+    sel : TUPLE
+        Tuple of ints and/or slices, with one entry per axis.
+    size : INT
+        The size of the pieces in bytes.
+
+    Returns
+    -------
+    LIST
+        (start, stop, piece) for each piece, where piece is the
+        selection of the positions start to stop along the first
+        sliced axis, which must have a step >= 1.
+
+    """
+    mapper = IndexMapper(node.shape, sel)
+
+    axis = mapper.view_axes[0]
+    r = mapper.ranges[0]
+    if r.step < 1:
+        raise ValueError("Step must be >= 1 (got %d)" % r.step)
+
+    row_bytes = node.dtype.itemsize * int(np.prod(mapper.view_shape[1:]))
+    n = max(1, size // max(1, row_bytes))
+
+    if node.chunks:
+        per_chunk = max(1, node.chunks[axis] // r.step)
+        n = max(per_chunk, n - n % per_chunk)
+
+    pieces = []
+
+    for start in range(0, len(r), n):
+        stop = min(start + n, len(r))
+        piece = list(sel)
+        piece[axis] = slice(r[start], r[stop - 1] + 1, r.step)
+        pieces.append((start, stop, tuple(piece)))
+
+    return pieces
+
+
+def estimate_read(node, dims, fields=None):
+    """
+    Estimates the cost of reading the selection dims of a dataset
+    from its dtype, shape and chunk layout, without reading it.
+
+    Parameters
+    ----------
+    node : h5py.Dataset
+        The dataset.
+    dims : TUPLE
+        Tuple of ints and/or slices, with one entry per axis.
+    fields : LIST, optional
+        The fields read of a compound dataset, by default all.
+
+    Returns
+    -------
+    DICT
+        'bytes': the size of the selection in memory,
+        'chunks': the number of chunks touched, 0 if the dataset
+        is not chunked,
+        'read bytes': the uncompressed size of the data read, i.e.
+        of the whole chunks touched,
+        'compressed bytes': the estimated size of the data read
+        from the file.
+
+    """
+    dims = tuple(dims) + (slice(None),) * (node.ndim - len(dims))
+    mapper = IndexMapper(node.shape, dims)
+    count = int(np.prod(mapper.view_shape, dtype=np.int64))
+
+    if fields:
+        itemsize = sum(node.dtype.fields[name][0].itemsize for name in fields)
+    else:
+        itemsize = node.dtype.itemsize
+
+    if not node.chunks:
+        read = count * node.dtype.itemsize
+        return {
+            'bytes': count * itemsize,
+            'chunks': 0,
+            'read bytes': read,
+            'compressed bytes': read,
+        }
+
+    chunks = 1
+    total = 1
+
+    for axis, (n, c) in enumerate(zip(node.shape, node.chunks)):
+        d = dims[axis]
+        total *= -(-n // c)
+
+        if isinstance(d, slice):
+            r = mapper.ranges[mapper.view_axes.index(axis)]
+            if not len(r):
+                chunks = 0
+            elif r.step >= c:
+                chunks *= len(r)
+            else:
+                chunks *= r[-1] // c - r[0] // c + 1
+
+    chunk_bytes = int(np.prod(node.chunks, dtype=np.int64)) * node.dtype.itemsize
+
+    return {
+        'bytes': count * itemsize,
+        'chunks': chunks,
+        'read bytes': chunks * chunk_bytes,
+        'compressed bytes': node.id.get_storage_size() * chunks // max(1, total),
+    }
+
+
+def format_size(nbytes):
+    """
+    Returns a number of bytes in readable units
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if nbytes < 1024:
+            break
+        nbytes /= 1024
+    else:
+        unit = 'TiB'
+
+    return f"{nbytes} {unit}" if unit == 'B' else f"{nbytes:.1f} {unit}"
+
+
+def format_estimate(estimate):
+    """
+    Returns an estimate from estimate_read as text
+    """
+    text = f"{format_size(estimate['bytes'])} selected"
+
+    if estimate['chunks']:
+        text += (f", {estimate['chunks']} chunks, {format_size(estimate['read bytes'])}"
+                 f" uncompressed, {format_size(estimate['compressed bytes'])} stored")
+
+    return text
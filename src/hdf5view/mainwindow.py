@@ -2,6 +2,7 @@
 
 import os
 import h5py
+import psutil
 
 from qtpy import API_NAME
 
@@ -9,6 +10,8 @@ from qtpy.QtCore import (
     Qt,
     QRect,
     QSettings,
+    QThreadPool,
+    QTimer,
 )
 
 from qtpy.QtGui import (
@@ -20,11 +23,21 @@ from qtpy.QtWidgets import (
     QAction,
     QDockWidget,
     QFileDialog,
+    QInputDialog,
+    QLabel,
     QMainWindow,
     QMessageBox,
+    QProgressBar,
     QTabWidget,
+    QToolButton,
 )
 
+from .cache import memory_budget
+from .formatting import value_format
+from .indexing import format_size
+from .models import get_node
+from .scans import scan_pool
+from .stats import statistics_cache
 from .views import HDF5Widget
 from . import __version__
 
@@ -67,6 +80,13 @@ class MainWindow(QMainWindow):
             triggered=self.handle_open_file,
         )
 
+        self.open_follow_action = QAction(
+            'Open and &Follow...',
+            self,
+            statusTip='Open a file being written in SWMR mode and follow it',
+            triggered=self.handle_open_follow_file,
+        )
+
         for i in range(MAX_RECENT_FILES):
             self.recent_file_actions.append(
                 QAction(
@@ -101,6 +121,15 @@ class MainWindow(QMainWindow):
             triggered=self.close,
         )
 
+        self.copy_action = QAction(
+            '&Copy',
+            self,
+            shortcut=QKeySequence.Copy,
+            statusTip='Copy the selected cells of the table',
+            triggered=self.handle_copy,
+        )
+        self.copy_action.setEnabled(False)
+
         self.prefs_action = QAction(
             '&Preferences...',
             self,
@@ -109,6 +138,38 @@ class MainWindow(QMainWindow):
             triggered=self.handle_open_prefs,
         )
 
+        self.follow_action = QAction(
+            '&Follow',
+            self,
+            checkable=True,
+            statusTip='Show the data appended to a file opened in SWMR mode',
+            toggled=self.handle_follow,
+        )
+        self.follow_action.setEnabled(False)
+
+        self.scientific_action = QAction(
+            '&Scientific Notation',
+            self,
+            checkable=True,
+            statusTip='Show floats in scientific notation',
+            toggled=self.handle_scientific,
+        )
+
+        self.hex_action = QAction(
+            '&Hexadecimal Integers',
+            self,
+            checkable=True,
+            statusTip='Show integers in hexadecimal',
+            toggled=self.handle_hex,
+        )
+
+        self.precision_action = QAction(
+            '&Precision...',
+            self,
+            statusTip='Set the number of digits of floats',
+            triggered=self.handle_precision,
+        )
+
         self.about_action = QAction(
             '&About...',
             self,
@@ -146,6 +207,7 @@ class MainWindow(QMainWindow):
         # File menu
         self.file_menu = menu.addMenu('&File')
         self.file_menu.addAction(self.open_action)
+        self.file_menu.addAction(self.open_follow_action)
 
         # Add recent file submenu and items
         self.recent_menu = self.file_menu.addMenu('&Recent')
@@ -160,12 +222,22 @@ class MainWindow(QMainWindow):
         self.file_menu.addSeparator()
         self.file_menu.addAction(self.quit_action)
 
-        # Edit menu - TODO
-        # self.edit_menu = menu.addMenu('&Edit')
-        # self.edit_menu.addAction(self.prefs_action)
+        # Edit menu
+        self.edit_menu = menu.addMenu('&Edit')
+        self.edit_menu.addAction(self.copy_action)
+        self.edit_menu.addSeparator()
+        self.edit_menu.addAction(self.prefs_action)
 
         # View menu
         self.view_menu = menu.addMenu('&View')
+        self.view_menu.addAction(self.follow_action)
+        self.view_menu.addSeparator()
+
+        self.format_menu = self.view_menu.addMenu('&Number Format')
+        self.format_menu.addAction(self.scientific_action)
+        self.format_menu.addAction(self.hex_action)
+        self.format_menu.addAction(self.precision_action)
+        self.view_menu.addSeparator()
 
         # Help menu
         self.help_menu = menu.addMenu('&Help')
@@ -192,6 +264,36 @@ class MainWindow(QMainWindow):
         """
         self.status = self.statusBar()
 
+        # Progress of datasets being loaded in the background
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setMaximumWidth(160)
+        self.progress_bar.setVisible(False)
+
+        self.cancel_button = QToolButton()
+        self.cancel_button.setText('Cancel')
+        self.cancel_button.setToolTip('Cancel loading')
+        self.cancel_button.clicked.connect(self.handle_cancel_loading)
+        self.cancel_button.setVisible(False)
+
+        # Memory taken by the caches of all the files, see MemoryBudget
+        self.memory_label = QLabel()
+        self.memory_timer = QTimer(self)
+        self.memory_timer.setInterval(1000)
+        self.memory_timer.timeout.connect(self.update_memory_label)
+        self.memory_timer.start()
+        self.update_memory_label()
+
+        # Statistics computed since the last save, see StatisticsCache
+        self.statistics_timer = QTimer(self)
+        self.statistics_timer.setInterval(30000)
+        self.statistics_timer.timeout.connect(statistics_cache.flush)
+        self.statistics_timer.start()
+
+        self.status.addPermanentWidget(self.progress_bar)
+        self.status.addPermanentWidget(self.cancel_button)
+        self.status.addPermanentWidget(self.memory_label)
+
     def init_dock_widgets(self):
         """
         Initialise the doc widgets
@@ -237,12 +339,16 @@ class MainWindow(QMainWindow):
 
         self.setCentralWidget(self.tabs)
 
-    def open_file(self, filename):
+    def open_file(self, filename, follow=False):
         """
-        Open a hdf5 file
+        Open a hdf5 file. If follow is True the file is opened
+        in SWMR mode and the data appended to it is shown.
         """
         try:
-            hdf = h5py.File(filename, 'r')
+            if follow:
+                hdf = h5py.File(filename, 'r', swmr=True)
+            else:
+                hdf = h5py.File(filename, 'r')
         except OSError as e:
             hdf = None
             QMessageBox.critical(
@@ -268,10 +374,18 @@ class MainWindow(QMainWindow):
             # and select it.
             hdf_widget = HDF5Widget(hdf)
             hdf_widget.tree_view.selectionModel().selectionChanged.connect(self.handle_tree_selection_changed)
+            hdf_widget.loader.progress.connect(self.handle_load_progress)
+            hdf_widget.loader.busy.connect(self.handle_load_busy)
+            hdf_widget.loader.error.connect(self.handle_load_error)
+            hdf_widget.index_ready.connect(self.handle_index_ready)
+
+            hdf_widget.set_following(follow)
 
             index = self.tabs.addTab(hdf_widget, os.path.basename(filename))
             self.tabs.setCurrentIndex(index)
 
+            hdf_widget.build_metadata_index()
+
         self.update_file_menus()
 
     def load_settings(self):
@@ -306,6 +420,16 @@ class MainWindow(QMainWindow):
         if isinstance(self.recent_files, str):
             self.recent_files = [self.recent_files]
 
+        # Memory budget of the caches, in MiB
+        budget = settings.value('memoryBudget')
+        if budget:
+            memory_budget.set_max_bytes(int(budget) << 20)
+
+        # Format of the values shown in the tables
+        value_format.precision = int(settings.value('precision', 0)) or None
+        self.scientific_action.setChecked(settings.value('scientificNotation', False, type=bool))
+        self.hex_action.setChecked(settings.value('hexIntegers', False, type=bool))
+
     def save_settings(self):
         """
         Save applications settings to file
@@ -315,6 +439,10 @@ class MainWindow(QMainWindow):
         settings.setValue('geometry', self.saveGeometry())
         settings.setValue('windowState', self.saveState())
         settings.setValue('recentFiles', self.recent_files)
+        settings.setValue('memoryBudget', memory_budget.max_bytes >> 20)
+        settings.setValue('precision', value_format.precision or 0)
+        settings.setValue('scientificNotation', value_format.scientific)
+        settings.setValue('hexIntegers', value_format.hex_ints)
 
     def get_dropped_files(self, event):
         """
@@ -329,6 +457,7 @@ class MainWindow(QMainWindow):
         count = self.tabs.count()
         self.close_action.setEnabled(count > 0)
         self.close_all_action.setEnabled(count > 1)
+        self.copy_action.setEnabled(count > 0)
 
         for index, filename in enumerate(self.recent_files):
             action = self.recent_file_actions[index]
@@ -351,7 +480,7 @@ class MainWindow(QMainWindow):
         if hdf5widget:
             title = '{} - {}'.format(title, hdf5widget.hdf.filename)
 
-            self.tree_dock.setWidget(hdf5widget.tree_view)
+            self.tree_dock.setWidget(hdf5widget.tree_panel)
             self.attrs_dock.setWidget(hdf5widget.attrs_view)
             self.dataset_dock.setWidget(hdf5widget.dataset_view)
             self.dims_dock.setWidget(hdf5widget.dims_view)
@@ -367,9 +496,18 @@ class MainWindow(QMainWindow):
         # Enable/disable the plots toolbar
         self.handle_tree_selection_changed()
 
-    def handle_open_file(self):
+        # Show whether the file is being followed
+        self.follow_action.blockSignals(True)
+        self.follow_action.setEnabled(bool(hdf5widget) and hdf5widget.hdf.swmr_mode)
+        self.follow_action.setChecked(bool(hdf5widget) and hdf5widget.is_following())
+        self.follow_action.blockSignals(False)
+
+        # Show the loading progress of the new tab
+        self.handle_load_busy()
+
+    def get_open_filename(self):
         """
-        Open a file
+        Ask for the name of a file to open
         """
         options = QFileDialog.Options()
         filename, _ = QFileDialog.getOpenFileName(
@@ -380,9 +518,86 @@ class MainWindow(QMainWindow):
             options=options
         )
 
+        return filename
+
+    def handle_open_file(self):
+        """
+        Open a file
+        """
+        filename = self.get_open_filename()
+
         if filename:
             self.open_file(filename)
 
+    def handle_open_follow_file(self):
+        """
+        Open a file being written in SWMR mode and follow it
+        """
+        filename = self.get_open_filename()
+
+        if filename:
+            self.open_file(filename, follow=True)
+
+    def handle_follow(self, checked):
+        """
+        Start/stop following the current file
+        """
+        hdf5widget = self.tabs.currentWidget()
+
+        if hdf5widget:
+            hdf5widget.set_following(checked)
+
+    def handle_copy(self):
+        """
+        Copy the selected cells of the table of the current file
+        """
+        hdf5widget = self.tabs.currentWidget()
+
+        if hdf5widget and not hdf5widget.copy_selection():
+            QMessageBox.warning(
+                self,
+                'Copy',
+                'Too many cells are selected to copy them to the clipboard.',
+            )
+
+    def handle_scientific(self, checked):
+        """
+        Show floats in scientific notation or not
+        """
+        value_format.scientific = checked
+        self.reformat()
+
+    def handle_hex(self, checked):
+        """
+        Show integers in hexadecimal or decimal
+        """
+        value_format.hex_ints = checked
+        self.reformat()
+
+    def handle_precision(self):
+        """
+        Ask for the number of digits of floats
+        """
+        precision, ok = QInputDialog.getInt(
+            self,
+            'Precision',
+            'Significant digits of floats (0 for all the digits needed):',
+            value_format.precision or 0,
+            0,
+            30,
+        )
+
+        if ok:
+            value_format.precision = precision or None
+            self.reformat()
+
+    def reformat(self):
+        """
+        Show the values of all the open files in the current format
+        """
+        for index in range(self.tabs.count()):
+            self.tabs.widget(index).reformat()
+
     def handle_open_recent_file(self):
         """
         Open a file from the recent files list
@@ -401,6 +616,9 @@ class MainWindow(QMainWindow):
 
         # TODO: Clean up/close file
         # widget.close_file()
+        widget.set_following(False)
+        widget.loader.cancel_all()
+        memory_budget.forget(widget.hdf.filename)
         widget.deleteLater()
 
         # Update the close/close all menu items
@@ -418,12 +636,32 @@ class MainWindow(QMainWindow):
         """
         Show the prefs dialog
         """
-        QMessageBox.information(
+        total = psutil.virtual_memory().total >> 20
+
+        budget, ok = QInputDialog.getInt(
             self,
             'Preferences',
-            '<p>TODO...</p>'
+            f'Memory budget of the caches (MiB, {total} MiB installed):',
+            memory_budget.max_bytes >> 20,
+            16,
+            total,
         )
 
+        if ok:
+            memory_budget.set_max_bytes(budget << 20)
+            self.update_memory_label()
+
+    def update_memory_label(self):
+        """
+        Show the memory taken by the caches and by the process
+        """
+        rss = psutil.Process().memory_info().rss
+
+        self.memory_label.setText(f"Cache {format_size(memory_budget.nbytes)}"
+                                  f" of {format_size(memory_budget.max_bytes)}")
+        self.memory_label.setToolTip(f"Memory used by hdf5view: {format_size(rss)}\n"
+                                     f"Cache entries evicted: {memory_budget.evictions}")
+
     def handle_open_about(self):
         """
         Show the about dialog
@@ -455,10 +693,59 @@ class MainWindow(QMainWindow):
             return
 
         index = indexes[0]
-        path = hdf5widget.tree_model.itemFromIndex(index).data(Qt.UserRole)
-        obj = hdf5widget.hdf[path]
+        path = hdf5widget.tree_model.path(index)
+        obj = get_node(hdf5widget.hdf, path)
         self.plots_toolbar.setEnabled(isinstance(obj, h5py.Dataset))
 
+    def handle_load_progress(self, message, percent):
+        """
+        Show the progress of a dataset being loaded
+        """
+        self.status.showMessage(message)
+        self.progress_bar.setValue(percent)
+
+    def handle_load_busy(self, busy=None):
+        """
+        Show/hide the progress bar when loading
+        starts/finishes in the current tab.
+        """
+        hdf5widget = self.tabs.currentWidget()
+        busy = bool(hdf5widget) and hdf5widget.loader.is_busy()
+
+        self.progress_bar.setVisible(busy)
+        self.cancel_button.setVisible(busy)
+
+        if not busy:
+            self.progress_bar.reset()
+            self.status.clearMessage()
+
+    def handle_index_ready(self):
+        """
+        Show a summary of the file in the tooltip of its
+        tab when it has been indexed.
+        """
+        hdf5widget = self.sender()
+        index = self.tabs.indexOf(hdf5widget)
+
+        if index >= 0:
+            self.tabs.setTabToolTip(index, f"{hdf5widget.hdf.filename}\n{hdf5widget.metadata_index.summary()}")
+
+    def handle_load_error(self, message):
+        """
+        Show an error raised while loading
+        """
+        self.status.showMessage(message, 5000)
+
+    def handle_cancel_loading(self):
+        """
+        Cancel loading in the current tab. The jobs running in the
+        background, e.g. indexing the file, carry on.
+        """
+        hdf5widget = self.tabs.currentWidget()
+
+        if hdf5widget:
+            hdf5widget.loader.cancel_busy()
+
     def handle_add_image(self):
         """
         Display an image window
@@ -495,5 +782,8 @@ class MainWindow(QMainWindow):
         The application is closing so tidy up
         """
         self.handle_close_all_files()
+        scan_pool.shutdown()
+        QThreadPool.globalInstance().waitForDone()
+        statistics_cache.flush()
         self.save_settings()
         super().closeEvent(event)
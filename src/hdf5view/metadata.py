@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the index of the metadata of all the objects
+in an HDF5 file, which is built once in the background so that
+the structure of the file can be queried without reading it again,
+and the cache keeping the indexes of recent files between sessions.
+"""
+
+import os
+import sqlite3
+import time
+import zlib
+
+from array import array
+
+from qtpy.QtCore import (
+    QStandardPaths,
+)
+
+
+# Kinds of object
+KIND_GROUP = 0
+KIND_DATASET = 1
+KIND_DATATYPE = 2
+KIND_LINK = 3
+
+KINDS = ('group', 'dataset', 'datatype', 'link')
+
+# Types of link
+LINK_HARD = 0
+LINK_SOFT = 1
+LINK_EXTERNAL = 2
+
+LINKS = ('hard', 'soft', 'external')
+
+
+class MetadataIndex:
+    """
+    Table of the objects in an HDF5 file, with one row per link.
+
+    The columns are kept in typed arrays rather than as python
+    objects per row, so that files with millions of objects can be
+    indexed. The shapes and dtypes are stored as codes into a table
+    of unique strings, since most datasets of a file share a few.
+
+    Rows are added group by group, breadth first, so the children of
+    a group are consecutive rows, starting at first_child. Soft and
+    external links are not followed. A group reached by a second hard
+    link is listed, but its children are only listed under the first.
+    """
+    # The columns kept in typed arrays
+    ARRAYS = ('parents', 'kinds', 'links', 'shapes', 'dtypes',
+              'attrs', 'storage', 'first_child', 'child_count')
+
+    def __init__(self):
+        self.paths = []
+        self.parents = array('i')
+        self.kinds = array('b')
+        self.links = array('b')
+        self.shapes = array('i')
+        self.dtypes = array('i')
+        self.attrs = array('i')
+        self.storage = array('q')
+        self.first_child = array('i')
+        self.child_count = array('i')
+
+        self.strings = ['']
+        self.string_codes = {'': 0}
+
+        # path -> row, built when first needed
+        self.rows = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def intern(self, string):
+        """
+        Returns the code of string in the table of unique strings
+        """
+        code = self.string_codes.get(string)
+
+        if code is None:
+            code = self.string_codes[string] = len(self.strings)
+            self.strings.append(string)
+
+        return code
+
+    def add(self, path, parent, kind, link, shape='', dtype='', attrs=0, storage=0):
+        """
+        Add a row and return its number
+        """
+        self.paths.append(path)
+        self.parents.append(parent)
+        self.kinds.append(kind)
+        self.links.append(link)
+        self.shapes.append(self.intern(shape))
+        self.dtypes.append(self.intern(dtype))
+        self.attrs.append(attrs)
+        self.storage.append(storage)
+        self.first_child.append(-1)
+        self.child_count.append(0)
+        self.rows = None
+
+        return len(self.paths) - 1
+
+    def find(self, path):
+        """
+        Returns the row of the given path, or None
+        """
+        if self.rows is None:
+            self.rows = {p: i for i, p in enumerate(self.paths)}
+
+        return self.rows.get(path)
+
+    def children(self, row):
+        """
+        Returns the rows of the children of a group
+        """
+        first = self.first_child[row]
+        return range(first, first + self.child_count[row]) if first >= 0 else range(0)
+
+    def row(self, row):
+        """
+        Returns the columns of a row as a dict
+        """
+        return {
+            'path': self.paths[row],
+            'kind': KINDS[self.kinds[row]],
+            'shape': self.strings[self.shapes[row]],
+            'dtype': self.strings[self.dtypes[row]],
+            'attrs': self.attrs[row],
+            'storage': self.storage[row],
+            'link': LINKS[self.links[row]],
+        }
+
+    def matches(self, other):
+        """
+        Returns True if other indexes the same objects with the
+        same metadata.
+        """
+        return all(getattr(self, column) == getattr(other, column)
+                   for column in ('paths', 'strings') + self.ARRAYS)
+
+    def summary(self):
+        """
+        Returns a short description of the file
+        """
+        counts = [self.kinds.count(kind) for kind in range(len(KINDS))]
+        parts = [f"{n} {name}s" for n, name in zip(counts, KINDS) if n]
+        size = sum(self.storage)
+
+        return f"{', '.join(parts)}, {size / (1 << 20):.1f} MiB stored"
+
+
+class MetadataCache:
+    """
+    Keeps the MetadataIndex of recently opened files in an SQLite
+    database in the application data directory, so that reopening a
+    large file does not need to walk it again before its tree can
+    be filled and searched.
+
+    The indexes are keyed by the absolute path of the file, its size
+    and modification time, so a file which has changed is indexed
+    again. The columns are stored as the bytes of their arrays and
+    the paths as compressed text. Once the stored indexes take more
+    than max_bytes, the least recently used are dropped.
+    """
+    FILENAME = 'metadata.sqlite'
+    def __init__(self, path=None, max_bytes=256 * (1 << 20)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = None
+
+    def make_key(self, filename):
+        """
+        Returns the key of the index of a file, or None if the
+        file cannot be found.
+        """
+        filename = os.path.abspath(filename)
+
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+
+        return f"{filename}|{st.st_size}|{st.st_mtime_ns}"
+
+    def connect(self):
+        if self.connection is not None:
+            return self.connection
+
+        if self.path is None:
+            location = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+            self.path = os.path.join(location, self.FILENAME)
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS indexes ("
+                "key TEXT PRIMARY KEY, filename TEXT, used REAL, "
+                "nbytes INTEGER, paths BLOB, strings BLOB, "
+                + ', '.join(f"{column} BLOB" for column in MetadataIndex.ARRAYS) + ")")
+        except (OSError, sqlite3.Error):
+            self.connection = None
+
+        return self.connection
+
+    def get(self, key):
+        """
+        Returns the MetadataIndex stored under key, or None
+        """
+        if key is None or self.connect() is None:
+            return None
+
+        columns = ('paths', 'strings') + MetadataIndex.ARRAYS
+
+        try:
+            with self.connection:
+                row = self.connection.execute(
+                    f"SELECT {', '.join(columns)} FROM indexes WHERE key = ?",
+                    (key,)).fetchone()
+                if row is None:
+                    return None
+
+                self.connection.execute("UPDATE indexes SET used = ? WHERE key = ?",
+                                        (time.time(), key))
+        except sqlite3.Error:
+            return None
+
+        index = MetadataIndex()
+        paths, strings = (zlib.decompress(blob).decode('utf-8', 'surrogateescape')
+                          for blob in row[:2])
+        index.paths = paths.split('\0')
+        index.strings = strings.split('\0')
+        index.string_codes = {s: i for i, s in enumerate(index.strings)}
+
+        for column, blob in zip(MetadataIndex.ARRAYS, row[2:]):
+            getattr(index, column).frombytes(blob)
+
+        return index
+
+    def put(self, key, index):
+        """
+        Store a MetadataIndex under key, replacing the indexes of
+        older versions of the same file.
+        """
+        if key is None or self.connect() is None:
+            return
+
+        blobs = [zlib.compress('\0'.join(strings).encode('utf-8', 'surrogateescape'), 1)
+                 for strings in (index.paths, index.strings)]
+        blobs += [getattr(index, column).tobytes() for column in MetadataIndex.ARRAYS]
+        nbytes = sum(len(blob) for blob in blobs)
+
+        if nbytes > self.max_bytes:
+            return
+
+        filename = key.rsplit('|', 2)[0]
+
+        try:
+            with self.connection:
+                self.connection.execute("DELETE FROM indexes WHERE filename = ?", (filename,))
+                self.connection.execute(
+                    f"INSERT INTO indexes VALUES ({', '.join('?' * (4 + len(blobs)))})",
+                    [key, filename, time.time(), nbytes] + blobs)
+                self.evict()
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """
+        Drop the least recently used indexes beyond max_bytes
+        """
+        total = 0
+        rows = self.connection.execute(
+            "SELECT key, nbytes FROM indexes ORDER BY used DESC").fetchall()
+
+        for key, nbytes in rows:
+            total += nbytes
+            if total > self.max_bytes:
+                self.connection.execute("DELETE FROM indexes WHERE key = ?", (key,))
+
+
+# The cache of indexes shared by all the open files
+metadata_cache = MetadataCache()
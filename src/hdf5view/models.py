@@ -4,113 +4,683 @@ This module contains the various models used in the Qt model-view
 methodology.
 """
 
+import sys
+import weakref
+
+from array import array
+from collections import OrderedDict
+from functools import partial
+
 import h5py
+import numpy as np
+import psutil
 import qtpy
 
 from qtpy.QtCore import (
+    QAbstractListModel,
     QAbstractTableModel,
     QAbstractItemModel,
     QModelIndex,
     Qt,
+    QTimer,
+    Signal,
 )
 
 from qtpy.QtGui import (
     QBrush,
     QIcon,
     QColor,
+)
 
-    QStandardItem,
-    QStandardItemModel,
+from .cache import (
+    ImagePyramid,
+    assemble_fields,
+    field_cache,
+    frame_buffer,
+    pyramid_cache,
+    slice_store,
+    tile_cache,
+)
+from .formatting import (
+    value_format,
+)
+from .indexing import (
+    IndexMapper,
+    estimate_read,
+    format_estimate,
+    format_size,
+)
+from .metadata import (
+    KIND_DATASET,
+    KIND_GROUP,
+    KIND_LINK,
+)
+from .stats import (
+    estimate_levels,
+    levels_cache,
+    sample_array,
+    statistics_cache,
+)
+from .workers import (
+    SAMPLE_SIZE,
+    DataLoader,
+    read_envelope,
+    read_fields,
+    read_sample,
+    read_selection,
+    read_statistics,
+    read_tile,
+    read_tree_nodes,
 )
 
 
+# Fraction of the available memory a single read may take before
+# the models fall back to reading a decimated or windowed selection
+MEMORY_FRACTION = 0.3
+
+
+def read_budget():
+    """
+    Returns the number of bytes a single read may take
+    """
+    return int(MEMORY_FRACTION * psutil.virtual_memory().available)
+
+
+# Bytes taken by an empty python string, the display strings of the
+# tables are counted as this plus a byte per character
+STRING_SIZE = sys.getsizeof('')
+
+
+# The objects of files opened in SWMR mode, shared by all the models
+swmr_nodes = weakref.WeakValueDictionary()
 
-class TreeModel(QStandardItemModel):
+
+def get_node(hdf, path):
+    """
+    Returns hdf[path]. The objects of a file opened in SWMR mode
+    are opened once and shared, as HDF5 does not refresh a dataset
+    which is open more than once correctly.
+    """
+    try:
+        path.encode('utf-8')
+    except UnicodeEncodeError:
+        # names which are not utf-8, see TreeModel.fetchMore
+        path = path.encode('utf-8', 'surrogateescape')
+
+    if not hdf.swmr_mode:
+        return hdf[path]
+
+    key = (id(hdf), path)
+    node = swmr_nodes.get(key)
+
+    if node is None:
+        node = swmr_nodes[key] = hdf[path]
+
+        # the metadata read when the file was opened may be stale
+        if isinstance(node, h5py.Dataset):
+            node.refresh()
+
+    return node
+
+
+class TreeModel(QAbstractItemModel):
     """
     Tree model showing the structure of the HDF5 file.
+
+    The objects are kept in a compact store with one entry per node
+    in typed arrays, rather than as three QStandardItems per row. The
+    internal id of an index is the number of its node. The children
+    of a group are only read from the file when the view asks for
+    them, FETCH_SIZE at a time, through canFetchMore and fetchMore,
+    so expanding a group with many members, or opening a file with
+    many groups, does not read the whole structure.
+
+    Fetching the children only lists their names, so the rows appear
+    at once. The other columns, and the kind of the objects, are read
+    afterwards on the loader, ENRICH_SIZE rows at a time, for the
+    rows the view has asked data for since it last painted. Rows
+    scrolled out of view before their turn are dropped from the queue.
+
+    Once a MetadataIndex of the file is set, e.g. from the
+    metadata_cache, the children of the groups it lists are taken
+    from it, with their columns, rather than from the file.
     """
+    HEADERS = ('Objects', 'Attrs', 'Dataset', 'Dtype', 'Size')
+    FETCH_SIZE = 1000
+    ENRICH_SIZE = 64
 
-    def __init__(self, hdf):
+    # Kind of the objects whose columns have not been read yet
+    UNKNOWN = -1
+
+    # The icons and brush shared by all the rows, created when first used
+    ICONS = {}
+    FOREGROUND = None
+
+    def __init__(self, hdf, loader=None):
         super().__init__()
 
         self.hdf = hdf
-        self.setColumnCount(3)
-        self.setHorizontalHeaderLabels(['Objects', 'Attrs', 'Dataset'])
+        self.loader = loader or DataLoader(synchronous=True)
+        self.metadata_index = None
+
+        self.flush_timer = QTimer()
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(0)
+        self.flush_timer.timeout.connect(self.flush_requests)
 
-        # Add the root node and immediate children
-        root = self.add_node(self, '/', self.hdf)
-        for name, node in self.hdf.items():
-            self.add_node(root, name, node)
+        self.clear()
 
-    def add_node(self, parent_item, name, node):
-        if name != '/':
-            path = f'{parent_item.data(Qt.UserRole)}/{name}'
+    def clear(self):
+        """
+        Empty the store, leaving only the root node
+        """
+        self.names = []
+        self.parents = array('i')
+        self.rows = array('i')
+        self.kinds = array('b')
+        self.attrs = array('i')
+        self.shapes = array('i')
+        self.dtypes = array('i')
+        self.storage = array('q')
+
+        # row of each node in the metadata index, -1 if none
+        self.index_rows = array('i')
+
+        # number of members of each group, 0 for other objects
+        self.member_counts = array('i')
+
+        # node -> nodes of the children fetched so far
+        self.children = {}
+        self.expanded = set()
+
+        self.strings = ['']
+        self.string_codes = {'': 0}
+
+        # nodes asked for by the view since the last flush, and
+        # those waiting to be read
+        self.requested = {}
+        self.queue = []
+
+        # Add the root node, its children are fetched when needed
+        root = self.add_node(-1, '/', index_row=0)
+        self.set_node(root, (KIND_GROUP, len(self.hdf.attrs), '', '', 0, len(self.hdf)))
+
+    def set_metadata_index(self, metadata_index, reset=False):
+        """
+        Take the children of the groups from metadata_index from now
+        on. If reset is True, the nodes taken from the previous index
+        are dropped, e.g. when it turned out to be out of date.
+        """
+        if reset:
+            # the columns being read are those of the nodes dropped
+            self.loader.cancel(('tree',))
+            self.flush_timer.stop()
+
+            self.beginResetModel()
+            self.metadata_index = metadata_index
+            self.expanded.clear()
+            self.clear()
+            self.endResetModel()
         else:
-            path = '/'
+            self.metadata_index = metadata_index
 
-        tree_item = QStandardItem(name)
-        tree_item.setData(path, Qt.UserRole)
-        tree_item.setToolTip(path)
+    @classmethod
+    def icon(cls, name):
+        icon = cls.ICONS.get(name)
 
-        num_attrs = len(node.attrs)
-        if num_attrs > 0:
-            attrs_item = QStandardItem(str(num_attrs))
-        else:
-            attrs_item = QStandardItem('')
+        if icon is None:
+            icon = cls.ICONS[name] = QIcon(f'icons:{name}.svg')
 
-        attrs_item.setForeground(QBrush((Qt.darkGray)))
+        return icon
 
-        if isinstance(node, h5py.Dataset):
-            tree_item.setIcon(QIcon('icons:dataset.svg'))
-            dataset_item = QStandardItem(str(node.shape))
+    def intern(self, string):
+        """
+        Returns the code of string in the table of unique strings
+        """
+        code = self.string_codes.get(string)
+
+        if code is None:
+            code = self.string_codes[string] = len(self.strings)
+            self.strings.append(string)
 
-        elif isinstance(node, h5py.Group):
-            tree_item.setIcon(QIcon('icons:folder.svg'))
-            dataset_item = QStandardItem('')
+        return code
 
-        dataset_item.setForeground(QBrush((Qt.darkGray)))
+    def add_node(self, parent, name, index_row=-1):
+        """
+        Add a node of unknown kind to the store and return its number
+        """
+        node = len(self.names)
+        siblings = self.children.setdefault(parent, array('i'))
+
+        self.names.append(name)
+        self.parents.append(parent)
+        self.rows.append(len(siblings))
+        self.kinds.append(self.UNKNOWN)
+        self.attrs.append(0)
+        self.shapes.append(0)
+        self.dtypes.append(0)
+        self.storage.append(0)
+        self.index_rows.append(index_row)
+        self.member_counts.append(0)
+        siblings.append(node)
+
+        return node
+
+    def set_node(self, node, columns):
+        """
+        Set the columns of a node, as returned by read_tree_nodes
+        """
+        kind, num_attrs, shape, dtype, storage, member_count = columns
 
-        parent_item.appendRow([tree_item, attrs_item, dataset_item])
-        return tree_item
+        self.kinds[node] = kind
+        self.attrs[node] = num_attrs
+        self.shapes[node] = self.intern(shape)
+        self.dtypes[node] = self.intern(dtype)
+        self.storage[node] = storage
+        self.member_counts[node] = member_count
 
-    def handle_expanded(self, index):
+    def node(self, index):
+        """
+        Returns the node of an index, or -1 for the invisible root
+        """
+        return index.internalId() if index.isValid() else -1
+
+    def node_path(self, node):
+        """
+        Returns the path in the file of the object of a node
+        """
+        names = []
+
+        while node > 0:
+            names.append(self.names[node])
+            node = self.parents[node]
+
+        return '/' + '/'.join(reversed(names))
+
+    def path(self, index):
+        """
+        Returns the path in the file of the object of an index
+        """
+        return self.node_path(self.node(index))
+
+    def index_from_path(self, path):
+        """
+        Returns the index of the object with the given path. Only
+        the children of the groups leading to it are fetched, and
+        only up to the batch containing it.
+        """
+        index = self.index(0, 0)
+
+        for name in [part for part in path.split('/') if part]:
+            node = self.node(index)
+            start = 0
+
+            if self.kinds[node] == self.UNKNOWN:
+                self.read_nodes_now([node])
+
+            while True:
+                children = self.children.get(node, ())
+                for row in range(start, len(children)):
+                    if self.names[children[row]] == name:
+                        break
+                else:
+                    row = None
+
+                if row is not None:
+                    index = self.index(row, 0, index)
+                    break
+
+                if not self.canFetchMore(index):
+                    return QModelIndex()
+
+                start = len(children)
+                self.fetchMore(index)
+
+        return index
+
+    def index(self, row, column, parent=QModelIndex()):
+        children = self.children.get(self.node(parent), ())
+
+        if 0 <= row < len(children) and 0 <= column < len(self.HEADERS):
+            return self.createIndex(row, column, children[row])
+
+        return QModelIndex()
+
+    def parent(self, index=QModelIndex()):
+        if not index.isValid():
+            return QModelIndex()
+
+        parent = self.parents[index.internalId()]
+
+        if parent < 0:
+            return QModelIndex()
+
+        return self.createIndex(self.rows[parent], 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+
+        return len(self.children.get(self.node(parent), ()))
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return True
+
+        return parent.column() == 0 and self.member_counts[parent.internalId()] > 0
+
+    def canFetchMore(self, parent):
+        if not parent.isValid() or parent.column() > 0:
+            return False
+
+        node = parent.internalId()
+        return len(self.children.get(node, ())) < self.member_counts[node]
+
+    def fetchMore(self, parent):
+        """
+        List the names of the next FETCH_SIZE children of a group
+        """
+        if not self.canFetchMore(parent):
+            return
+
+        node = parent.internalId()
+        start = len(self.children.get(node, ()))
+
+        row = self.index_rows[node]
+        if self.metadata_index is not None and row >= 0 and self.metadata_index.first_child[row] >= 0:
+            self.fetch_from_index(parent, start)
+            return
+
+        gid = h5py.h5g.open(self.hdf.id, self.path(parent).encode('utf-8', 'surrogateescape'))
+
+        names = []
+
+        def collect(name):
+            names.append(name)
+            return True if len(names) >= self.FETCH_SIZE else None
+
+        gid.links.iterate(collect, idx=start)
+
+        if not names:
+            # the group changed since it was counted
+            self.member_counts[node] = start
+            return
+
+        self.beginInsertRows(parent, start, start + len(names) - 1)
+
+        for name in names:
+            # as in build_index, so that the paths match those of the index
+            self.add_node(node, name.decode('utf-8', 'surrogateescape'))
+
+        self.endInsertRows()
+
+    def fetch_from_index(self, parent, start):
         """
-        Dynamically populate the treeview
+        Add the next FETCH_SIZE children of a group from the
+        metadata index, with their columns. The links, and the
+        groups whose children are not listed by the index, are
+        read from the file as usual.
         """
-        item = self.itemFromIndex(index)
+        node = parent.internalId()
+        metadata_index = self.metadata_index
+        rows = metadata_index.children(self.index_rows[node])[start:start + self.FETCH_SIZE]
 
-        if not item.hasChildren():
+        if not rows:
+            self.member_counts[node] = start
             return
 
-        item.setIcon(QIcon('icons:folder-open.svg'))
+        self.beginInsertRows(parent, start, start + len(rows) - 1)
 
-        for row in range(item.rowCount()):
-            child_item = item.child(row, 0)
+        for row in rows:
+            name = metadata_index.paths[row].rsplit('/', 1)[1]
+            kind = metadata_index.kinds[row]
 
-            if not child_item or child_item.hasChildren():
+            if kind == KIND_LINK or (kind == KIND_GROUP and metadata_index.first_child[row] < 0):
+                self.add_node(node, name)
                 continue
 
-            path = child_item.data(Qt.UserRole)
-            child_node = self.hdf[path]
+            child = self.add_node(node, name, index_row=row)
+            self.set_node(child, (kind,
+                                  metadata_index.attrs[row],
+                                  metadata_index.strings[metadata_index.shapes[row]],
+                                  metadata_index.strings[metadata_index.dtypes[row]],
+                                  metadata_index.storage[row],
+                                  metadata_index.child_count[row]))
+
+        self.endInsertRows()
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+
+        # links which cannot be resolved cannot be shown
+        if self.kinds[index.internalId()] == KIND_LINK:
+            return Qt.ItemIsEnabled
+
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        node = index.internalId()
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return self.names[node]
+
+            if self.kinds[node] == self.UNKNOWN:
+                self.request_node(node)
+                return ''
+
+            if column == 1:
+                return str(self.attrs[node]) if self.attrs[node] > 0 else ''
+
+            if column == 2:
+                return self.strings[self.shapes[node]]
+
+            if column == 3:
+                return self.strings[self.dtypes[node]]
+
+            return format_size(self.storage[node]) if self.kinds[node] == KIND_DATASET else ''
+
+        if role == Qt.DecorationRole and column == 0:
+            kind = self.kinds[node]
+
+            if kind == KIND_GROUP:
+                return self.icon('folder-open' if node in self.expanded else 'folder')
+
+            if kind == KIND_DATASET:
+                return self.icon('dataset')
+
+            if kind == self.UNKNOWN:
+                self.request_node(node)
+
+        elif role == Qt.ToolTipRole and column == 0:
+            return self.path(index)
+
+        elif role == Qt.UserRole:
+            return self.path(index)
+
+        elif role == Qt.ForegroundRole and column > 0:
+            if TreeModel.FOREGROUND is None:
+                TreeModel.FOREGROUND = QBrush(Qt.darkGray)
+            return TreeModel.FOREGROUND
+
+        return None
+
+    def request_node(self, node):
+        """
+        Queue the columns of a node shown by the view to be read.
+        The requests made while the view paints are gathered and
+        replace the queue when control returns to the event loop.
+        """
+        self.requested[node] = None
+
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def read_nodes(self):
+        """
+        Read the columns of the next ENRICH_SIZE nodes of the queue
+        """
+        nodes = [node for node in self.queue[:self.ENRICH_SIZE]
+                 if self.kinds[node] == self.UNKNOWN]
+        del self.queue[:self.ENRICH_SIZE]
+
+        if not nodes:
+            if self.queue:
+                self.read_nodes()
+            return
+
+        self.loader.load(('tree',),
+                         partial(self.set_nodes, nodes),
+                         read_tree_nodes,
+                         self.hdf,
+                         [self.node_path(node) for node in nodes])
+
+    def read_nodes_now(self, nodes):
+        """
+        Read the columns of some nodes on the calling thread
+        """
+        paths = [self.node_path(node) for node in nodes]
+        DataLoader(synchronous=True).load(('tree',),
+                                          partial(self.set_nodes, nodes, read_next=False),
+                                          read_tree_nodes, self.hdf, paths)
+
+    def set_nodes(self, nodes, columns, read_next=True):
+        """
+        Called with the columns read by read_tree_nodes
+        """
+        expandable = False
+
+        for node, node_columns in zip(nodes, columns):
+            self.set_node(node, node_columns)
+            expandable = expandable or self.member_counts[node] > 0
 
-            if isinstance(child_node, h5py.Group):
-                for name, node in child_node.items():
-                    self.add_node(child_item, name, node)
+        # the view keeps whether the rows have children,
+        # so it must lay them out again to show the new groups
+        if expandable:
+            self.layoutAboutToBeChanged.emit()
+            self.layoutChanged.emit()
+
+        else:
+            rows = {}
+            for node in nodes:
+                first, last = rows.get(self.parents[node], (self.rows[node], self.rows[node]))
+                rows[self.parents[node]] = (min(first, self.rows[node]), max(last, self.rows[node]))
+
+            for parent, (first, last) in rows.items():
+                parent_index = self.createIndex(self.rows[parent], 0, parent) if parent >= 0 else QModelIndex()
+                self.dataChanged.emit(self.index(first, 0, parent_index),
+                                      self.index(last, len(self.HEADERS) - 1, parent_index))
+
+        if read_next:
+            self.read_nodes()
+
+    #
+    # Slots
+    #
+
+    def flush_requests(self):
+        """
+        Replace the queue by the nodes asked for by the view
+        since the last flush, dropping those out of view.
+        """
+        self.queue = [node for node in self.requested if self.kinds[node] == self.UNKNOWN]
+        self.requested.clear()
+
+        if not self.loader.is_loading(('tree',)):
+            self.read_nodes()
+
+    def handle_expanded(self, index):
+        """
+        Update the icon when expanding a group. The view
+        fetches its children through fetchMore.
+        """
+        self.expanded.add(index.internalId())
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
 
     def handle_collapsed(self, index):
         """
         Update the icon when collapsing a group
         """
-        item = self.itemFromIndex(index)
-        item.setIcon(QIcon('icons:folder.svg'))
+        self.expanded.discard(index.internalId())
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class SearchResultsModel(QAbstractListModel):
+    """
+    List of the paths found by a PathSearch. The rows found
+    are appended in batches while the search runs.
+    """
+    def __init__(self):
+        super().__init__()
+
+        self.paths = []
+        self.rows = []
+
+    def clear(self, paths=None):
+        """
+        Remove all the results. paths are the paths of
+        the MetadataIndex searched.
+        """
+        self.beginResetModel()
+        self.paths = paths if paths is not None else self.paths
+        self.rows = []
+        self.endResetModel()
+
+    def add_rows(self, rows):
+        """
+        Append a batch of rows of the MetadataIndex
+        """
+        if not rows:
+            return
+
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+
+    def path(self, row):
+        return self.paths[self.rows[row]]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.path(index.row())
 
 
 class AttributesTableModel(QAbstractTableModel):
     """
     Model containing any attributes of a dataset in
     the HDF5 file.
+
+    Only the names of the attributes are read when the node changes.
+    The value of an attribute is read when its row is first shown.
+    HDF5 can only read an attribute whole, so attributes larger than
+    PREVIEW_BYTES are shown by their shape and dtype until load_value
+    is called for them, e.g. by double-clicking the row. The text of
+    a value is cut to PREVIEW_CHARS characters.
+
+    The information and text of each row are kept once read, as the
+    view asks for them on every paint.
     """
     HEADERS = ('Name', 'Value', 'Type')
+    PREVIEW_BYTES = 1 << 16
+    PREVIEW_CHARS = 1000
 
     def __init__(self, hdf):
         super().__init__()
@@ -119,20 +689,94 @@ class AttributesTableModel(QAbstractTableModel):
         self.node = None
         self.column_count = 3
         self.row_count = 0
+        self.keys = []
+        self.values = {}
+        self.infos = {}
+        self.texts = {}
 
     def update_node(self, path):
         """
         Update the current node path
         """
         self.beginResetModel()
-        self.node = self.hdf[path]
+        self.node = get_node(self.hdf, path)
 
         self.keys = list(self.node.attrs.keys())
-        self.values = list(self.node.attrs.values())
+        # row -> value, read when first shown
+        self.values = {}
+        # row -> (shape, dtype, size) and row -> text of the value
+        self.infos = {}
+        self.texts = {}
 
         self.row_count = len(self.keys)
         self.endResetModel()
 
+    def attribute_info(self, row):
+        """
+        Returns the shape, dtype and size in bytes of an
+        attribute, without reading its value.
+        """
+        info = self.infos.get(row)
+
+        if info is None:
+            aid = h5py.h5a.open(self.node.id, self.keys[row].encode())
+            info = self.infos[row] = (aid.shape, aid.dtype, aid.get_storage_size())
+
+        return info
+
+    def value(self, row):
+        """
+        Returns the value of an attribute, reading it if it is
+        small enough, or None if it has not been loaded.
+        """
+        if row not in self.values:
+            if self.attribute_info(row)[2] > self.PREVIEW_BYTES:
+                return None
+            self.load_value(row)
+
+        return self.values[row]
+
+    def load_value(self, row):
+        """
+        Read the whole value of an attribute
+        """
+        if row in self.values:
+            return
+
+        self.values[row] = self.node.attrs[self.keys[row]]
+        self.texts.pop(row, None)
+        self.dataChanged.emit(self.index(row, 1), self.index(row, 2))
+
+    def value_text(self, row):
+        text = self.texts.get(row)
+
+        if text is not None:
+            return text
+
+        value = self.value(row)
+
+        if value is None:
+            shape, dtype, size = self.attribute_info(row)
+            text = f"{dtype} {shape}, {size} bytes (double-click to load)"
+
+        else:
+            text = value_format.format_value(value)
+
+            if len(text) > self.PREVIEW_CHARS:
+                text = text[:self.PREVIEW_CHARS] + '\u2026'
+
+        self.texts[row] = text
+        return text
+
+    def reformat(self):
+        """
+        Show the values again with the current value_format
+        """
+        self.texts = {}
+
+        if self.row_count:
+            self.dataChanged.emit(self.index(0, 1), self.index(self.row_count - 1, 1))
+
     def rowCount(self, parent=QModelIndex()):
         return self.row_count
 
@@ -156,12 +800,12 @@ class AttributesTableModel(QAbstractTableModel):
                 if column == 0:
                     return self.keys[row]
                 elif column == 1:
-                    try:
-                        return self.values[row].decode()
-                    except AttributeError:
-                        return str(self.values[row])
+                    return self.value_text(row)
                 elif column == 2:
-                    return str(type(self.values[row]))
+                    value = self.value(row)
+                    if value is None:
+                        return str(np.ndarray)
+                    return str(type(value))
 
 
 class DatasetTableModel(QAbstractTableModel):
@@ -171,16 +815,24 @@ class DatasetTableModel(QAbstractTableModel):
     'name', 'dtype', 'ndim', 'shape', 'maxshape',
     'chunks', 'compression', 'shuffle', 'fletcher32'
     and 'scaleoffset'.
+
+    For numeric datasets the statistics in STATISTICS are also
+    shown. They are computed on the loader, streaming over the
+    dataset, and kept in the statistics_cache.
     """
     HEADERS = ('Name', 'Value')
+    STATISTICS = ('min', 'max', 'mean', 'std', 'nan count', 'histogram')
+    SPARKS = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
 
-    def __init__(self, hdf):
+    def __init__(self, hdf, loader=None):
         super().__init__()
 
         self.hdf = hdf
         self.node = None
         self.column_count = 2
         self.row_count = 0
+        self.loader = loader or DataLoader(synchronous=True)
+        self.statistics = None
 
     def update_node(self, path):
         """
@@ -188,9 +840,11 @@ class DatasetTableModel(QAbstractTableModel):
         """
         self.keys = []
         self.values = []
+        self.statistics = None
+        self.loader.cancel_group('statistics')
 
         self.beginResetModel()
-        self.node = self.hdf[path]
+        self.node = get_node(self.hdf, path)
 
         if not isinstance(self.node, h5py.Dataset):
             self.endResetModel()
@@ -223,10 +877,92 @@ class DatasetTableModel(QAbstractTableModel):
                 str(self.node.scaleoffset),
             )
 
+        if self.node.dtype.kind in 'biuf':
+            self.keys += self.STATISTICS
+            self.load_statistics()
 
         self.row_count = len(self.keys)
         self.endResetModel()
 
+    def update_shape(self):
+        """
+        Show the shape of a dataset which may have grown, e.g. while
+        following a file written in SWMR mode. The statistics are
+        not computed again.
+        """
+        if not isinstance(self.node, h5py.Dataset) or not self.values:
+            return
+
+        shape = str(self.node.shape)
+
+        if self.node.dtype.names:
+            shape = f"{shape}  (ncols={len(self.node.dtype.names)})"
+
+        if shape != self.values[3]:
+            self.values = self.values[:3] + (shape,) + self.values[4:]
+            self.dataChanged.emit(self.index(3, 1), self.index(3, 1),
+                                  [Qt.DisplayRole, Qt.ToolTipRole])
+
+    def load_statistics(self):
+        """
+        Take the statistics of the node from the statistics_cache,
+        or compute them on the loader.
+        """
+        key = statistics_cache.make_key(self.node)
+        self.statistics = statistics_cache.get(key)
+
+        if self.statistics is None:
+            self.loader.load(('statistics',),
+                             partial(self.set_statistics, self.node.name, key),
+                             read_statistics,
+                             self.node,
+                             message=f"Calculating statistics of {self.node.name}")
+
+    def set_statistics(self, name, key, statistics):
+        """
+        Called with the statistics computed by the loader
+        """
+        statistics_cache.put(key, statistics)
+
+        if self.node is None or self.node.name != name:
+            return
+
+        self.statistics = statistics
+
+        first = self.index(len(self.values), 1)
+        last = self.index(self.row_count - 1, 1)
+        self.dataChanged.emit(first, last, [Qt.DisplayRole, Qt.ToolTipRole])
+
+    def statistic(self, name, role=Qt.DisplayRole):
+        """
+        Returns the text shown for one of the STATISTICS
+        """
+        if self.statistics is None:
+            return 'calculating...'
+
+        value = self.statistics[name]
+
+        if name == 'histogram':
+            counts = value['counts']
+
+            if value['low'] is None:
+                return ''
+
+            if role == Qt.ToolTipRole:
+                step = (value['high'] - value['low']) / len(counts)
+                return '\n'.join(f"{value['low'] + i * step:.6g}: {c}"
+                                  for i, c in enumerate(counts))
+
+            top = max(counts) or 1
+            return ''.join(self.SPARKS[(len(self.SPARKS) - 1) * c // top] for c in counts)
+
+        if value is None:
+            return ''
+
+        if name == 'nan count':
+            return str(value)
+
+        return f"{value:.6g}"
 
     def rowCount(self, parent=QModelIndex()):
         return self.row_count
@@ -251,6 +987,8 @@ class DatasetTableModel(QAbstractTableModel):
                     if column == 0:
                         return self.keys[row]
                     elif column == 1:
+                        if row >= len(self.values):
+                            return self.statistic(self.keys[row], role)
                         return self.values[row]
 
                 if role == Qt.ForegroundRole:
@@ -261,9 +999,34 @@ class DatasetTableModel(QAbstractTableModel):
 class DataTableModel(QAbstractTableModel):
     """
     Model containing the data in the dataset in the HDF5 file.
+
+    The slice being shown is never read in one go. Each cell the
+    view asks for in data() is looked up in the shared TileCache, so
+    the cost of showing a dataset does not depend on its size and a
+    chunk is only decompressed once while it stays in the cache. On
+    a miss, the value is taken from the SliceStore if the image or
+    plot models hold it, otherwise the tile is read by the loader and
+    the cell is left blank until it arrives.
+
+    The tiles of a compound dataset are read and cached field by
+    field, so that showing another field reads just that field. The
+    fields asked for while the view paints are gathered and read
+    together, tile by tile, when control returns to the event loop.
+    Fields read by the plot model are taken from the field_cache.
+
+    The text of the cells is made by the value_format a block of
+    BLOCK_ROWS x BLOCK_COLUMNS cells (BLOCK_ROWS rows of one field of
+    a compound dataset) at a time, once the tiles of the block have
+    been read, and kept in display_blocks, so painting a cell only
+    looks up its string. The same strings are shown as tooltips, and
+    copy_text formats the cells copied to the clipboard likewise.
     """
+    BLOCK_ROWS = 128
+    BLOCK_COLUMNS = 16
+    MAX_DISPLAY_BYTES = 16 * (1 << 20)
+    MAX_COPY_CELLS = 1 << 22
 
-    def __init__(self, hdf):
+    def __init__(self, hdf, cache=tile_cache, loader=None):
         super().__init__()
 
         self.hdf = hdf
@@ -272,13 +1035,32 @@ class DataTableModel(QAbstractTableModel):
         self.column_count = 0
         self.ndim = 0
         self.dims = ()
-        self.data_view = None
+        self.mapper = IndexMapper((), ())
+        self.tile_cache = cache
+        self.loader = loader or DataLoader(synchronous=True)
         self.compound_names = None
 
+        # fields of tiles asked for since the last flush_requests
+        self.requested = {}
+
+        # (block row, block column) -> display strings, see display_block
+        self.display_blocks = OrderedDict()
+        self.display_bytes = 0
+
+        self.flush_timer = QTimer()
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(0)
+        self.flush_timer.timeout.connect(self.flush_requests)
+
+        # number of calls to update_node and of tiles requested
+        self.update_count = 0
+        self.load_count = 0
+
     def update_node(self, path):
         """
         Update the current node path
         """
+        self.update_count += 1
         self.compound_names = None
 
         self.beginResetModel()
@@ -287,8 +1069,12 @@ class DataTableModel(QAbstractTableModel):
         self.column_count = 0
 
         self.dims = ()
+        self.mapper = IndexMapper((), ())
+        self.loader.cancel_group('tile')
+        self.requested.clear()
+        self.clear_display_blocks()
 
-        self.node = self.hdf[path]
+        self.node = get_node(self.hdf, path)
 
         if not isinstance(self.node, h5py.Dataset):
             self.endResetModel()
@@ -301,37 +1087,78 @@ class DataTableModel(QAbstractTableModel):
         self.compound_names = self.node.dtype.names
 
         if self.ndim == 0:
-            self.row_count = 1
-            self.column_count = 1
+            pass
 
         elif self.ndim == 1:
-            self.row_count = shape[0]
-            if self.compound_names:
-                self.column_count = len(self.compound_names)
-            else:
-                self.column_count = 1
             self.dims = tuple([slice(None)])
 
         elif self.ndim == 2:
-            self.row_count = shape[-2]
-            self.column_count = shape[-1]
             self.dims = tuple([slice(None), slice(None)])
 
         elif self.ndim > 2 and shape[-1] in [3, 4]:
-            self.row_count = shape[-3]
-            self.column_count = shape[-2]
             self.dims = tuple(([0] * (self.ndim - 3)) + [slice(None),
                                                          slice(None),
                                                          slice(None)])
 
         else:
-            self.row_count = shape[-2]
-            self.column_count = shape[-1]
             self.dims = tuple(([0] * (self.ndim - 2)) + [slice(None), slice(None)])
 
-        self.data_view = self.node[self.dims]
+        self.update_view_shape()
         self.endResetModel()
 
+    def update_view_shape(self):
+        """
+        Work out which axes of the dataset are shown as the rows
+        and columns of the table, and the resulting row and column
+        counts, from self.dims alone, i.e. without reading any data.
+        """
+        self.mapper = IndexMapper(self.node.shape, self.dims)
+        lengths = self.mapper.view_shape
+
+        self.row_count = lengths[0] if lengths else 1
+
+        if self.compound_names:
+            self.column_count = len(self.compound_names)
+        else:
+            self.column_count = lengths[1] if len(lengths) > 1 else 1
+
+    def update_shape(self):
+        """
+        Called when the dataset may have grown, e.g. while following
+        a file written in SWMR mode. The rows or columns appended are
+        inserted into the table, and read like the others when they
+        are shown, so the rows already read are not read again.
+        """
+        if not isinstance(self.node, h5py.Dataset) or self.mapper.shape == self.node.shape:
+            return
+
+        # the last blocks may have been cut short
+        self.clear_display_blocks()
+
+        row_count = self.row_count
+        column_count = self.column_count
+        lengths = IndexMapper(self.node.shape, self.dims).view_shape
+
+        if lengths == self.mapper.view_shape:
+            # e.g. frames appended to a stack of which one is shown
+            self.update_view_shape()
+
+        elif lengths and lengths[0] > row_count and lengths[1:2] == self.mapper.view_shape[1:2]:
+            self.beginInsertRows(QModelIndex(), row_count, lengths[0] - 1)
+            self.update_view_shape()
+            self.endInsertRows()
+
+        elif (len(lengths) > 1 and not self.compound_names
+              and lengths[0] == row_count and lengths[1] > column_count):
+            self.beginInsertColumns(QModelIndex(), column_count, lengths[1] - 1)
+            self.update_view_shape()
+            self.endInsertColumns()
+
+        else:
+            self.beginResetModel()
+            self.update_view_shape()
+            self.endResetModel()
+
     def rowCount(self, parent=QModelIndex()):
         return self.row_count
 
@@ -348,45 +1175,22 @@ class DataTableModel(QAbstractTableModel):
                         return None
 
                     if self.ndim == 2:
-                        w = list(range(self.node.shape[1]))
-                        w_e = w[self.dims[1]]
-                        if isinstance(w_e, int):
-                            w_e = [w_e]
-                        return str(w_e[section])
-
-                    s_loc = [i for i,j in enumerate(self.dims) if isinstance(j, slice)]
-                    if self.ndim > 2:
-                        if len(s_loc) >= 2:
-                            idx = 1
-                            w = list(range(self.node.shape[s_loc[idx]]))
-                            w_e = w[self.dims[s_loc[idx]]]
-                            if isinstance(w_e, int):
-                                w_e = [w_e]
-                            return str(w_e[section])
-                        return None
+                        return self.mapper.axis_label(1, section)
+
+                    if len(self.mapper.view_axes) >= 2:
+                        return self.mapper.label(1, section)
+                    return None
 
             elif orientation == Qt.Vertical:
                 if self.ndim == 0:
                     return None
 
                 if self.ndim in [1, 2]:
-                    w = list(range(self.node.shape[0]))
-                    w_e = w[self.dims[0]]
-                    if isinstance(w_e, int):
-                        w_e = [w_e]
-
-                    return str(w_e[section])
-
-                s_loc = [i for i,j in enumerate(self.dims) if isinstance(j, slice)]
-                if self.ndim > 2:
-                    if len(s_loc) >= 1:
-                        idx = 0
-                        w = list(range(self.node.shape[s_loc[idx]]))
-                        w_e = w[self.dims[s_loc[idx]]]
-                        if isinstance(w_e, int):
-                            w_e = [w_e]
-                        return str(w_e[section])
-                    return None
+                    return self.mapper.axis_label(0, section)
+
+                if len(self.mapper.view_axes) >= 1:
+                    return self.mapper.label(0, section)
+                return None
 
         super().headerData(section, orientation, role)
 
@@ -394,45 +1198,309 @@ class DataTableModel(QAbstractTableModel):
     def data(self, index, role=Qt.DisplayRole):
         if index.isValid():
             if role in (Qt.DisplayRole, Qt.ToolTipRole):
-                if self.compound_names:
-                    name = self.compound_names[index.column()]
-                    if self.data_view.ndim == 0:
-                        try:
-                            q = self.data_view[name].decode()
-                        except AttributeError:
-                            q = str(self.data_view[name])
-                    else:
-                        try:
-                            q = self.data_view[index.row()][name].decode()
-                        except AttributeError:
-                            q = str(self.data_view[index.row()][name])
+                return self.display_string(index.row(), index.column())
 
-                    return q
+    def display_string(self, row, column):
+        """
+        Returns the text of the cell (row, column), or None while
+        the tiles holding it are being read.
+        """
+        if self.block_axes():
+            strings = self.display_block(row // self.BLOCK_ROWS, column // self.block_columns())
 
-                if self.ndim == 0:
-                    try:
-                        q = self.data_view.decode()
-                    except TypeError:
-                        q = str(self.data_view)
-                else:
-                    if self.data_view.ndim == 0:
-                        try:
-                            q = self.data_view.decode()
-                        except AttributeError:
-                            q = str(self.data_view)
-                    elif self.data_view.ndim == 1:
-                        try:
-                            q = self.data_view[index.row()].decode()
-                        except AttributeError:
-                            q = str(self.data_view[index.row()])
-                    elif self.data_view.ndim >= 2:
-                        try:
-                            q = self.data_view[index.row(), index.column()].decode()
-                        except AttributeError:
-                            q = str(self.data_view[index.row(), index.column()])
-
-                return q
+            if strings is None:
+                return None
+
+            strings = strings[row % self.BLOCK_ROWS]
+            return strings[column % self.BLOCK_COLUMNS] if isinstance(strings, list) else strings
 
+        value = self.get_value(row, column)
+
+        if value is None:
+            return None
+
+        return value_format.format_value(value)
+
+    def block_axes(self):
+        """
+        Returns the number of axes of the dataset shown as rows and
+        columns of the table, 1 for a compound dataset whose fields
+        are the columns, or 0 if the cells are not shown by blocks.
+        """
+        view_axes = self.mapper.view_axes
+
+        if self.compound_names:
+            return 1 if len(view_axes) == 1 else 0
+
+        return len(view_axes) if len(view_axes) <= 2 else 0
+
+    def block_columns(self):
+        """
+        Returns the number of columns of the table in a block
+        """
+        if self.compound_names or self.block_axes() < 2:
+            return 1
+        return self.BLOCK_COLUMNS
+
+    def table_selection(self, rows, columns=None):
+        """
+        Returns the selection of the dataset shown in the given range
+        of rows (and of columns) of the table.
+        """
+        sel = list(self.dims)
+        view_axes = self.mapper.view_axes
+
+        for view_axis, positions in enumerate([rows, columns][:len(view_axes)]):
+            if positions is not None:
+                r = self.mapper.ranges[view_axis][positions]
+                sel[view_axes[view_axis]] = slice(r.start, r.stop if r.stop >= 0 else None, r.step)
+
+        return tuple(sel)
+
+    def clear_display_blocks(self):
+        """
+        Forget the strings of the cells, e.g. when the value_format
+        has changed
+        """
+        self.display_blocks.clear()
+        self.display_bytes = 0
+
+    def reformat(self):
+        """
+        Show the cells again with the current value_format
+        """
+        self.clear_display_blocks()
+
+        if self.row_count:
+            self.dataChanged.emit(self.index(0, 0),
+                                  self.index(self.row_count - 1, self.column_count - 1),
+                                  [])
+
+    def cell_selection(self, row, column):
+        """
+        Returns the selection of the dataset shown in the cell
+        (row, column) of the table.
+        """
+        sel = list(self.dims)
+        view_axes = self.mapper.view_axes
+
+        if view_axes:
+            sel[view_axes[0]] = self.mapper.source_index(0, row)
+
+        if not self.compound_names and len(view_axes) > 1:
+            sel[view_axes[1]] = self.mapper.source_index(1, column)
+
+        return tuple(sel)
+
+    def get_value(self, row, column):
+        """
+        Return the value shown in the cell (row, column) of the
+        table from the tile cache, or None if the tiles holding it
+        are still being read.
+        """
+        sel = self.cell_selection(row, column)
+        view_axes = self.mapper.view_axes
+
+        if self.compound_names:
+            return self.get_field_value(sel, self.compound_names[column])
+
+        if len(view_axes) > 2:
+            # each cell holds the remaining axes, e.g. rgb(a) values
+            missing = self.tile_cache.missing_tiles(self.node, sel)
+            if missing:
+                value = slice_store.get(self.node, sel)
+                if value is not None:
+                    return value
+                self.fetch_tiles(missing)
+                if not self.loader.synchronous:
+                    return None
+            return self.tile_cache.read(self.node, sel)
+
+        value = self.tile_cache.get_value(self.node, sel, read=False)
+
+        if value is None:
+            # the image or plot being shown may hold the value
+            value = slice_store.get(self.node, sel)
+
+        if value is None:
+            self.fetch_tiles([self.tile_cache.tile_index(self.node, sel)])
+            if not self.loader.synchronous:
+                return None
+            value = self.tile_cache.get_value(self.node, sel)
+
+        return value
+
+    @staticmethod
+    def strings_size(strings):
+        """
+        Returns about the number of bytes taken by the python strings
+        of an array of cells. The nbytes of the array does not tell,
+        it is 8 bytes per cell for an array of objects, and as many
+        characters as the longest string for an array of str.
+        """
+        return strings.size * STRING_SIZE + sum(map(len, strings.flat))
+
+    def display_block(self, block_row, block_column):
+        """
+        Returns the strings of the cells of the given block of the
+        table as a list (of lists of the columns of each row), or
+        None while the tiles holding them are being read.
+        """
+        key = (block_row, block_column)
+        found = self.display_blocks.get(key)
+
+        if found is not None:
+            self.display_blocks.move_to_end(key)
+            return found[0]
+
+        rows = slice(block_row * self.BLOCK_ROWS, (block_row + 1) * self.BLOCK_ROWS)
+
+        if self.compound_names:
+            name = self.compound_names[block_column]
+            sel = self.table_selection(rows)
+            values = field_cache.get(self.node, sel, name)
+
+            if values is None:
+                missing = self.tile_cache.missing_tiles(self.node, sel, name)
+
+                if missing and not self.loader.synchronous:
+                    for tile_index in missing:
+                        self.requested.setdefault(tile_index, {})[name] = None
+
+                    if not self.flush_timer.isActive():
+                        self.flush_timer.start()
+                    return None
+
+                values = self.tile_cache.read(self.node, sel, name)
+
+        else:
+            columns = slice(block_column * self.BLOCK_COLUMNS, (block_column + 1) * self.BLOCK_COLUMNS)
+            sel = self.table_selection(rows, columns)
+
+            # the image or plot being shown may hold the values
+            values = slice_store.get(self.node, sel)
+
+            if values is None:
+                missing = self.tile_cache.missing_tiles(self.node, sel)
+
+                if missing and not self.loader.synchronous:
+                    self.fetch_tiles(missing)
+                    return None
+
+                values = self.tile_cache.read(self.node, sel)
+
+        strings = value_format.format_block(values, values.ndim - self.block_axes())
+
+        # as python strings, which Qt shows, unlike numpy.str_
+        self.display_blocks[key] = found = (strings.tolist(), self.strings_size(strings))
+        self.display_bytes += found[1]
+
+        while self.display_bytes > self.MAX_DISPLAY_BYTES and len(self.display_blocks) > 1:
+            _, old = self.display_blocks.popitem(last=False)
+            self.display_bytes -= old[1]
+
+        return found[0]
+
+    def copy_text(self, top, left, bottom, right):
+        """
+        Returns the text of the cells from (top, left) to (bottom,
+        right) of the table, as tab separated lines, for the clipboard.
+        The cells are read now if they are not in the tile cache.
+        """
+        rows = slice(top, bottom + 1)
+        columns = slice(left, right + 1)
+
+        if self.compound_names and self.block_axes():
+            sel = self.table_selection(rows)
+            strings = []
+
+            for name in self.compound_names[columns]:
+                values = field_cache.get(self.node, sel, name)
+                if values is None:
+                    values = self.tile_cache.read(self.node, sel, name)
+                strings.append(value_format.format_block(values, values.ndim - 1))
+
+            strings = np.stack(strings, axis=1)
+
+        elif self.block_axes():
+            sel = self.table_selection(rows, columns)
+            values = slice_store.get(self.node, sel)
+            if values is None:
+                values = self.tile_cache.read(self.node, sel)
+            strings = value_format.format_block(values, values.ndim - self.block_axes())
+
+        else:
+            strings = np.empty((bottom - top + 1, right - left + 1), dtype=object)
+            for row in range(top, bottom + 1):
+                for column in range(left, right + 1):
+                    name = self.compound_names[column] if self.compound_names else None
+                    value = self.tile_cache.read(self.node, self.cell_selection(row, column), name)
+                    strings[row - top, column - left] = value_format.format_value(value)
+
+        if strings.ndim == 1:
+            strings = strings[:, np.newaxis]
+
+        return '\n'.join('\t'.join(line) for line in strings.tolist())
+
+    def get_field_value(self, sel, name):
+        """
+        Returns the field name of the record of a compound dataset
+        at sel, or None if it is still being read, see flush_requests.
+        """
+        value = self.tile_cache.get_value(self.node, sel, read=False, field=name)
+
+        if value is None:
+            value = field_cache.get(self.node, sel, name)
+
+        if value is None:
+            if self.loader.synchronous:
+                return self.tile_cache.get_value(self.node, sel, field=name)
+
+            tile_index = self.tile_cache.tile_index(self.node, sel)
+            self.requested.setdefault(tile_index, {})[name] = None
+
+            if not self.flush_timer.isActive():
+                self.flush_timer.start()
+
+        return value
+
+    def fetch_tiles(self, tile_indices, fields=None):
+        """
+        Read the given tiles of the current node, or only the given
+        fields of them, on the loader and add them to the tile cache.
+        """
+        fields = tuple(fields) if fields else None
+
+        for tile_index in tile_indices:
+            key = ('tile', self.node.name, tile_index, fields)
+
+            if self.loader.is_loading(key):
+                continue
+
+            self.load_count += 1
+            self.loader.load(key,
+                             partial(self.handle_tile_loaded, self.node, tile_index, fields),
+                             read_tile,
+                             self.node,
+                             self.tile_cache.tile_selection(self.node, tile_index),
+                             fields)
+
+    def handle_tile_loaded(self, node, tile_index, fields, tile):
+        """
+        Add a tile read by the loader to the tile cache, field by
+        field if only some fields were read, and refresh the cells
+        of the table.
+        """
+        if fields is None:
+            self.tile_cache.put(node, tile_index, tile)
+        else:
+            for name in fields:
+                self.tile_cache.put(node, tile_index, np.ascontiguousarray(tile[name]), name)
+
+        if node == self.node and not self.loader.synchronous and self.row_count:
+            self.dataChanged.emit(self.index(0, 0),
+                                  self.index(self.row_count - 1, self.column_count - 1),
+                                  [])
 
     def set_dims(self, dims):
         """
@@ -442,12 +1510,8 @@ class DataTableModel(QAbstractTableModel):
         """
         self.beginResetModel()
 
-        self.row_count = None
-        self.column_count = None
-
-        self.dims = []
-        self.shape = self.node.shape
-
+        self.requested.clear()
+        self.clear_display_blocks()
         self.dims = get_dims_from_str(dims)
 
         if self.compound_names:
@@ -455,191 +1519,687 @@ class DataTableModel(QAbstractTableModel):
                 self.compound_names = tuple([self.node.dtype.names[self.dims[1]]])
             else:
                 self.compound_names = self.node.dtype.names[self.dims[1]]
-            self.column_count = len(self.compound_names)
-            if isinstance(self.dims[0], int):
-                dims = list(self.dims)
+            dims = list(self.dims[:1])
+            if dims and isinstance(dims[0], int):
                 dims[0] = slice(dims[0], dims[0] + 1, None)
-                self.dims = tuple(dims)
-            self.data_view = self.node[self.dims[0]][list(self.compound_names)]
-            if self.data_view.ndim == 0:
-                self.row_count = 1
-            else:
-                self.row_count = self.data_view.shape[0]
-
-            self.endResetModel()
-            return
+            self.dims = tuple(dims)
 
-        if self.ndim == 2 and isinstance(self.dims[0], int):
+        elif self.ndim == 2 and isinstance(self.dims[0], int):
             dims = list(self.dims)
             dims[0] = slice(dims[0], dims[0] + 1, None)
             self.dims = tuple(dims)
 
-        self.data_view = self.node[self.dims]
+        self.update_view_shape()
+        self.endResetModel()
 
-        try:
-            self.row_count = self.data_view.shape[0]
-        except IndexError:
-            self.row_count = 1
+    #
+    # Slots
+    #
 
-        try:
-            self.column_count = self.data_view.shape[1]
-        except IndexError:
+    def flush_requests(self):
+        """
+        Read the fields of the tiles asked for by the view since
+        the last flush, one read per tile.
+        """
+        for tile_index, fields in self.requested.items():
+            self.fetch_tiles([tile_index], fields)
+
+        self.requested.clear()
+
+
+class ImageModel(QAbstractItemModel):
+    """
+    Model containing data from the dataset in the HDF5 file,
+    in a form suitable for plotting as an image.
+
+    The image is requested from the SliceStore, which reads it on
+    the loader unless it is already held by another model. data_loaded
+    is emitted when image_view has been updated.
+
+    When scrolling through a stack of images, the frames shown are
+    kept in the frame_buffer and the next PREFETCH_FRAMES frames in
+    the direction of scrolling are read ahead in the background.
+
+    Images with more than MAX_IMAGE_PIXELS pixels, or larger than
+    the read_budget, are not read in full. image_view is then an
+    overview with every image_step-th row and column, and the part
+    of the image the user has zoomed into is read in more detail by
+    request_detail. The levels read are kept in the pyramid_cache.
+    detail_loaded is emitted when detail_view has been updated.
+
+    The levels of the images of a dataset are estimated from a sample
+    of its chunks on the loader and kept in the levels_cache, and
+    levels_loaded is emitted when they are ready. If levels_locked is
+    True these levels are used for every frame, otherwise the levels
+    of each frame are estimated from a sample of the frame.
+    """
+    data_loaded = Signal()
+    detail_loaded = Signal()
+    levels_loaded = Signal()
+
+    PREFETCH_FRAMES = 4
+    MAX_IMAGE_PIXELS = 4096 * 4096
+    OVERVIEW_SIZE = 2048
+
+    def __init__(self, hdf, loader=None):
+        super().__init__()
+
+        self.hdf = hdf
+        self.node = None
+        self.row_count = 0
+        self.column_count = 0
+        self.ndim = 0
+        self.dims = ()
+        self.image_view = None
+        self.compound_names = None
+        self.loader = loader or DataLoader(synchronous=True)
+
+        # +1 or -1, the direction of scrolling through the frames
+        self.direction = 1
+
+        # key of the frame waited for while it is being prefetched
+        self.waiting_key = None
+
+        # overview and detail of large images
+        self.image_step = 1
+        self.pyramid = None
+        self.detail_view = None
+        self.detail_rect = None
+        self.detail_request = None
+
+        # levels and histogram of the dataset, see estimate_levels
+        self.levels = None
+        self.histogram = None
+        self.levels_locked = True
+
+        # number of calls to update_node and of images requested
+        self.update_count = 0
+        self.load_count = 0
+
+    def update_node(self, path, load=True):
+        """
+        Update the current node path. If load is False the
+        image is not requested, e.g. because set_dims will
+        be called straight away.
+        """
+        self.update_count += 1
+        self.compound_names = None
+        self.direction = 1
+        self.loader.cancel_group('prefetch')
+        self.loader.cancel_group('levels')
+        self.levels = None
+        self.histogram = None
+
+        self.beginResetModel()
+
+        self.row_count = 0
+        self.column_count = 0
+
+        self.dims = ()
+
+        self.node = get_node(self.hdf, path)
+
+        self.image_view = None
+
+        if not isinstance(self.node, h5py.Dataset) or self.node.dtype == 'object':
+            self.endResetModel()
+            self.load_image()
+            return
+
+        self.ndim = self.node.ndim
+
+        shape = self.node.shape
+
+        self.compound_names = self.node.dtype.names
+
+        if self.ndim >= 2 and self.node.dtype.kind in 'biuf':
+            self.load_levels()
+
+        if self.ndim == 0:
+            self.row_count = 1
             self.column_count = 1
 
-        self.endResetModel()
+        elif self.ndim == 1:
+            self.row_count = shape[0]
+
+            if self.compound_names:
+                self.column_count = len(self.compound_names)
+            else:
+                self.column_count = 1
+
+        elif self.ndim == 2:
+            self.row_count = shape[-2]
+            self.column_count = shape[-1]
+            self.dims = tuple([slice(None), slice(None)])
+
+        elif self.ndim > 2 and shape[-1] in [3, 4]:
+            self.row_count = shape[-3]
+            self.column_count = shape[-2]
+            self.dims = tuple(([0] * (self.ndim - 3)) + [slice(None),
+                                                         slice(None),
+                                                         slice(None)])
+
+        else:
+            self.row_count = shape[-2]
+            self.column_count = shape[-1]
+            self.dims = tuple(([0] * (self.ndim - 2)) + [slice(None),
+                                                         slice(None)])
+
+        self.endResetModel()
+
+        if load:
+            self.load_image()
+
+    def parent(self, childIndex=QModelIndex()):
+        return self.createIndex()
+
+    def index(self, row, column, parentIndex=QModelIndex()):
+        return self.createIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return self.column_count
+
+    def headerData(self, section, orientation, role):
+        if role == Qt.DisplayRole:
+            if self.compound_names and orientation == Qt.Horizontal:
+                return self.compound_names[section]
+            else:
+                return str(section)
+
+        super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        """
+        This function must be implemented when subclassing
+        QAbstractItemModel. As the ImageView class does not need
+        this function, an invalid QVariant is returned. The
+        constructor QVariant() should not be used in the future
+        so None can be returned instead, as
+        recommended in the docs: https://doc.qt.io/qtforpython-6/considerations.html#qvariant.
+        """
+        if index.isValid():
+            if role in (Qt.DisplayRole, Qt.ToolTipRole):
+                return None
+
+
+    def set_dims(self, dims):
+        """
+        This function is called if the dimensions in the
+        HDF5Widget.dims_view are edited. The dimensions of
+        the model are updated to match the input dimensions.
+
+        The current image_view is kept until the new one has
+        been read, so that scrolling through frames does not
+        flicker.
+        """
+        self.beginResetModel()
+
+        old_frame = self.frame_index()
+
+        self.row_count = 1
+        self.column_count = 1
+        self.dims = get_dims_from_str(dims)
+
+        valid = False
+
+        if len(self.dims) == self.node.ndim >= 2 and not self.node.dtype == 'object':
+            shape = IndexMapper(self.node.shape, self.dims).view_shape
+
+            if len(shape) == 2:
+                self.row_count, self.column_count = shape
+                valid = True
+
+            elif len(shape) == 3 and shape[-1] in [3, 4]:
+                self.row_count, self.column_count = shape[:2]
+                valid = True
+
+        if not valid:
+            self.dims = ()
+
+        frame = self.frame_index()
+
+        if frame is not None and old_frame is not None and frame != old_frame:
+            direction = 1 if frame > old_frame else -1
+            if direction != self.direction:
+                self.direction = direction
+                self.loader.cancel_group('prefetch')
+
+        self.endResetModel()
+        self.load_image()
+
+    def frame_index(self):
+        """
+        Returns the index of the current frame along the first axis
+        if the image is one frame of a stack, otherwise None.
+        """
+        if self.dims and self.node.ndim > 2 and isinstance(self.dims[0], int):
+            return self.dims[0]
+
+        return None
+
+    def load_image(self):
+        """
+        Read the image given by self.dims on the loader, or
+        clear the image if there is nothing to show. Frames of
+        a stack are taken from the frame_buffer if possible.
+        """
+        self.waiting_key = None
+        self.loader.cancel(('follow', 'image'))
+        self.update_pyramid()
+
+        if not self.dims:
+            slice_store.withdraw(self)
+            slice_store.release(self)
+            self.set_image_view(None)
+            return
+
+        if self.pyramid is not None and self.pyramid.overview is not None:
+            slice_store.withdraw(self)
+            slice_store.release(self)
+            self.set_image_view(self.pyramid.overview)
+            self.prefetch()
+            return
+
+        dims = self.read_dims()
+
+        if self.frame_index() is None:
+            callback = self.set_image_view
+
+        else:
+            key = frame_buffer.make_key(self.node, dims)
+            frame = frame_buffer.get(key)
+
+            if frame is not None or self.loader.is_loading(('prefetch', key)):
+                slice_store.withdraw(self)
+                slice_store.release(self)
+
+                if frame is None:
+                    self.waiting_key = key
+                else:
+                    self.set_image_view(frame)
+                    self.prefetch()
+                return
+
+            callback = partial(self.handle_frame_loaded, key)
+
+        self.load_count += 1
+        slice_store.request(self,
+                            self.node,
+                            dims,
+                            self.loader,
+                            callback,
+                            read_selection,
+                            self.node,
+                            dims,
+                            message=f"Loading image of {self.node.name}")
+
+    def update_shape(self):
+        """
+        Called when the dataset may have grown, e.g. while following
+        a file written in SWMR mode. Frames appended to a stack are
+        only read when they are shown. Rows appended to the image
+        shown are read and added to image_view, so the rest of the
+        image is not read again, unless only an overview is shown.
+        """
+        if not self.dims or self.image_view is None:
+            return
+
+        mapper = IndexMapper(self.node.shape, self.dims)
+        rows, columns = mapper.view_shape[:2]
+
+        if (rows, columns) == (self.row_count, self.column_count):
+            return
+
+        r = mapper.ranges[0]
+        start = len(self.image_view)
+
+        if (self.pyramid is None and self.frame_index() is None and r.step > 0
+                and columns == self.column_count and rows >= start):
+            if rows == start:
+                self.row_count = rows
+
+            elif not self.loader.is_loading(('follow', 'image')):
+                sel = list(self.dims)
+                sel[mapper.view_axes[0]] = slice(r[start], r[-1] + 1, r.step)
+
+                self.loader.load(('follow', 'image'),
+                                 partial(self.append_image, start),
+                                 read_selection,
+                                 self.node,
+                                 tuple(sel))
+            return
+
+        self.beginResetModel()
+        self.row_count, self.column_count = rows, columns
+        self.endResetModel()
+        self.load_image()
+
+    def append_image(self, start, rows):
+        """
+        Called with the rows appended to the image since it was
+        read, see update_shape.
+        """
+        if self.image_view is None or len(self.image_view) != start:
+            return
+
+        self.beginInsertRows(QModelIndex(), self.row_count, start + len(rows) - 1)
+        self.row_count = start + len(rows)
+        self.endInsertRows()
+
+        # image_view is no longer a view of the stored slice
+        slice_store.release(self)
+        self.set_image_view(np.concatenate([self.image_view, rows]))
+
+    def update_pyramid(self):
+        """
+        Choose the step of the overview of the image given by
+        self.dims, a power of two such that the overview has at
+        most OVERVIEW_SIZE rows and columns and fits in the
+        read_budget. The image is read in full if it has at most
+        MAX_IMAGE_PIXELS pixels and fits in the budget.
+        """
+        self.image_step = 1
+        self.pyramid = None
+        self.clear_detail()
+
+        if not self.dims:
+            return
+
+        budget = read_budget()
+
+        if (self.row_count * self.column_count <= self.MAX_IMAGE_PIXELS
+                and estimate_read(self.node, self.dims)['bytes'] <= budget):
+            return
+
+        while max(self.row_count, self.column_count) > self.image_step * self.OVERVIEW_SIZE:
+            self.image_step *= 2
+
+        while (self.image_step < max(self.row_count, self.column_count)
+               and estimate_read(self.node, self.read_dims())['bytes'] > budget):
+            self.image_step *= 2
+
+        self.pyramid = pyramid_cache.get(self.node, self.dims, self.image_step)
+
+    def read_dims(self, level=None, tile_index=None):
+        """
+        Returns the selection of the image at the given level,
+        i.e. with every level-th row and column. If tile_index
+        is given, only that tile of the image is selected, see
+        ImagePyramid.
+
+        Parameters
+        ----------
+        level : INT, optional
+            Defaults to image_step, i.e. the overview.
+        tile_index : TUPLE, optional
+            (row, column) index of the tile.
+        """
+        level = level or self.image_step
+
+        if level == 1 and tile_index is None:
+            return self.dims
+
+        mapper = IndexMapper(self.node.shape, self.dims)
+        sel = list(self.dims)
+
+        for i in range(2):
+            axis = mapper.view_axes[i]
+            r = mapper.ranges[i]
+
+            if tile_index is None:
+                start, stop = 0, len(r)
+            else:
+                start = tile_index[i] * ImagePyramid.TILE * level
+                stop = min(len(r), start + ImagePyramid.TILE * level)
+
+            sel[axis] = slice(r[start], r[stop - 1] + 1, r.step * level)
+
+        return tuple(sel)
+
+    def prefetch(self):
+        """
+        Read the next PREFETCH_FRAMES frames in the direction of
+        scrolling into the frame_buffer, in the background.
+        """
+        frame = self.frame_index()
+
+        if frame is None:
+            return
+
+        for i in range(1, self.PREFETCH_FRAMES + 1):
+            index = frame + i * self.direction
+
+            if not 0 <= index < self.node.shape[0]:
+                break
+
+            dims = (index,) + tuple(self.read_dims()[1:])
+            key = frame_buffer.make_key(self.node, dims)
+
+            if key in frame_buffer or self.loader.is_loading(('prefetch', key)):
+                continue
+
+            self.loader.load(('prefetch', key),
+                             partial(self.handle_frame_prefetched, key),
+                             read_selection,
+                             self.node,
+                             dims)
+
+    def handle_frame_loaded(self, key, image_view):
+        """
+        Called with a frame of a stack read by the loader
+        """
+        frame_buffer.put(key, image_view)
+        self.set_image_view(image_view)
+        self.prefetch()
+
+    def handle_frame_prefetched(self, key, image_view):
+        """
+        Called with a frame read ahead by prefetch
+        """
+        frame_buffer.put(key, image_view)
 
+        if key == self.waiting_key:
+            self.waiting_key = None
+            self.set_image_view(image_view)
+            self.prefetch()
 
-class ImageModel(QAbstractItemModel):
-    """
-    Model containing data from the dataset in the HDF5 file,
-    in a form suitable for plotting as an image.
-    """
-    def __init__(self, hdf):
-        super().__init__()
+    def set_image_view(self, image_view):
+        """
+        Called with the image read by the loader
+        """
+        self.image_view = image_view
 
-        self.hdf = hdf
-        self.node = None
-        self.row_count = 0
-        self.column_count = 0
-        self.ndim = 0
-        self.dims = ()
-        self.image_view = None
-        self.compound_names = None
+        if self.pyramid is not None and image_view is not None:
+            self.pyramid.set_overview(image_view)
+            pyramid_cache.evict()
 
+        self.data_loaded.emit()
 
-    def update_node(self, path):
+    def request_detail(self, rows, columns, size):
         """
-        Update the current node path
+        Read the part of a large image in the given rows and
+        columns, at a level of detail suitable for showing it
+        on a screen area of the given size. detail_view is set
+        once all the tiles needed are in the pyramid.
+
+        Parameters
+        ----------
+        rows : TUPLE
+            (first, last) visible row of the image.
+        columns : TUPLE
+            (first, last) visible column of the image.
+        size : TUPLE
+            (height, width) in screen pixels.
         """
-        self.compound_names = None
-
-        self.beginResetModel()
+        if self.pyramid is None:
+            return
 
-        self.row_count = 0
-        self.column_count = 0
+        y0 = max(0, int(rows[0]))
+        y1 = min(self.row_count, int(rows[1]) + 1)
+        x0 = max(0, int(columns[0]))
+        x1 = min(self.column_count, int(columns[1]) + 1)
 
-        self.dims = ()
+        if y1 <= y0 or x1 <= x0:
+            self.clear_detail()
+            return
 
-        self.node = self.hdf[path]
+        ratio = min((y1 - y0) / max(1, size[0]), (x1 - x0) / max(1, size[1]))
 
-        self.image_view = None
+        level = 1
+        while level * 2 <= ratio:
+            level *= 2
 
-        if not isinstance(self.node, h5py.Dataset) or self.node.dtype == 'object':
-            self.endResetModel()
+        if level >= self.image_step:
+            self.clear_detail()
             return
 
-        self.ndim = self.node.ndim
+        n = ImagePyramid.TILE * level
+        tiles = [(i, j)
+                 for i in range(y0 // n, (y1 - 1) // n + 1)
+                 for j in range(x0 // n, (x1 - 1) // n + 1)]
 
-        shape = self.node.shape
+        self.detail_request = (level, tiles)
 
-        self.compound_names = self.node.dtype.names
+        keys = {('pyramid', self.pyramid, level, t): t for t in tiles}
 
-        if self.ndim == 0:
-            self.row_count = 1
-            self.column_count = 1
+        for key in list(self.loader.jobs):
+            if isinstance(key, tuple) and key[0] == 'pyramid' and key not in keys:
+                self.loader.cancel(key)
 
-        elif self.ndim == 1:
-            self.row_count = shape[0]
+        for key, t in keys.items():
+            if self.pyramid.get(level, t) is None and not self.loader.is_loading(key):
+                self.loader.load(key,
+                                 partial(self.handle_tile_loaded, self.pyramid, level, t),
+                                 read_selection,
+                                 self.node,
+                                 self.read_dims(level, t))
 
-            if self.compound_names:
-                self.column_count = len(self.compound_names)
-            else:
-                self.column_count = 1
+        self.assemble_detail()
 
-        elif self.ndim == 2:
-            self.row_count = shape[-2]
-            self.column_count = shape[-1]
-            self.dims = tuple([slice(None), slice(None)])
-            self.image_view = self.node[self.dims]
+    def assemble_detail(self):
+        """
+        Join the tiles of the last request_detail into detail_view,
+        if they have all been read.
+        """
+        if self.detail_request is None:
+            return
 
-        elif self.ndim > 2 and shape[-1] in [3, 4]:
-            self.row_count = shape[-3]
-            self.column_count = shape[-2]
-            self.dims = tuple(([0] * (self.ndim - 3)) + [slice(None),
-                                                         slice(None),
-                                                         slice(None)])
-            self.image_view = self.node[self.dims]
+        level, tiles = self.detail_request
+        found = [self.pyramid.get(level, t) for t in tiles]
 
-        else:
-            self.row_count = shape[-2]
-            self.column_count = shape[-1]
-            self.dims = tuple(([0] * (self.ndim - 2)) + [slice(None),
-                                                         slice(None)])
-            self.image_view = self.node[self.dims]
+        if any(tile is None for tile in found):
+            return
 
-        self.endResetModel()
+        grid = {}
+        for t, tile in zip(tiles, found):
+            grid.setdefault(t[0], []).append(tile)
 
-    def parent(self, childIndex=QModelIndex()):
-        return self.createIndex()
+        self.detail_view = np.concatenate(
+            [np.concatenate(row, axis=1) for _, row in sorted(grid.items())], axis=0)
 
-    def index(self, row, column, parentIndex=QModelIndex()):
-        return self.createIndex()
+        n = ImagePyramid.TILE * level
+        self.detail_rect = (tiles[0][1] * n,
+                            tiles[0][0] * n,
+                            self.detail_view.shape[1] * level,
+                            self.detail_view.shape[0] * level)
+        self.detail_request = None
+        self.detail_loaded.emit()
 
-    def rowCount(self, parent=QModelIndex()):
-        return self.row_count
+    def clear_detail(self):
+        """
+        Stop reading detail and drop the detail_view
+        """
+        self.detail_request = None
+        self.loader.cancel_group('pyramid')
 
-    def columnCount(self, parent=QModelIndex()):
-        return self.column_count
+        if self.detail_view is not None:
+            self.detail_view = None
+            self.detail_rect = None
+            self.detail_loaded.emit()
 
-    def headerData(self, section, orientation, role):
-        if role == Qt.DisplayRole:
-            if self.compound_names and orientation == Qt.Horizontal:
-                return self.compound_names[section]
-            else:
-                return str(section)
+    def value_at(self, row, column):
+        """
+        Returns the value of the image at the given row and
+        column, at the finest level of detail that has been read.
+        """
+        if self.detail_view is not None:
+            x, y, w, h = self.detail_rect
+            level = w // self.detail_view.shape[1]
 
-        super().headerData(section, orientation, role)
+            if x <= column < x + w and y <= row < y + h:
+                return self.detail_view[(row - y) // level, (column - x) // level]
 
-    def data(self, index, role=Qt.DisplayRole):
+        return self.image_view[row // self.image_step, column // self.image_step]
+
+    def load_levels(self):
         """
-        This function must be implemented when subclassing
-        QAbstractItemModel. As the ImageView class does not need
-        this function, an invalid QVariant is returned. The
-        constructor QVariant() should not be used in the future
-        so None can be returned instead, as
-        recommended in the docs: https://doc.qt.io/qtforpython-6/considerations.html#qvariant.
+        Take the levels of the node from the levels_cache, or
+        estimate them from a sample of the node on the loader.
         """
-        if index.isValid():
-            if role in (Qt.DisplayRole, Qt.ToolTipRole):
-                return None
+        key = levels_cache.make_key(self.node)
+        result = levels_cache.get(key)
 
+        if result is not None:
+            self.set_levels(key, result)
+            return
 
-    def set_dims(self, dims):
+        self.loader.load(('levels',),
+                         partial(self.set_levels, key),
+                         read_sample,
+                         self.node)
+
+    def set_levels(self, key, result):
         """
-        This function is called if the dimensions in the
-        HDF5Widget.dims_view are edited. The dimensions of
-        the model are updated to match the input dimensions.
+        Called with the levels estimated from a sample of the node
         """
-        self.beginResetModel()
+        if result is None:
+            return
 
-        self.row_count = None
-        self.column_count = None
-        self.dims = []
-        self.image_view = None
+        levels_cache.put(key, result)
+        self.levels = result['levels']
+        self.histogram = result['histogram']
+        self.levels_loaded.emit()
 
-        self.dims = get_dims_from_str(dims)
+    def lock_levels(self, levels):
+        """
+        Use the given levels for all the frames of the dataset,
+        e.g. after the user has changed them.
+        """
+        self.levels = tuple(levels)
 
-        if len(self.dims) >= 2 and not self.node.dtype == 'object':
-            self.image_view = self.node[self.dims]
-            shape = self.image_view.shape
-            if self.image_view.ndim == 2:
-                self.row_count = shape[-2]
-                self.column_count = shape[-1]
+        if self.node is not None and self.histogram is not None:
+            levels_cache.put(levels_cache.make_key(self.node),
+                             {'levels': self.levels, 'histogram': self.histogram})
 
-            elif self.image_view.ndim == 3 and shape[-1] in [3, 4]:
-                self.row_count = shape[-3]
-                self.column_count = shape[-2]
+    def image_levels(self):
+        """
+        Returns the levels and histogram used to show the current
+        image_view, see estimate_levels. These are the levels of
+        the dataset if they are locked and have been estimated,
+        otherwise they are estimated from a sample of the frame.
+        """
+        if self.levels_locked and self.levels is not None:
+            return self.levels, self.histogram
 
-            else:
-                self.image_view = None
-                self.row_count = 1
-                self.column_count = 1
+        result = estimate_levels(sample_array(self.image_view, SAMPLE_SIZE))
 
-        else:
-            self.row_count = 1
-            self.column_count = 1
+        if result is None:
+            return None, None
 
-        self.endResetModel()
+        return result['levels'], result['histogram']
+
+    def handle_tile_loaded(self, pyramid, level, tile_index, tile):
+        """
+        Called with a tile of a large image read by the loader
+        """
+        pyramid.put(level, tile_index, tile)
+        pyramid_cache.evict()
+
+        if pyramid is self.pyramid:
+            self.assemble_detail()
 
 
 class PlotModel(QAbstractItemModel):
@@ -647,8 +2207,30 @@ class PlotModel(QAbstractItemModel):
     Model containing data from a dataset of the HDF5 file,
     in a form suitable for plotting as y(x), where x is
     usually an index.
+
+    The data is requested from the SliceStore, which reads it on
+    the loader unless it is already held by another model. data_loaded
+    is emitted when plot_view has been updated.
+
+    Traces of more than MAX_PLOT_POINTS points, or larger than the
+    read_budget, are decimated: they are read in pieces and reduced
+    to the minimum and maximum of ENVELOPE_BINS bins, with plot_x
+    giving the index of each point. Only every plot_step-th point
+    of x, y pairs larger than the read_budget is read.
+    When the user zooms in, request_range reads the visible range at
+    screen resolution and emits detail_loaded.
+
+    The trace is pinned to the plot_length points read, so that when
+    the dataset grows only the points appended are read, see
+    update_shape.
     """
-    def __init__(self, hdf):
+    data_loaded = Signal()
+    detail_loaded = Signal()
+
+    MAX_PLOT_POINTS = 100000
+    ENVELOPE_BINS = 2048
+
+    def __init__(self, hdf, loader=None):
         super().__init__()
 
         self.hdf = hdf
@@ -659,24 +2241,51 @@ class PlotModel(QAbstractItemModel):
         self.dims = ()
         self.plot_view = None
         self.compound_names = None
+        self.loader = loader or DataLoader(synchronous=True)
 
+        # envelope of decimated traces
+        self.decimated = False
+        self.plot_x = None
 
-    def update_node(self, path):
+        # step between the x, y pairs read, see load_plot
+        self.plot_step = 1
+        self.overview = None
+
+        # number of points of the trace read and of the dataset
+        # indices in each bin of its envelope, see update_shape
+        self.plot_length = None
+        self.bin_size = 1
+        self.detail_range = None
+
+        # number of calls to update_node and of plots requested
+        self.update_count = 0
+        self.load_count = 0
+
+    def update_node(self, path, load=True):
         """
-        Update the current node path
+        Update the current node path. If load is False the
+        data is not requested, e.g. because set_dims will
+        be called straight away.
         """
+        self.update_count += 1
         self.beginResetModel()
 
-        self.node = self.hdf[path]
+        self.node = get_node(self.hdf, path)
         self.row_count = 0
         self.column_count = 0
         self.ndim = 0
         self.dims = ()
         self.plot_view = None
         self.compound_names = None
+        self.decimated = False
+        self.plot_x = None
+        self.plot_step = 1
+        self.plot_length = None
+        self.loader.cancel_group('envelope')
 
         if not isinstance(self.node, h5py.Dataset) or self.node.dtype == 'object':
             self.endResetModel()
+            self.load_plot(False)
             return
 
         self.ndim = self.node.ndim
@@ -689,6 +2298,7 @@ class PlotModel(QAbstractItemModel):
             self.row_count = 1
             self.column_count = 1
             self.endResetModel()
+            self.load_plot(False)
             return
 
         if self.ndim == 1:
@@ -699,8 +2309,9 @@ class PlotModel(QAbstractItemModel):
                 self.column_count = 1
                 self.dims = tuple([slice(None), 0])
                 self.compound_names = tuple([self.node.dtype.names[0]])
-                self.plot_view = self.node[self.dims[0]][list(self.compound_names)]
                 self.endResetModel()
+                if load:
+                    self.load_plot()
                 return
 
         elif self.ndim == 2:
@@ -716,9 +2327,11 @@ class PlotModel(QAbstractItemModel):
             self.dims = tuple(([0] * (self.ndim - 2)) + [slice(None), 0])
 
         self.column_count = 1
-        self.plot_view = self.node[self.dims]
         self.endResetModel()
 
+        if load:
+            self.load_plot()
+
 
     def parent(self, childIndex=QModelIndex()):
         return self.createIndex()
@@ -763,53 +2376,386 @@ class PlotModel(QAbstractItemModel):
         """
         self.beginResetModel()
 
-        self.row_count = None
-        self.column_count = None
-        self.dims = ()
+        self.row_count = 1
+        self.column_count = 1
         self.plot_view = None
 
         self.dims = get_dims_from_str(dims)
 
+        valid = False
+
         if len(self.dims) >= 1 and not self.node.dtype == 'object':
             if not any(isinstance(i, slice) for i in self.dims):
-                self.row_count = 1
-                self.column_count = 1
                 self.endResetModel()
+                self.load_plot(False)
                 return
 
             if not self.compound_names:
-                self.plot_view = self.node[self.dims]
-                shape = self.plot_view.shape
-                self.row_count = shape[0]
+                shape = ()
+                if len(self.dims) == self.node.ndim:
+                    shape = IndexMapper(self.node.shape, self.dims).view_shape
 
-                if self.plot_view.ndim == 1:
-                    self.column_count = 1
+                if len(shape) == 1:
+                    self.row_count = shape[0]
+                    valid = True
 
-                elif self.plot_view.ndim == 2 and shape[-1] == 2:
+                elif len(shape) == 2 and shape[-1] == 2:
+                    self.row_count = shape[0]
                     self.column_count = 2
-
-                else:
-                    self.plot_view = None
-                    self.column_count = 1
+                    valid = True
 
             else:
                 if isinstance(self.dims[1], int):
                     self.compound_names = tuple([self.node.dtype.names[self.dims[1]]])
                 else:
                     self.compound_names = self.node.dtype.names[self.dims[1]]
-                self.column_count = len(self.compound_names)
-                if self.column_count in [1, 2]:
-                    self.plot_view = self.node[self.dims[0]][list(self.compound_names)]
-                    self.row_count = self.plot_view.shape[0]
-                else:
-                    self.row_count = 1
-                    self.column_count = 1
 
-        else:
-            self.row_count = 1
-            self.column_count = 1
+                if len(self.compound_names) in [1, 2] and isinstance(self.dims[0], slice):
+                    self.column_count = len(self.compound_names)
+                    self.row_count = IndexMapper(self.node.shape, self.dims[:1]).view_shape[0]
+                    valid = True
 
         self.endResetModel()
+        self.load_plot(valid)
+
+    def load_plot(self, valid=True):
+        """
+        Read the data given by self.dims on the loader, or
+        clear the plot if there is nothing to show.
+        """
+        self.loader.cancel_group('envelope')
+        self.loader.cancel(('follow', 'plot'))
+        self.loader.cancel(('fields',))
+        self.plot_x = None
+        self.overview = None
+        self.detail_range = None
+        self.plot_step = 1
+        self.plot_length = None
+
+        if valid:
+            fields = self.compound_names if self.compound_names else None
+            estimate = estimate_read(self.node, self.plot_dims(), fields)
+            over_budget = estimate['bytes'] > read_budget()
+
+        self.decimated = (valid
+                          and self.column_count == 1
+                          and (self.row_count > self.MAX_PLOT_POINTS or over_budget))
+
+        # x, y pairs cannot be reduced to an envelope, so
+        # every plot_step-th pair is read instead
+        if valid and self.column_count == 2 and over_budget:
+            self.plot_step = -(-estimate['bytes'] // read_budget())
+
+        if not valid:
+            slice_store.withdraw(self)
+            slice_store.release(self)
+            self.set_plot_view(None)
+            return
+
+        self.plot_length = len(self.trace_range()[1][::self.plot_step])
+        self.bin_size = -(-self.plot_length // self.ENVELOPE_BINS)
+        self.load_count += 1
+        message = f"Loading plot of {self.node.name}"
+
+        if self.decimated:
+            slice_store.withdraw(self)
+            slice_store.release(self)
+            self.loader.load(('envelope', 'overview'),
+                             self.set_envelope,
+                             read_envelope,
+                             self.node,
+                             self.plot_dims(),
+                             self.ENVELOPE_BINS,
+                             self.plot_field(),
+                             message=message)
+
+        elif self.compound_names:
+            slice_store.withdraw(self)
+            slice_store.release(self)
+            self.load_fields(message)
+
+        else:
+            slice_store.request(self,
+                                self.node,
+                                self.plot_dims(),
+                                self.loader,
+                                self.set_plot_view,
+                                read_selection,
+                                self.node,
+                                self.plot_dims(),
+                                message=message)
+
+    def load_fields(self, message=None):
+        """
+        Read the fields plotted of a compound dataset which are not
+        in the field_cache, and only those fields, on the loader.
+        """
+        dims = self.plot_dims()
+        columns = {}
+
+        for name in self.compound_names:
+            column = field_cache.get(self.node, dims, name)
+            if column is not None:
+                columns[name] = column
+
+        missing = [name for name in self.compound_names if name not in columns]
+
+        if not missing:
+            self.set_plot_view(assemble_fields(self.node, columns, self.compound_names))
+            return
+
+        self.loader.load(('fields',),
+                         partial(self.handle_fields_loaded, dims, columns),
+                         read_fields,
+                         self.node,
+                         dims,
+                         missing,
+                         message=message)
+
+    def handle_fields_loaded(self, dims, columns, data):
+        """
+        Called with the fields of a compound dataset read by
+        load_fields, which are added to the field_cache.
+        """
+        for name in data.dtype.names:
+            columns[name] = np.ascontiguousarray(data[name])
+            field_cache.put(self.node, dims, name, columns[name])
+
+        self.set_plot_view(assemble_fields(self.node, columns, self.compound_names))
+
+    def plot_dims(self):
+        """
+        Returns the selection of the dataset that is plotted,
+        with every plot_step-th point, up to plot_length points.
+        """
+        dims = self.dims[:1] if self.compound_names else self.dims
+
+        if self.plot_step == 1 and self.plot_length is None:
+            return dims
+
+        axis, r = self.trace_range()
+        r = r[::self.plot_step][:self.plot_length]
+
+        dims = list(dims)
+        dims[axis] = slice(r.start, r.stop if r.stop >= 0 else None, r.step)
+
+        return tuple(dims)
+
+    def trace_range(self):
+        """
+        Returns the sliced axis of self.dims and the range of the
+        indices along it in the dataset as it is now.
+        """
+        dims = self.dims[:1] if self.compound_names else self.dims
+        mapper = IndexMapper(self.node.shape, dims)
+
+        return mapper.view_axes[0], mapper.ranges[0]
+
+    def update_shape(self):
+        """
+        Called when the dataset may have grown, e.g. while following
+        a file written in SWMR mode. Only the points appended to the
+        trace are read, and added to plot_view, or to the envelope of
+        a decimated trace in whole bins. A trace which grows beyond
+        MAX_PLOT_POINTS is read again as an envelope.
+        """
+        if (self.plot_length is None
+                or (self.overview if self.decimated else self.plot_view) is None
+                or self.loader.is_loading(('follow', 'plot'))):
+            return
+
+        axis, r = self.trace_range()
+        r = r[::self.plot_step]
+        start = self.plot_length
+
+        if len(r) <= start or r.step < 0:
+            return
+
+        if not self.decimated and self.column_count == 1 and len(r) > self.MAX_PLOT_POINTS:
+            self.load_plot()
+            return
+
+        stop = len(r)
+
+        if self.decimated:
+            stop = start + (stop - start) // self.bin_size * self.bin_size
+            if stop == start:
+                return
+
+        sel = list(self.plot_dims())
+        sel[axis] = slice(r[start], r[stop - 1] + 1, r.step)
+        sel = tuple(sel)
+
+        if self.decimated:
+            self.loader.load(('follow', 'plot'),
+                             partial(self.append_envelope, start, stop),
+                             read_envelope,
+                             self.node,
+                             sel,
+                             (stop - start) // self.bin_size,
+                             self.plot_field())
+
+        elif self.compound_names:
+            self.loader.load(('follow', 'plot'),
+                             partial(self.append_plot, start, stop),
+                             read_fields,
+                             self.node,
+                             sel,
+                             self.compound_names)
+        else:
+            self.loader.load(('follow', 'plot'),
+                             partial(self.append_plot, start, stop),
+                             read_selection,
+                             self.node,
+                             sel)
+
+    def append_plot(self, start, stop, points):
+        """
+        Called with the points appended to the trace since it was
+        read, see update_shape.
+        """
+        if self.plot_length != start or self.plot_view is None:
+            return
+
+        self.plot_length = stop
+        self.row_count = len(self.trace_range()[1])
+
+        # plot_view is no longer a view of the stored slice
+        slice_store.release(self)
+        self.set_plot_view(np.concatenate([self.plot_view, points]))
+
+    def append_envelope(self, start, stop, envelope):
+        """
+        Called with the envelope of the points appended to a
+        decimated trace. Once the envelope has more than twice
+        ENVELOPE_BINS bins, pairs of bins are merged.
+        """
+        if self.plot_length != start or self.overview is None:
+            return
+
+        self.plot_length = stop
+        self.row_count = len(self.trace_range()[1])
+
+        x = np.concatenate([self.overview[0], envelope[0]])
+        y = np.concatenate([self.overview[1], envelope[1]])
+
+        if len(x) > 4 * self.ENVELOPE_BINS and self.bin_size > 1:
+            # each bin is a (min, max) pair of points
+            n = len(x) - len(x) % 4
+            x4 = x[:n].reshape(-1, 4)
+            y4 = y[:n].reshape(-1, 4)
+
+            x = np.concatenate([np.repeat((x4[:, 0] + x4[:, 2]) / 2, 2), x[n:]])
+            y = np.concatenate([np.column_stack([np.fmin(y4[:, 0], y4[:, 2]),
+                                                 np.fmax(y4[:, 1], y4[:, 3])]).ravel(),
+                                y[n:]])
+            self.bin_size *= 2
+
+        self.detail_range = None
+        self.set_envelope((x, y))
+
+    def plot_field(self):
+        """
+        Returns the field plotted of a compound dataset of
+        which a single field is plotted, otherwise None.
+        """
+        if self.compound_names and len(self.compound_names) == 1:
+            return self.compound_names[0]
+
+        return None
+
+    def set_plot_view(self, plot_view):
+        """
+        Called with the data read by the loader
+        """
+        self.plot_view = plot_view
+        self.data_loaded.emit()
+
+    def set_envelope(self, envelope):
+        """
+        Called with the envelope of a whole decimated trace
+        """
+        self.overview = envelope
+        self.plot_x = envelope[0]
+        self.set_plot_view(envelope[1])
+
+    def request_range(self, first, last, width):
+        """
+        Read the points of a decimated trace between the indices
+        first and last at a resolution of width bins. Half the
+        visible range is read on either side, so that small pans
+        do not need a new read.
+
+        Parameters
+        ----------
+        first : FLOAT
+            Index of the first visible point in the dataset.
+        last : FLOAT
+            Index of the last visible point in the dataset.
+        width : INT
+            The width of the plot in pixels.
+        """
+        if not self.decimated or self.overview is None:
+            return
+
+        mapper = IndexMapper(self.node.shape, self.plot_dims())
+        r = mapper.ranges[0]
+
+        p0 = max(0, int(np.floor((first - r.start) / r.step)))
+        p1 = min(len(r), int(np.ceil((last - r.start) / r.step)) + 1)
+
+        if p1 <= p0:
+            return
+
+        size = -(-(p1 - p0) // max(1, int(width)))
+
+        if size * self.ENVELOPE_BINS >= len(r):
+            # the overview is detailed enough
+            self.loader.cancel_group('envelope')
+            if self.detail_range is not None:
+                self.detail_range = None
+                self.plot_x, self.plot_view = self.overview
+                self.detail_loaded.emit()
+            return
+
+        if self.detail_range is not None:
+            q0, q1, q_size = self.detail_range
+            if q0 <= p0 and p1 <= q1 and q_size == size:
+                return
+
+        margin = (p1 - p0) // 2
+        q0 = max(0, p0 - margin)
+        q1 = min(len(r), p1 + margin)
+
+        sel = list(self.plot_dims())
+        sel[mapper.view_axes[0]] = slice(r[q0], r[q1 - 1] + 1, r.step)
+
+        self.loader.load(('envelope', 'detail'),
+                         partial(self.set_detail, (q0, q1, size)),
+                         read_envelope,
+                         self.node,
+                         tuple(sel),
+                         -(-(q1 - q0) // size),
+                         self.plot_field())
+
+    def set_detail(self, detail_range, envelope):
+        """
+        Called with the envelope of part of a decimated trace,
+        which replaces that part of the overview.
+        """
+        x, y = envelope
+
+        if len(x) == 0:
+            return
+
+        ox, oy = self.overview
+        left = ox < x[0]
+        right = ox > x[-1]
+
+        self.plot_x = np.concatenate([ox[left], x, ox[right]])
+        self.plot_view = np.concatenate([oy[left], y, oy[right]])
+        self.detail_range = detail_range
+        self.detail_loaded.emit()
 
 
 class DimsTableModel(QAbstractTableModel):
@@ -838,7 +2784,7 @@ class DimsTableModel(QAbstractTableModel):
         self.shape = []
 
         self.beginResetModel()
-        self.node = self.hdf[path]
+        self.node = get_node(self.hdf, path)
 
         if not isinstance(self.node, h5py.Dataset) or self.node.dtype == 'object':
             self.endResetModel()
@@ -894,6 +2840,9 @@ class DimsTableModel(QAbstractTableModel):
             if role == Qt.DisplayRole:
                 return self.shape[index.column()]
 
+            elif role == Qt.ToolTipRole:
+                return self.describe(index.column())
+
             elif role == Qt.TextAlignmentRole:
                 if qtpy.API_NAME in ["PyQt5", "PySide2"]:
                     return Qt.AlignCenter
@@ -913,7 +2862,14 @@ class DimsTableModel(QAbstractTableModel):
             column = index.column()
             value = value.strip()
 
-            if ':' not in value:
+            if ':' in value:
+                # e.g. a step < 1, which h5py cannot read
+                try:
+                    get_dims_from_str([value])
+                except (ValueError, TypeError):
+                    return False
+
+            else:
                 try:
                     num = int(value)
                     if self.compound_names and column == 1:
@@ -932,6 +2888,43 @@ class DimsTableModel(QAbstractTableModel):
 
         return False
 
+    def describe(self, column):
+        """
+        Returns a description of the indices of the dataset
+        selected by the given column of the dims.
+        """
+        try:
+            dims = get_dims_from_str(self.shape)
+
+            if len(dims) != len(self.shape):
+                return None
+
+            if self.compound_names and column == 1:
+                names = self.compound_names[dims[1]]
+                if isinstance(names, str):
+                    names = [names]
+                return ', '.join(names)
+
+            mapper = IndexMapper(self.node.shape, dims[:self.node.ndim])
+            return f"{mapper.describe(column)}\n{self.describe_read(dims)}"
+
+        except (ValueError, TypeError):
+            return None
+
+    def describe_read(self, dims):
+        """
+        Returns the estimated cost of reading the dims, see
+        estimate_read.
+        """
+        fields = None
+
+        if self.compound_names:
+            fields = self.compound_names[dims[1]]
+            fields = [fields] if isinstance(fields, str) else fields
+            dims = dims[:1]
+
+        return f"Read: {format_estimate(estimate_read(self.node, dims, fields))}"
+
 
 def get_dims_from_str(dims_as_str):
     """
@@ -940,6 +2933,9 @@ def get_dims_from_str(dims_as_str):
     into a tuple of ints and/or slices, which can be used to
     index the dataset at the node.
 
+    ValueError is raised for a slice with a step < 1, which h5py
+    cannot read.
+
     The method to create slices from strings is given here:
     https://stackoverflow.com/questions/680826/python-create-slice-object-from-string/23895339
 
@@ -967,6 +2963,8 @@ def get_dims_from_str(dims_as_str):
             if ':' in value:
                 value = value.strip()
                 s = slice(*map(lambda x: int(x.strip()) if x.strip() else None, value.split(':')))
+                if s.step is not None and s.step < 1:
+                    raise ValueError("Step must be >= 1 (got %d)" % s.step)
                 dims.append(s)
 
     dims = tuple(dims)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the pool of processes used to scan whole
+datasets, e.g. to compute their statistics. h5py runs every call
+behind one lock, so a scan on the threads of the DataLoader uses one
+core however many there are. Each process of the pool opens the file
+itself and scans a part of the dataset.
+"""
+
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    as_completed,
+)
+
+import h5py
+
+from . import chunks
+from .cache import memory_budget
+from .indexing import (
+    PIECE_BYTES,
+    partition_selection,
+)
+from .stats import StreamingStatistics
+
+
+# Datasets smaller than this are scanned on the thread of the loader,
+# as starting the processes would take longer than the scan.
+MIN_SCAN_BYTES = 64 * (1 << 20)
+
+# Largest size in bytes of the partitions handed to the processes,
+# which are otherwise sized to give each process a few of them. A
+# partition being scanned runs to its end if the scan is cancelled.
+PARTITION_BYTES = 128 * (1 << 20)
+PARTITIONS_PER_PROCESS = 4
+
+# Memory in bytes taken by a process, at most about 130 MiB while
+# scanning in pieces of PIECE_BYTES
+PROCESS_BYTES = 160 * (1 << 20)
+
+
+def init_process():
+    """
+    Set up a process of the pool. The processes share the cores, so
+    each decompresses its chunks on its own thread.
+    """
+    chunks.chunk_reader = chunks.ChunkReader(threads=1)
+
+
+def scan_statistics(filename, swmr, path, sel):
+    """
+    Accumulates the StreamingStatistics of node[sel] in a process
+    of the pool, reading it in pieces.
+    """
+    stats = StreamingStatistics()
+
+    with h5py.File(filename, 'r', swmr=swmr) as hdf:
+        node = hdf[path]
+
+        for _, _, piece in partition_selection(node, sel, PIECE_BYTES):
+            stats.update(chunks.read_data(node, piece))
+
+    return stats
+
+
+class ScanPool:
+    """
+    Runs a scan of a dataset in a pool of processes, one partition
+    of the dataset at a time per process, and hands the partial
+    results back in the order of the partitions, to be combined by
+    the caller (e.g. with StreamingStatistics.merge).
+
+    The processes are spawned, rather than forked from a process
+    running threads which may hold the lock of h5py, when the first
+    scan starts, and are kept for the following scans.
+
+    Parameters
+    ----------
+    processes : INT, optional
+        The number of processes. By default one per core, but no
+        more than the memory_budget holds at PROCESS_BYTES each, as
+        the processes take memory besides that of the caches.
+    """
+    def __init__(self, processes=None):
+        self.processes = processes
+        self.executor = None
+        self.executor_processes = 0
+        self.lock = threading.Lock()
+
+    def process_count(self):
+        """
+        Returns the number of processes a scan would use
+        """
+        if self.processes:
+            return self.processes
+
+        return max(1, min(os.cpu_count() or 1, memory_budget.max_bytes // PROCESS_BYTES))
+
+    def supports(self, node):
+        """
+        Returns True if the dataset node is worth scanning in the
+        pool and can be opened by the processes, i.e. it is in a file
+        on disk read with the default driver.
+        """
+        return (self.process_count() > 1
+                and isinstance(node, h5py.Dataset)
+                and node.ndim > 0
+                and node.dtype.kind in 'biuf'
+                and node.size * node.dtype.itemsize >= MIN_SCAN_BYTES
+                and node.file.driver == 'sec2'
+                and os.path.isfile(node.file.filename))
+
+    def map(self, worker, node, fn, *args):
+        """
+        Runs fn(filename, swmr, path, sel, *args) in the processes
+        for each partition sel of the dataset node, reporting the
+        progress to worker as the partitions are done.
+
+        If the worker is cancelled, the partitions not started yet
+        are dropped and Cancelled is raised, see Worker.report.
+
+        Returns
+        -------
+        LIST
+            The results of fn, in the order of the partitions.
+
+        """
+        processes = self.process_count()
+
+        with self.lock:
+            # the budget may have changed since the processes started
+            if self.executor is not None and self.executor_processes != processes:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(processes,
+                                                    mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=init_process)
+                self.executor_processes = processes
+            executor = self.executor
+
+        sel = tuple([slice(None)] * node.ndim)
+        file = node.file
+
+        size = node.size * node.dtype.itemsize // (PARTITIONS_PER_PROCESS * processes)
+        size = min(PARTITION_BYTES, max(PIECE_BYTES, size))
+
+        futures = [executor.submit(fn, file.filename, file.swmr_mode, node.name, part, *args)
+                   for _, _, part in partition_selection(node, sel, size)]
+
+        try:
+            worker.report(0, len(futures))
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                worker.report(done, len(futures))
+
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        """
+        Stop the processes, dropping the partitions not started yet
+        """
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+# The pool shared by all the workers
+scan_pool = ScanPool()
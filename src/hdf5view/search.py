@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the search over the paths of the objects in an
+HDF5 file, using the paths listed by the MetadataIndex.
+"""
+
+import re
+
+import numpy as np
+
+
+SUBSTRING = 'Substring'
+GLOB = 'Glob'
+REGEX = 'Regex'
+
+MODES = (SUBSTRING, GLOB, REGEX)
+
+
+def glob_to_regex(pattern):
+    """
+    Translates a glob pattern into a regular expression matching a
+    path whose end, from the start of a name, matches the pattern.
+    So 'temp*' matches '/a/temp1' and '/a/*/b' matches '/a/x/b'.
+    """
+    parts = []
+    i = 0
+
+    while i < len(pattern):
+        c = pattern[i]
+
+        if c == '*':
+            parts.append('.*')
+
+        elif c == '?':
+            parts.append('.')
+
+        elif c == '[':
+            j = pattern.find(']', i + 2)
+            if j < 0:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append(f"[{body}]")
+                i = j
+
+        else:
+            parts.append(re.escape(c))
+
+        i += 1
+
+    return re.compile(f"(?s:(?:.*/)?{''.join(parts)})")
+
+
+def glob_literal(pattern):
+    """
+    Returns the longest part of a glob pattern without wildcards,
+    which any matching path must contain.
+    """
+    literals = re.split(r'\*|\?|\[[^\]]*\]', pattern)
+    return max(literals, key=len)
+
+
+class PathSearch:
+    """
+    Searches the paths of a MetadataIndex.
+
+    The paths are joined into one string, one path per line, so that
+    a search scans that string with str.find or a regular expression
+    rather than looping over the paths in python. The row of a hit is
+    found from the offsets of the lines. Glob patterns are matched
+    against the paths containing their longest literal part, and
+    regular expressions against the paths where a match starts, as
+    a match may span several lines.
+    """
+    def __init__(self, paths):
+        self.paths = paths
+        self.text = '\n'.join(paths)
+        self.lower_text = self.text.lower()
+
+        lengths = np.fromiter((len(p) + 1 for p in paths), dtype=np.int64, count=len(paths))
+        self.starts = np.zeros(len(paths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=self.starts[1:])
+
+    def row_at(self, pos):
+        return int(np.searchsorted(self.starts, pos, 'right')) - 1
+
+    def next_start(self, row):
+        """
+        Returns the offset of the path after row, or None
+        """
+        return int(self.starts[row + 1]) if row + 1 < len(self.starts) else None
+
+    def search(self, text, mode=SUBSTRING):
+        """
+        Returns a generator of the rows whose path matches text,
+        in order. The generator is lazy, so the hits can be taken
+        in batches while the user is typing. Raises re.error if
+        text is not a valid regular expression.
+
+        Substrings are matched ignoring case.
+        """
+        if mode == REGEX:
+            return self.search_regex(re.compile(text, re.MULTILINE))
+
+        if mode == GLOB:
+            pattern = glob_to_regex(text)
+            return self.search_literal(self.text, glob_literal(text),
+                                       lambda row: pattern.fullmatch(self.paths[row]))
+
+        return self.search_literal(self.lower_text, text.lower())
+
+    def search_literal(self, text, literal, accept=None):
+        pos = 0
+
+        while pos is not None:
+            if literal:
+                pos = text.find(literal, pos)
+                if pos < 0:
+                    return
+            row = self.row_at(pos)
+
+            if accept is None or accept(row):
+                yield row
+
+            pos = self.next_start(row)
+
+    def search_regex(self, pattern):
+        pos = 0
+
+        while pos is not None:
+            match = pattern.search(self.text, pos)
+            if match is None:
+                return
+            row = self.row_at(match.start())
+
+            # the match may run on into the paths after row
+            if pattern.search(self.paths[row]):
+                yield row
+
+            pos = self.next_start(row)
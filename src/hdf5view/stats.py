@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the classes used to compute statistics of a
+dataset while streaming over it, and to keep them between sessions,
+and the functions used to estimate the levels of images from samples.
+"""
+
+import json
+import math
+import os
+import sys
+
+from collections import OrderedDict
+
+import numpy as np
+
+from qtpy.QtCore import (
+    QStandardPaths,
+)
+
+
+class StreamingStatistics:
+    """
+    Accumulates the minimum, maximum, mean, standard deviation,
+    number of NaNs and a histogram of data given piece by piece.
+
+    The histogram has a fixed number of bins. Its range is set by
+    the first piece and doubled, merging pairs of bins, whenever a
+    later piece falls outside it, so the data never needs to be
+    read twice.
+
+    The mean and the sum of squared deviations are kept in units of
+    scale, a power of two about the largest magnitude seen, so that
+    they cannot overflow however large the values are.
+    """
+    BINS = 64
+
+    def __init__(self):
+        self.count = 0
+        self.nan_count = 0
+        self.minimum = None
+        self.maximum = None
+        self.scale = 1.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.hist = np.zeros(self.BINS, dtype=np.int64)
+        self.low = None
+        self.high = None
+
+    def update(self, data):
+        """
+        Add a piece of data
+        """
+        data = np.asarray(data, dtype=np.float64).ravel()
+
+        nan = np.isnan(data)
+        self.nan_count += int(nan.sum())
+        data = data[np.isfinite(data)]
+
+        if not data.size:
+            return
+
+        lo = float(data.min())
+        hi = float(data.max())
+
+        self.minimum = lo if self.minimum is None else min(self.minimum, lo)
+        self.maximum = hi if self.maximum is None else max(self.maximum, hi)
+
+        self.rescale(max(-lo, hi))
+        scaled = data / self.scale
+
+        # combine the mean and sum of squared deviations
+        # of the piece with those so far (Chan et al.)
+        n = data.size
+        mean = float(scaled.mean())
+        m2 = float(((scaled - mean) ** 2).sum())
+        delta = mean - self.mean
+        total = self.count + n
+
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+        self.update_histogram(scaled, lo, hi)
+
+    def merge(self, other):
+        """
+        Add the statistics of other, accumulated over other pieces of
+        the same dataset, e.g. by another process.
+
+        The bins of the histogram of other generally do not line up
+        with those of this one, so the count of each of its bins is
+        spread over the bins it overlaps.
+        """
+        if not other.count:
+            self.nan_count += other.nan_count
+            return
+
+        if not self.count:
+            nan_count = self.nan_count
+            self.__dict__.update(other.__dict__)
+            self.hist = other.hist.copy()
+            self.nan_count += nan_count
+            return
+
+        self.nan_count += other.nan_count
+
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+        self.rescale(other.scale)
+        ratio = other.scale / self.scale
+
+        delta = other.mean * ratio - self.mean
+        total = self.count + other.count
+
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 * ratio ** 2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+
+        self.extend_range(other.low, other.high)
+
+        # in units of scale, as high - low may not be a float
+        edges = np.linspace(self.low / self.scale, self.high / self.scale, self.BINS + 1)
+        other_edges = np.linspace(other.low / self.scale, other.high / self.scale, self.BINS + 1)
+
+        for c, a, b in zip(other.hist, other_edges[:-1], other_edges[1:]):
+            if c:
+                overlap = np.clip(np.minimum(edges[1:], b) - np.maximum(edges[:-1], a), 0, None)
+                share = np.floor(c * np.cumsum(overlap) / overlap.sum()).astype(np.int64)
+                share[-1] = c
+                self.hist += np.diff(share, prepend=0)
+
+    def rescale(self, magnitude):
+        """
+        Raise the scale, if needed, to the power of two at most
+        magnitude and above half of it. Dividing by a power of two
+        is exact, so the mean and m2 only change units.
+        """
+        if magnitude < 2 * self.scale and self.count:
+            return
+
+        # 2 ** 1023 rather than 2 ** 1024, which is not a float
+        scale = math.ldexp(1.0, math.frexp(magnitude)[1] - 1) if magnitude else 1.0
+
+        if self.count:
+            self.mean *= self.scale / scale
+            self.m2 *= (self.scale / scale) ** 2
+
+        self.scale = scale
+
+    def extend_range(self, lo, hi):
+        """
+        Double the range of the histogram, merging pairs of bins,
+        until it holds lo and hi. The range stops at the largest
+        float.
+        """
+        while lo < self.low or hi > self.high:
+            width = self.high - self.low
+            merged = self.hist.reshape(-1, 2).sum(axis=1)
+            self.hist[:] = 0
+
+            if lo < self.low:
+                self.low = max(self.low - width, -sys.float_info.max)
+                self.hist[self.BINS // 2:] = merged
+            else:
+                self.high = min(self.high + width, sys.float_info.max)
+                self.hist[:self.BINS // 2] = merged
+
+    def update_histogram(self, scaled, lo, hi):
+        """
+        Add a piece of data, in units of scale, with
+        the given minimum and maximum to the histogram
+        """
+        if self.low is None:
+            self.low, self.high = lo, hi
+
+            if hi == lo:
+                # a width the bins can divide, whatever the value
+                width = max(1.0, abs(lo) * 1e-6)
+                if lo > 0:
+                    self.low -= width
+                else:
+                    self.high += width
+
+        self.extend_range(lo, hi)
+
+        counts, _ = np.histogram(scaled, bins=self.BINS,
+                                 range=(self.low / self.scale, self.high / self.scale))
+        self.hist += counts
+
+    def result(self):
+        """
+        Returns the statistics as a dict of plain python
+        values, which can be stored as json.
+        """
+        std = (self.m2 / self.count) ** 0.5 * self.scale if self.count else None
+
+        return {
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': self.mean * self.scale if self.count else None,
+            'std': std,
+            'nan count': self.nan_count,
+            'histogram': {
+                'low': self.low,
+                'high': self.high,
+                'counts': self.hist.tolist(),
+            },
+        }
+
+
+class StatisticsCache:
+    """
+    Keeps the statistics of datasets in a json file in the
+    application data directory, so that they are shown at once
+    when a file is opened again.
+
+    The statistics are keyed by the absolute path of the file,
+    its size and modification time and the path of the dataset,
+    so they are recomputed if the file changes. At most
+    max_entries are kept, dropping the oldest first.
+
+    New statistics only mark the cache dirty, the file is written
+    by flush, which the main window calls on a timer and on close.
+    """
+    FILENAME = 'statistics.json'
+
+    def __init__(self, path=None, max_entries=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = None
+        self.dirty = False
+
+    def make_key(self, node):
+        """
+        Returns the key of the statistics of a dataset, or None
+        if the file cannot be found.
+        """
+        filename = os.path.abspath(node.file.filename)
+
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+
+        return f"{filename}|{st.st_size}|{st.st_mtime_ns}|{node.name}"
+
+    def get_path(self):
+        if self.path is None:
+            location = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+            self.path = os.path.join(location, self.FILENAME)
+
+        return self.path
+
+    def load(self):
+        if self.entries is not None:
+            return
+
+        try:
+            with open(self.get_path()) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.get_path()), exist_ok=True)
+            with open(self.get_path(), 'w') as f:
+                json.dump(self.entries, f)
+        except OSError:
+            pass
+
+        self.dirty = False
+
+    def flush(self):
+        """
+        Saves the statistics if any were stored since the last save
+        """
+        if self.dirty:
+            self.save()
+
+    def get(self, key):
+        """
+        Returns the statistics with the given key, or None
+        """
+        if key is None:
+            return None
+
+        self.load()
+        return self.entries.get(key)
+
+    def put(self, key, statistics):
+        """
+        Store statistics under the given key
+        """
+        if key is None:
+            return
+
+        self.load()
+        self.entries.pop(key, None)
+        self.entries[key] = statistics
+
+        for old in list(self.entries)[:-self.max_entries]:
+            del self.entries[old]
+
+        self.dirty = True
+
+
+def sample_array(array, size):
+    """
+    Returns a strided sample of about size elements of an image,
+    taking every n-th row and column.
+    """
+    if array.ndim < 2 or array.size <= size:
+        return array
+
+    step = int(np.ceil((array.size / size) ** 0.5))
+    return array[::step, ::step]
+
+
+def estimate_levels(sample, low=0.5, high=99.5, bins=256):
+    """
+    Estimates the levels of an image from a sample of its values.
+
+    Parameters
+    ----------
+    sample : numpy.ndarray
+        The sample, e.g. from sample_array.
+    low, high : FLOAT
+        The percentiles of the sample used as the levels.
+    bins : INT
+        The number of bins of the histogram.
+
+    Returns
+    -------
+    DICT
+        {'levels': (low, high), 'histogram': (centres, counts)},
+        or None if the sample has no finite values.
+
+    """
+    sample = np.asarray(sample, dtype=np.float64).ravel()
+    sample = sample[np.isfinite(sample)]
+
+    if not sample.size:
+        return None
+
+    lo, hi = np.percentile(sample, [low, high])
+    if hi <= lo:
+        hi = lo + 1.0
+
+    counts, edges = np.histogram(sample, bins=bins)
+
+    return {
+        'levels': (float(lo), float(hi)),
+        'histogram': ((edges[:-1] + edges[1:]) / 2, counts),
+    }
+
+
+class LevelsCache:
+    """
+    Keeps the levels estimated for the images of each dataset, see
+    estimate_levels, dropping the least recently used beyond
+    max_entries.
+    """
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def make_key(self, node):
+        return (node.file.filename, node.name)
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+# The statistics and levels caches shared by all the models
+statistics_cache = StatisticsCache()
+levels_cache = LevelsCache()
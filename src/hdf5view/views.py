@@ -4,9 +4,18 @@ This module contains the main HDF5 container widget and implementations
 of QAbstractItemView (ImageView and PlotView), which allow images
 and y(x) plots to be shown.
 """
+import os
+import re
+import time
+
+from functools import partial
+
 from qtpy.QtCore import (
     Qt,
     QModelIndex,
+    QRectF,
+    QTimer,
+    Signal,
 )
 
 from qtpy.QtGui import (
@@ -16,12 +25,18 @@ from qtpy.QtGui import (
 
 from qtpy.QtWidgets import (
     QAbstractItemView,
+    QApplication,
+    QCheckBox,
+    QComboBox,
+    QHBoxLayout,
     # QAction,
     QHeaderView,
     # QLabel,
+    QLineEdit,
+    QListView,
     # QMainWindow,
-    QMessageBox,
     QScrollBar,
+    QSplitter,
     QTableView,
     QTabBar,
     QTabWidget,
@@ -30,10 +45,11 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 
-import pyqtgraph as pg
-import psutil
 import h5py
+import pyqtgraph as pg
 
+from .cache import tile_cache
+from .indexing import IndexMapper
 from .models import (
     AttributesTableModel,
     DataTableModel,
@@ -42,6 +58,14 @@ from .models import (
     TreeModel,
     ImageModel,
     PlotModel,
+    SearchResultsModel,
+)
+from .metadata import metadata_cache
+from .search import MODES
+from .workers import (
+    DataLoader,
+    build_index,
+    build_search,
 )
 
 
@@ -50,23 +74,45 @@ from .models import (
 class HDF5Widget(QWidget):
     """
     Main HDF5 view container widget
+
+    build_metadata_index walks the whole file in the background, or
+    takes the index from the metadata_cache if the file was opened
+    before. index_ready is emitted when metadata_index has been set.
+
+    The paths of the index can then be searched from the search box
+    above the tree (tree_panel). The hits are listed as they are
+    found, and selecting one selects its node in the tree.
+
+    If the file was opened in SWMR mode, set_following polls the
+    dataset shown every FOLLOW_INTERVAL ms for the data appended by
+    the writer, which is added to the table, image or plot without
+    reading the data already shown again.
     """
+    index_ready = Signal()
+
+    FOLLOW_INTERVAL = 500
+
     def __init__(self, hdf):
         super().__init__()
 
         self.hdf = hdf
+        self.metadata_index = None
 
         self.image_views = {}
         self.plot_views = {}
 
+        # The tree, dataset, data, image and plot models read the
+        # file on a thread pool using this loader
+        self.loader = DataLoader()
+
         # Initialise the models
-        self.tree_model = TreeModel(self.hdf)
+        self.tree_model = TreeModel(self.hdf, loader=self.loader)
         self.attrs_model = AttributesTableModel(self.hdf)
-        self.dataset_model = DatasetTableModel(self.hdf)
+        self.dataset_model = DatasetTableModel(self.hdf, loader=self.loader)
         self.dims_model = DimsTableModel(self.hdf)
-        self.data_model = DataTableModel(self.hdf)
-        self.image_model = ImageModel(self.hdf)
-        self.plot_model = PlotModel(self.hdf)
+        self.data_model = DataTableModel(self.hdf, loader=self.loader)
+        self.image_model = ImageModel(self.hdf, loader=self.loader)
+        self.plot_model = PlotModel(self.hdf, loader=self.loader)
 
         # Set up the main file tree view
         self.tree_view = QTreeView(headerHidden=False)
@@ -77,14 +123,65 @@ class HDF5Widget(QWidget):
         self.tree_view.header().setSectionResizeMode(0, QHeaderView.Interactive)
         self.tree_view.header().resizeSection(0, 160)
         self.tree_view.header().setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        # only size the columns to the visible rows, whose columns are read first
+        self.tree_view.header().setResizeContentsPrecision(0)
         self.tree_view.header().setStretchLastSection(True)
 
+        # Set up the search box and results above the tree
+        self.search_model = SearchResultsModel()
+        self.path_search = None
+        self.search_hits = None
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('Search (indexing...)')
+        self.search_edit.setClearButtonEnabled(True)
+
+        self.search_mode = QComboBox()
+        self.search_mode.addItems(MODES)
+
+        self.search_view = QListView()
+        self.search_view.setModel(self.search_model)
+        self.search_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.search_view.setUniformItemSizes(True)
+        self.search_view.setVisible(False)
+
+        # Search once the user stops typing, and list the
+        # hits in batches so the gui stays responsive
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+
+        self.search_batch_timer = QTimer()
+        self.search_batch_timer.setInterval(0)
+
+        # Poll the dataset shown while following a file being
+        # written in SWMR mode
+        self.follow_timer = QTimer()
+        self.follow_timer.setInterval(self.FOLLOW_INTERVAL)
+
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.search_edit, 1)
+        search_layout.addWidget(self.search_mode)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.search_view)
+        splitter.addWidget(self.tree_view)
+
+        tree_layout = QVBoxLayout()
+        tree_layout.addLayout(search_layout)
+        tree_layout.addWidget(splitter)
+        tree_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.tree_panel = QWidget()
+        self.tree_panel.setLayout(tree_layout)
+
         # Setup attributes table view
         self.attrs_view = QTableView()
         self.attrs_view.setModel(self.attrs_model)
         self.attrs_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.attrs_view.horizontalHeader().setStretchLastSection(True)
         self.attrs_view.verticalHeader().hide()
+        self.attrs_view.doubleClicked.connect(self.handle_attrs_double_clicked)
 
         # Setup dataset table view
         self.dataset_view = QTableView()
@@ -124,15 +221,20 @@ class HDF5Widget(QWidget):
         # restored when the tab is changed
         self.tab_dims = {id(self.tabs.widget(0)) : list(self.dims_model.shape)}
 
-        # container to save the current node (selected node of the tree)
-        # for each tab so that it can be restored when the tab is changed.
+        # container to save the path of the current node (selected node
+        # of the tree) for each tab so that it can be restored when the
+        # tab is changed. Paths rather than indexes are kept, as the
+        # nodes of the tree are rebuilt when the metadata index resets it.
         self.tab_node = {}
 
-        # if loading a node would consume a larger fraction of the
-        # available memory than self.memory_ratio_limit, a warning
-        # dialog will appear so that the user can either opt to load
-        # the node or cancel loading.
-        self.memory_ratio_limit = 0.3
+        # Only the data, image or plot model behind the current tab is
+        # updated when the selection changes. The others are marked as
+        # stale here (model -> path) and updated when their tab is shown.
+        self.stale_models = {}
+
+        # True while handle_tab_changed restores the node of a tab,
+        # as the dims of the tab are restored (and loaded) just after.
+        self.restoring_tab = False
 
         # Finally, initialise the signals for the view
         self.init_signals()
@@ -149,15 +251,158 @@ class HDF5Widget(QWidget):
         self.tree_view.expanded.connect(self.tree_model.handle_expanded)
         self.tree_view.collapsed.connect(self.tree_model.handle_collapsed)
 
+        self.search_edit.textChanged.connect(self.handle_search_changed)
+        self.search_mode.currentIndexChanged.connect(self.handle_search_changed)
+        self.search_timer.timeout.connect(self.start_search)
+        self.search_batch_timer.timeout.connect(self.handle_search_batch)
+        self.search_view.activated.connect(self.handle_search_result_activated)
+        self.search_view.clicked.connect(self.handle_search_result_activated)
+        self.follow_timer.timeout.connect(self.handle_follow_timer)
+
         self.tabs.currentChanged.connect(self.handle_tab_changed)
         self.dims_model.dataChanged.connect(self.handle_dims_data_changed)
 
+        # Redraw the current image/plot when the loader has read it
+        self.image_model.data_loaded.connect(self.handle_image_loaded)
+        self.image_model.detail_loaded.connect(self.handle_image_detail_loaded)
+        self.image_model.levels_loaded.connect(self.handle_image_levels_loaded)
+        self.plot_model.data_loaded.connect(self.handle_plot_loaded)
+        self.plot_model.detail_loaded.connect(self.handle_plot_detail_loaded)
+
+
+    def build_metadata_index(self):
+        """
+        Build the MetadataIndex of the file on the loader. If the
+        metadata_cache has an index of the file, it is used at once
+        and checked against the file in the background.
+        """
+        key = metadata_cache.make_key(self.hdf.filename)
+        metadata_index = metadata_cache.get(key)
+
+        if metadata_index is not None:
+            self.set_metadata_index(metadata_index)
+            message = None
+        else:
+            message = f"Indexing {os.path.basename(self.hdf.filename)}"
+
+        self.loader.load(('index',),
+                         partial(self.handle_index_built, key),
+                         build_index,
+                         self.hdf,
+                         message=message)
+
+    def set_metadata_index(self, metadata_index, reset=False):
+        """
+        Use a MetadataIndex of the file for the tree and the search
+        """
+        self.metadata_index = metadata_index
+        self.tree_model.set_metadata_index(metadata_index, reset=reset)
+        self.index_ready.emit()
 
+        self.loader.load(('search',),
+                         self.set_path_search,
+                         build_search,
+                         metadata_index)
+
+    def handle_index_built(self, key, metadata_index):
+        """
+        Called with the MetadataIndex built by the loader. If the
+        index from the cache was out of date, the tree is filled
+        again from the new one.
+        """
+        if self.metadata_index is not None and self.metadata_index.matches(metadata_index):
+            return
+
+        metadata_cache.put(key, metadata_index)
+        self.set_metadata_index(metadata_index, reset=self.metadata_index is not None)
+
+    def set_path_search(self, path_search):
+        """
+        Called with the PathSearch built by the loader
+        """
+        self.path_search = path_search
+        self.search_model.clear(path_search.paths)
+        self.search_edit.setPlaceholderText('Search')
+        self.start_search()
+
+    def start_search(self):
+        """
+        Start searching the paths of the file for the text of
+        the search box.
+        """
+        self.search_batch_timer.stop()
+        self.search_hits = None
+        self.search_model.clear()
+        self.search_edit.setToolTip('')
+
+        text = self.search_edit.text()
+        self.search_view.setVisible(bool(text))
+
+        if not text or self.path_search is None:
+            return
+
+        try:
+            self.search_hits = self.path_search.search(text, self.search_mode.currentText())
+        except re.error as e:
+            self.search_edit.setToolTip(f"Invalid regular expression: {e}")
+            return
+
+        self.search_batch_timer.start()
+
+    def set_following(self, follow):
+        """
+        Start or stop following the data appended to the file.
+        Only a file opened in SWMR mode can be followed.
+        """
+        if follow and self.hdf.swmr_mode:
+            self.follow_timer.start()
+        else:
+            self.follow_timer.stop()
+
+    def is_following(self):
+        return self.follow_timer.isActive()
+
+    def copy_selection(self):
+        """
+        Copy the text of the cells selected in the table to the
+        clipboard, as tab separated lines. A selection made of
+        several ranges is copied as the rectangle enclosing them.
+        Returns False if the selection has too many cells.
+        """
+        if self.tabs.currentWidget() is not self.data_view:
+            return True
+
+        ranges = self.data_view.selectionModel().selection()
+
+        if ranges.isEmpty():
+            return True
+
+        top = min(r.top() for r in ranges)
+        left = min(r.left() for r in ranges)
+        bottom = max(r.bottom() for r in ranges)
+        right = max(r.right() for r in ranges)
+
+        if (bottom - top + 1) * (right - left + 1) > self.data_model.MAX_COPY_CELLS:
+            return False
+
+        QApplication.clipboard().setText(self.data_model.copy_text(top, left, bottom, right))
+        return True
+
+    def reformat(self):
+        """
+        Show the values again after the value_format has changed
+        """
+        self.data_model.reformat()
+        self.attrs_model.reformat()
 
     def close_file(self):
         """
         Close the hdf5 file and clean up
         """
+        self.search_timer.stop()
+        self.search_batch_timer.stop()
+        self.follow_timer.stop()
+        self.loader.cancel_all()
         for view in self.image_views:
             view.close()
         self.hdf.close()
@@ -177,17 +422,79 @@ class HDF5Widget(QWidget):
 
         elif isinstance(self.tabs.currentWidget(), ImageView):
             self.image_model.set_dims(self.dims_model.shape)
-            self.image_views[id_cw].update_image()
 
         elif isinstance(self.tabs.currentWidget(), PlotView):
             self.plot_model.set_dims(self.dims_model.shape)
-            self.plot_views[id_cw].update_plot()
 
         self.tab_dims[id_cw] = list(self.dims_model.shape)
 
 
 
 
+    def handle_follow_timer(self):
+        """
+        Refresh the dataset shown and bring the models up to date
+        with the data appended to it since the last refresh.
+        """
+        node = self.current_model().node
+
+        if not isinstance(node, h5py.Dataset):
+            return
+
+        # the models share the node, see get_node
+        shape = node.shape
+        node.refresh()
+
+        if node.shape != shape:
+            tile_cache.drop_partial_tiles(node)
+
+        self.dataset_model.update_shape()
+        self.current_model().update_shape()
+
+        widget = self.tabs.currentWidget()
+
+        if isinstance(widget, (ImageView, PlotView)):
+            widget.follow_frames()
+
+    def handle_search_changed(self):
+        """
+        Restart the timer starting the search
+        """
+        self.search_timer.start()
+
+    def handle_search_batch(self):
+        """
+        List the hits found in about 20 ms
+        """
+        rows = []
+        end = time.perf_counter() + 0.02
+
+        for row in self.search_hits:
+            rows.append(row)
+            if len(rows) % 100 == 0 and time.perf_counter() > end:
+                break
+        else:
+            self.search_batch_timer.stop()
+            self.search_hits = None
+
+        self.search_model.add_rows(rows)
+
+    def handle_search_result_activated(self, index):
+        """
+        Select the node of a search result in the tree
+        """
+        tree_index = self.tree_model.index_from_path(self.search_model.path(index.row()))
+
+        if tree_index.isValid():
+            self.tree_view.setCurrentIndex(tree_index)
+            self.tree_view.scrollTo(tree_index)
+
+    def handle_attrs_double_clicked(self, index):
+        """
+        Load the whole value of a large attribute
+        """
+        self.attrs_model.load_value(index.row())
+
     def handle_selection_changed(self, selected, deselected):
         """
         When selection changes on the tree view
@@ -195,23 +502,15 @@ class HDF5Widget(QWidget):
         refresh the data in the associated table
         views.
         """
-        index = selected.indexes()[0]
+        indexes = selected.indexes()
+
+        # e.g. a click on a link which cannot be resolved
+        if not indexes:
+            return
 
-        path = self.tree_model.itemFromIndex(index).data(Qt.UserRole)
+        index = indexes[0]
 
-        if isinstance(self.hdf[path], h5py.Dataset):
-            memory_ratio = self.calculate_memory_ratio(path)
-            continue_loading = self.check_node_size(memory_ratio, path)
-            if not continue_loading:
-                # user opts not to load node
-                if not deselected.isEmpty():
-                    index = deselected.indexes()[0]
-                else:
-                    index = QModelIndex()
-                self.tree_view.selectionModel().blockSignals(True)
-                self.tree_view.setCurrentIndex(index)
-                self.tree_view.selectionModel().blockSignals(False)
-                return
+        path = self.tree_model.path(index)
 
         self.attrs_model.update_node(path)
         self.attrs_view.scrollToTop()
@@ -225,23 +524,86 @@ class HDF5Widget(QWidget):
                                     )
         self.dims_view.scrollToTop()
 
-        self.data_model.update_node(path)
-        self.data_view.scrollToTop()
-
-        self.image_model.update_node(path)
-
-        self.plot_model.update_node(path)
+        self.update_models(path, load=not self.restoring_tab)
 
         id_cw = id(self.tabs.currentWidget())
         self.tab_dims[id_cw] = list(self.dims_model.shape)
-        self.tab_node[id_cw] = index
+        self.tab_node[id_cw] = path
+
+    def current_model(self):
+        """
+        Returns the data, image or plot model shown
+        by the current tab.
+        """
+        widget = self.tabs.currentWidget()
+
+        if isinstance(widget, ImageView):
+            return self.image_model
+
+        if isinstance(widget, PlotView):
+            return self.plot_model
+
+        return self.data_model
+
+    def update_models(self, path, load=True):
+        """
+        Update the model behind the current tab with the node at
+        path, and mark the other data models as stale so that they
+        cost no I/O until their tab is shown.
+        """
+        current = self.current_model()
+
+        for model in (self.data_model, self.image_model, self.plot_model):
+            if model is not current:
+                self.stale_models[model] = path
+
+        self.stale_models.pop(current, None)
+
+        if current is self.data_model:
+            self.data_model.update_node(path)
+            self.data_view.scrollToTop()
+        else:
+            current.update_node(path, load=load)
 
+    def handle_image_loaded(self):
+        """
+        Update the current image view when the
+        image model has finished loading.
+        """
+        if isinstance(self.tabs.currentWidget(), ImageView):
+            self.tabs.currentWidget().update_image()
+
+    def handle_image_detail_loaded(self):
+        """
+        Update the detail of the current image view when
+        the image model has read it.
+        """
         if isinstance(self.tabs.currentWidget(), ImageView):
-            self.image_views[id_cw].update_image()
+            self.tabs.currentWidget().update_detail()
 
+    def handle_image_levels_loaded(self):
+        """
+        Update the levels of the current image view when
+        the image model has estimated them.
+        """
+        if isinstance(self.tabs.currentWidget(), ImageView):
+            self.tabs.currentWidget().update_levels()
+
+    def handle_plot_loaded(self):
+        """
+        Update the current plot view when the
+        plot model has finished loading.
+        """
         if isinstance(self.tabs.currentWidget(), PlotView):
-            self.plot_views[id_cw].update_plot()
+            self.tabs.currentWidget().update_plot()
 
+    def handle_plot_detail_loaded(self):
+        """
+        Update the curve of the current plot view when
+        the plot model has read the visible range.
+        """
+        if isinstance(self.tabs.currentWidget(), PlotView):
+            self.tabs.currentWidget().update_detail()
 
 
     def handle_tab_changed(self):
@@ -250,11 +612,24 @@ class HDF5Widget(QWidget):
         when the tab is changed.
         """
         c_index = self.tree_view.currentIndex()
-        o_index = self.tab_node[id(self.tabs.currentWidget())]
+        o_index = self.tree_model.index_from_path(self.tab_node[id(self.tabs.currentWidget())])
         o_slice = list(self.tab_dims[id(self.tabs.currentWidget())])
 
-        if c_index != o_index:
+        if o_index.isValid() and c_index != o_index:
+            self.restoring_tab = True
             self.tree_view.setCurrentIndex(o_index)
+            self.restoring_tab = False
+
+        # bring the model of the tab up to date if the
+        # selection changed while another tab was shown
+        model = self.current_model()
+        path = self.stale_models.pop(model, None)
+
+        if path is not None:
+            if model is self.data_model:
+                model.update_node(path)
+            else:
+                model.update_node(path, load=False)
 
         self.dims_model.beginResetModel()
         self.dims_model.shape = o_slice
@@ -266,10 +641,10 @@ class HDF5Widget(QWidget):
         """
         Add a tab to view an image of a dataset in the hdf5 file.
         """
-        c_index = self.tab_node[id(self.tabs.currentWidget())]
-        path = self.tree_model.itemFromIndex(c_index).data(Qt.UserRole)
+        path = self.tab_node[id(self.tabs.currentWidget())]
         self.dims_model.update_node(path)
         self.image_model.update_node(path)
+        self.stale_models.pop(self.image_model, None)
 
         iv = ImageView(self.image_model, self.dims_model)
         iv.update_image()
@@ -278,8 +653,7 @@ class HDF5Widget(QWidget):
         self.image_views[id_iv] = iv
 
         self.tab_dims[id_iv] = list(self.dims_model.shape)
-        tree_index = self.tree_view.currentIndex()
-        self.tab_node[id_iv] = tree_index
+        self.tab_node[id_iv] = path
 
         index = self.tabs.addTab(self.image_views[id_iv], 'Image')
         self.tabs.blockSignals(True)
@@ -292,10 +666,10 @@ class HDF5Widget(QWidget):
         """
         Add a tab to view an plot of a dataset in the hdf5 file.
         """
-        c_index = self.tab_node[id(self.tabs.currentWidget())]
-        path = self.tree_model.itemFromIndex(c_index).data(Qt.UserRole)
+        path = self.tab_node[id(self.tabs.currentWidget())]
         self.dims_model.update_node(path, now_on_PlotView=True)
         self.plot_model.update_node(path)
+        self.stale_models.pop(self.plot_model, None)
 
         pv = PlotView(self.plot_model, self.dims_model)
         pv.update_plot()
@@ -305,8 +679,7 @@ class HDF5Widget(QWidget):
         self.plot_views[id_pv] = pv
 
         self.tab_dims[id_pv] = list(self.dims_model.shape)
-        tree_index = self.tree_view.currentIndex()
-        self.tab_node[id_pv] = tree_index
+        self.tab_node[id_pv] = path
 
         index = self.tabs.addTab(self.plot_views[id_pv], 'Plot')
         self.tabs.blockSignals(True)
@@ -327,97 +700,6 @@ class HDF5Widget(QWidget):
         widget.deleteLater()
 
 
-    def calculate_memory_ratio(self, path):
-        """
-        Finds a critical dimension, dim_crit, in bytes
-        for the dataset selected and then calculates
-        and returns memory_ratio: the ratio of dim_crit
-        to the available memory on the sytem.
-
-        Parameters
-        ----------
-        path : STR
-            Path to a dataset within self.hdf.
-
-        Returns
-        -------
-        memory_ratio : FLOAT
-            The ratio of the critical dimension of the
-            dataset selected, in bytes, to the available
-            memory on the sytem.
-
-
-        """
-        node = self.hdf[path]
-
-        if node.ndim in [0, 1, 2]:
-            dim_crit = node.nbytes
-        elif node.ndim > 2 and node.shape[-1] in [3, 4]:
-            size = node.shape[-3] * node.shape[-2] * node.shape[-1]
-            dim_crit = node[tuple([0] * node.ndim)].nbytes * size
-        else:
-            size = node.shape[-2] * node.shape[-1]
-            dim_crit = node[tuple([0] * node.ndim)].nbytes * size
-
-        memory_ratio = dim_crit / psutil.virtual_memory().free
-
-        return memory_ratio
-
-
-    def check_node_size(self, memory_ratio, path):
-        """
-        If memory_ratio > self.memory_ratio_limit, a
-        QMessageBox.warning will appear notifying the
-        user what percentage of available memory will
-        be consumed by loading the node. The user can
-        opt to continue loading the node, or cancel
-        and return to the previous selection in the
-        tree.
-
-        Parameters
-        ----------
-        memory_ratio : FLOAT
-            The ratio of the critical dimension of the
-            dataset selected, in bytes, to the available
-            memory on the sytem.
-        path : STR
-            Path to a dataset within self.hdf.
-
-        Returns
-        -------
-        bool
-            returns True if memory_ratio <= self.memory_ratio_limit
-            if memory_ratio > self.memory_ratio_limit:
-                returns True if the user presses "Yes"
-                on the dialog, opting to continue
-                loading the node.
-                returns False if the user presses "No"
-                on the dialog, opting to cancel loading
-                the node and return to the previous
-                selection in the tree.
-
-        """
-        if memory_ratio > self.memory_ratio_limit:
-            msg = f"Loading {path} would consume {int(100*memory_ratio):d}%"
-            msg1 = " of the available memory."
-            msg2 = "\nContinue to load?"
-
-            button = QMessageBox.warning(
-                self,
-                "Memory Warning",
-                "".join([msg, msg1, msg2]),
-                buttons=QMessageBox.Yes | QMessageBox.No,
-                defaultButton=QMessageBox.No,
-            )
-
-            if button == QMessageBox.Yes:
-                return True
-
-            return False
-
-        return True
-
-
 
 
 class ImageView(QAbstractItemView):
@@ -429,9 +711,16 @@ class ImageView(QAbstractItemView):
     provided which can also be used to scroll through the images
     in the first axis.
 
+    Large images are shown as an overview, see ImageModel. When the
+    view range changes, the visible part of the image is requested
+    in more detail and shown on top of the overview.
+
+    The levels are set from the estimate of the ImageModel rather
+    than from all the pixels of each frame, and its histogram is
+    shown next to the image. If "Lock levels" is checked the levels
+    are kept when scrolling through the frames.
+
     TODO: Axis selection
-          Min/Max scaling
-          Histogram
           Colour maps
     """
 
@@ -459,13 +748,43 @@ class ImageView(QAbstractItemView):
         self.viewbox.addItem(self.image_item)
         self.image_item.setOpts(axisOrder="row-major")
 
+        # Add image item for the detail of large images
+        self.detail_item = pg.ImageItem()
+        self.detail_item.setZValue(1)
+        self.detail_item.setVisible(False)
+        self.viewbox.addItem(self.detail_item)
+        self.detail_item.setOpts(axisOrder="row-major")
+
+        # Add histogram controlling the levels of the image. The
+        # histogram is set from the model rather than computed
+        # from each image.
+        self.histogram = pg.HistogramLUTItem()
+        self.histogram.setImageItem(self.image_item)
+        self.image_item.sigImageChanged.disconnect(self.histogram.imageChanged)
+        graphics_layout_widget.addItem(self.histogram)
+
+        # True while the levels are set programmatically
+        self.setting_levels = False
+
+        # Request the detail once the view range has settled
+        self.detail_timer = QTimer()
+        self.detail_timer.setSingleShot(True)
+        self.detail_timer.setInterval(100)
+
         # Create a scrollbar for moving through image frames
         self.scrollbar = QScrollBar(Qt.Horizontal)
 
+        self.lock_levels_box = QCheckBox('Lock levels')
+        self.lock_levels_box.setChecked(self.model().levels_locked)
+
+        bottom_layout = QHBoxLayout()
+        bottom_layout.addWidget(self.scrollbar, 1)
+        bottom_layout.addWidget(self.lock_levels_box)
+
         layout = QVBoxLayout()
 
         layout.addWidget(graphics_layout_widget)
-        layout.addWidget(self.scrollbar)
+        layout.addLayout(bottom_layout)
 
         layout.setSpacing(0)
         layout.setContentsMargins(0, 0, 0, 0)
@@ -478,10 +797,17 @@ class ImageView(QAbstractItemView):
     def init_signals(self):
         self.image_item.scene().sigMouseMoved.connect(self.handle_mouse_moved)
         self.scrollbar.valueChanged.connect(self.handle_scroll)
+        self.viewbox.sigRangeChanged.connect(self.handle_range_changed)
+        self.detail_timer.timeout.connect(self.request_detail)
+        self.histogram.sigLevelChangeFinished.connect(self.handle_levels_changed)
+        self.histogram.sigLevelsChanged.connect(self.handle_levels_changing)
+        self.lock_levels_box.toggled.connect(self.handle_lock_levels)
 
 
     def update_image(self):
         if isinstance(self.model().image_view, type(None)):
+            self.detail_item.setVisible(False)
+
             if self.viewbox.isVisible():
                 self.viewbox.setVisible(False)
 
@@ -492,7 +818,16 @@ class ImageView(QAbstractItemView):
 
             return
 
-        self.image_item.setImage(self.model().image_view)
+        image = self.model().image_view
+        step = self.model().image_step
+
+        levels, _ = self.model().image_levels()
+
+        self.image_item.setImage(image, autoLevels=False, levels=levels)
+        self.image_item.setRect(QRectF(0, 0, image.shape[1] * step, image.shape[0] * step))
+        self.update_levels()
+        self.update_detail()
+        self.detail_timer.start()
 
         if not self.viewbox.isVisible():
             self.viewbox.setVisible(True)
@@ -500,6 +835,12 @@ class ImageView(QAbstractItemView):
         if not self.scrollbar.isVisible():
             self.scrollbar.setVisible(True)
 
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        """
+        Set the range of the scrollbar to the frames of the dataset
+        """
         if self.model().ndim > 2:
             try:
                 if not self.scrollbar.isVisible():
@@ -523,6 +864,91 @@ class ImageView(QAbstractItemView):
             self.scrollbar.blockSignals(False)
 
 
+    def follow_frames(self):
+        """
+        Extend the scrollbar to the frames appended to the dataset,
+        moving to the last frame if it was shown.
+        """
+        if self.model().image_view is None or not self.scrollbar.isVisible():
+            return
+
+        at_end = self.scrollbar.value() == self.scrollbar.maximum()
+        self.update_scrollbar()
+
+        if at_end:
+            self.scrollbar.setValue(self.scrollbar.maximum())
+
+    def update_levels(self):
+        """
+        Set the levels and histogram from the model
+        """
+        if self.model().image_view is None:
+            return
+
+        levels, histogram = self.model().image_levels()
+
+        if levels is None:
+            return
+
+        self.setting_levels = True
+        self.histogram.plot.setData(*histogram)
+        self.histogram.setLevels(*levels)
+        self.setting_levels = False
+
+    def update_detail(self):
+        """
+        Show the detail_view of the model over the overview
+        """
+        detail = self.model().detail_view
+
+        if detail is None:
+            self.detail_item.setVisible(False)
+            return
+
+        self.detail_item.setImage(detail, autoLevels=False, levels=self.image_item.getLevels())
+        self.detail_item.setRect(QRectF(*self.model().detail_rect))
+        self.detail_item.setVisible(True)
+
+    def request_detail(self):
+        """
+        Request the visible part of a large image in more detail
+        """
+        if self.model().pyramid is None:
+            return
+
+        (x0, x1), (y0, y1) = self.viewbox.viewRange()
+        size = self.viewbox.size()
+
+        self.model().request_detail((y0, y1), (x0, x1), (size.height(), size.width()))
+
+    def handle_range_changed(self):
+        """
+        Restart the timer requesting the detail of large images
+        """
+        if self.model().pyramid is not None:
+            self.detail_timer.start()
+
+    def handle_levels_changing(self):
+        """
+        Keep the levels of the detail the same as of the overview
+        """
+        if self.detail_item.isVisible():
+            self.detail_item.setLevels(self.image_item.getLevels())
+
+    def handle_levels_changed(self):
+        """
+        Keep the levels set by the user when they are locked
+        """
+        if not self.setting_levels and self.model().levels_locked:
+            self.model().lock_levels(self.histogram.getLevels())
+
+    def handle_lock_levels(self, checked):
+        """
+        Lock or unlock the levels
+        """
+        self.model().levels_locked = checked
+        self.update_levels()
+
     def handle_scroll(self, value):
         """
         Change the image frame on scroll
@@ -539,10 +965,7 @@ class ImageView(QAbstractItemView):
         in the image scene.
         """
         if self.viewbox.isVisible():
-            try:
-                max_y, max_x = self.image_item.image.shape
-            except ValueError:
-                max_y, max_x = self.image_item.image.shape[:2]
+            max_y, max_x = self.model().row_count, self.model().column_count
 
             scene_pos = self.viewbox.mapSceneToView(pos)
 
@@ -550,7 +973,7 @@ class ImageView(QAbstractItemView):
             y = int(scene_pos.y())
 
             if 0 <= x < max_x and 0 <= y < max_y:
-                I = self.model().image_view[y,x]
+                I = self.model().value_at(y, x)
                 msg1 = f"X={x} Y={y}, value="
                 try:
                     msg2 = f"{I:.3e}"
@@ -584,6 +1007,10 @@ class PlotView(QAbstractItemView):
     an index or a second column of data in the same
     dataset.
 
+    Long traces are drawn as a line through the min/max envelope
+    computed by PlotModel. When the x range changes, the visible
+    range is requested in more detail.
+
     TODO: Multiplots
     """
     def __init__(self, model, dims_model):
@@ -621,11 +1048,20 @@ class PlotView(QAbstractItemView):
         self.pen = None
         self.symbolBrush = (0,0,255)
         self.symbolPen = 'k'
+        self.envelope_pen = pg.mkPen((0,0,255))
+        self.curve = None
+
+        # Request the detail once the view range has settled
+        self.detail_timer = QTimer()
+        self.detail_timer.setSingleShot(True)
+        self.detail_timer.setInterval(100)
+        self.detail_timer.timeout.connect(self.request_detail)
 
 
     def init_signals(self):
         self.plot_item.scene().sigMouseMoved.connect(self.handle_mouse_moved)
         self.scrollbar.valueChanged.connect(self.handle_scroll)
+        self.plot_item.getViewBox().sigXRangeChanged.connect(self.handle_range_changed)
 
 
     def update_plot(self):
@@ -666,6 +1102,12 @@ class PlotView(QAbstractItemView):
         if not self.scrollbar.isVisible():
             self.scrollbar.setVisible(True)
 
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        """
+        Set the range of the scrollbar to the frames of the dataset
+        """
         if not isinstance(self.model().dims[0], slice):
             try:
                 if not self.scrollbar.isVisible():
@@ -690,13 +1132,40 @@ class PlotView(QAbstractItemView):
             self.scrollbar.blockSignals(False)
 
 
+    def follow_frames(self):
+        """
+        Extend the scrollbar to the frames appended to the dataset,
+        moving to the last frame if it was shown.
+        """
+        if self.model().plot_view is None or not self.scrollbar.isVisible():
+            return
+
+        at_end = self.scrollbar.value() == self.scrollbar.maximum()
+        self.update_scrollbar()
+
+        if at_end:
+            self.scrollbar.setValue(self.scrollbar.maximum())
+
     def set_up_plot(self):
         c_n = self.model().compound_names
+        node = self.model().node
+        mapper = IndexMapper(node.shape, self.model().plot_dims()[:node.ndim])
 
-        if c_n:
+        self.curve = None
+
+        if self.model().decimated:
+            # plot the envelope of a long trace against the index
+            self.curve = self.plot_item.plot(self.model().plot_x,
+                                             self.model().plot_view,
+                                             pen=self.envelope_pen,
+                                             clear=True
+                                             )
+
+        elif c_n:
             if len(c_n) == 1:
                 # plot a single column of data against the index
-                self.plot_item.plot(self.model().plot_view[c_n[0]],
+                self.plot_item.plot(mapper.source_indices(0),
+                                    self.model().plot_view[c_n[0]],
                                     pen=self.pen,
                                     symbolBrush=self.symbolBrush,
                                     symbolPen=self.symbolPen,
@@ -713,6 +1182,16 @@ class PlotView(QAbstractItemView):
                                     clear=True
                                     )
 
+        elif self.model().plot_view.ndim == 1:
+            # plot the data against its index in the dataset
+            self.plot_item.plot(mapper.source_indices(0),
+                                self.model().plot_view,
+                                pen=self.pen,
+                                symbolBrush=self.symbolBrush,
+                                symbolPen=self.symbolPen,
+                                clear=True
+                                )
+
         else:
             self.plot_item.plot(self.model().plot_view,
                                 pen=self.pen,
@@ -722,8 +1201,6 @@ class PlotView(QAbstractItemView):
                                 )
 
         two_cols = self.model().column_count == 2
-        s_loc = [i if isinstance(j, slice) else -1 for i, j in enumerate(self.model().dims)]
-        s_idx = [i for i in s_loc if i != -1]
         if two_cols:
             # here we are plotting two columns of data against each other
             if c_n:
@@ -733,11 +1210,11 @@ class PlotView(QAbstractItemView):
                 x_label = f"{c_n[0]}{d_slice}"
                 y_label = f"{c_n[1]}{d_slice}"
             else:
-                q = list(range(self.model().node.shape[s_idx[1]]))[self.model().dims[s_idx[1]]]
+                col_axis = mapper.view_axes[1]
                 w_x = list(self.dims_model.shape)
-                w_x[s_idx[1]] = str(q[0])
+                w_x[col_axis] = mapper.label(1, 0)
                 w_y = list(self.dims_model.shape)
-                w_y[s_idx[1]] = str(q[1])
+                w_y[col_axis] = mapper.label(1, 1)
 
                 x_slice = f" [{', '.join(w_x)}]"
                 x_label = f"{self.model().node.name.split('/')[-1]}{x_slice}"
@@ -765,6 +1242,32 @@ class PlotView(QAbstractItemView):
                                 )
 
 
+    def update_detail(self):
+        """
+        Replace the data of the curve of a decimated trace
+        """
+        if self.model().decimated and self.curve is not None:
+            self.curve.setData(self.model().plot_x, self.model().plot_view)
+
+    def request_detail(self):
+        """
+        Request the visible range of a decimated trace
+        """
+        if not self.model().decimated:
+            return
+
+        vb = self.plot_item.getViewBox()
+        x_min, x_max = vb.viewRange()[0]
+
+        self.model().request_range(x_min, x_max, vb.width())
+
+    def handle_range_changed(self):
+        """
+        Restart the timer requesting the detail of a decimated trace
+        """
+        if self.model().decimated:
+            self.detail_timer.start()
+
     def handle_scroll(self, value):
         """
         Change the image frame on scroll
@@ -0,0 +1,671 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the classes used to read data from the HDF5 file
+on a thread pool, so that the gui stays responsive while large or
+compressed datasets are loaded.
+"""
+
+from collections import deque
+
+import h5py
+import numpy as np
+
+from qtpy.QtCore import (
+    QObject,
+    QRunnable,
+    QThreadPool,
+    Signal,
+)
+
+from .chunks import read_data
+from .indexing import (
+    PIECE_BYTES,
+    IndexMapper,
+    partition_selection,
+)
+from .metadata import (
+    KIND_DATASET,
+    KIND_DATATYPE,
+    KIND_GROUP,
+    KIND_LINK,
+    LINK_EXTERNAL,
+    LINK_HARD,
+    LINK_SOFT,
+    MetadataIndex,
+)
+from .scans import (
+    scan_pool,
+    scan_statistics,
+)
+from .search import PathSearch
+from .stats import (
+    StreamingStatistics,
+    estimate_levels,
+)
+
+
+# Number of values read_sample reads from a dataset
+SAMPLE_SIZE = 1 << 18
+
+
+class Cancelled(Exception):
+    """
+    Raised inside a worker when its job has been cancelled.
+    """
+
+
+class WorkerSignals(QObject):
+    """
+    Signals emitted by a Worker. A QRunnable is not a QObject,
+    so it cannot emit signals itself.
+    """
+    progress = Signal(object, int, int)
+    result = Signal(object, object)
+    error = Signal(object, object)
+    finished = Signal(object)
+
+
+class Worker(QRunnable):
+    """
+    Runs fn(worker, *args) on a thread of a QThreadPool.
+
+    fn can call worker.report(done, total) to report its progress.
+    If the worker has been cancelled, report raises Cancelled, so
+    the job stops at the next report and no result is emitted.
+    """
+    def __init__(self, key, fn, *args):
+        super().__init__()
+
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        """
+        Ask the job to stop at the next call to report
+        """
+        self.cancelled = True
+
+    def report(self, done, total):
+        """
+        Report the progress of the job and stop it if it has
+        been cancelled.
+        """
+        if self.cancelled:
+            raise Cancelled()
+        self.signals.progress.emit(self, done, total)
+
+    def run(self):
+        try:
+            result = self.fn(self, *self.args)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.signals.error.emit(self, e)
+        else:
+            if not self.cancelled:
+                self.signals.result.emit(self, result)
+        finally:
+            self.signals.finished.emit(self)
+
+
+class DataLoader(QObject):
+    """
+    Runs the reads of the models on a thread pool and publishes the
+    results back to the models on the gui thread.
+
+    Each job has a key. Starting a job cancels any job with the same
+    key, so e.g. selecting a new dataset abandons the read of the
+    previous one. Only the result of the latest job for a key is
+    passed to its callback.
+
+    Jobs started with a message are shown to the user: the progress
+    and busy signals are emitted for them, and they can be cancelled
+    with cancel_busy. Jobs without a message (e.g. reading a single
+    tile of a table or indexing the file) run silently, and are only
+    stopped by cancel_all.
+
+    job_done is emitted with the key of each job when it has
+    finished, failed or been cancelled.
+
+    If synchronous is True the jobs are run immediately on the
+    calling thread instead, which is useful when the models are used
+    without a gui.
+    """
+    progress = Signal(str, int)
+    busy = Signal(bool)
+    error = Signal(str)
+    job_done = Signal(object)
+
+    def __init__(self, pool=None, synchronous=False):
+        super().__init__()
+
+        self.pool = pool or QThreadPool.globalInstance()
+        self.synchronous = synchronous
+        self.jobs = {}
+
+    def load(self, key, callback, fn, *args, message=None):
+        """
+        Run fn(worker, *args) and pass its result to callback.
+
+        Parameters
+        ----------
+        key : HASHABLE
+            Identifies the job. Any running job with the same
+            key is cancelled.
+        callback : CALLABLE
+            Called with the result on the gui thread.
+        fn : CALLABLE
+            The function doing the work, see Worker.
+        *args :
+            Further arguments passed to fn.
+        message : STR, optional
+            Message shown to the user while the job runs.
+        """
+        self.cancel(key)
+
+        worker = Worker(key, fn, *args)
+
+        if self.synchronous:
+            callback(fn(worker, *args))
+            return
+
+        was_busy = self.is_busy()
+        self.jobs[key] = (worker, callback, message)
+
+        worker.signals.progress.connect(self.handle_progress)
+        worker.signals.result.connect(self.handle_result)
+        worker.signals.error.connect(self.handle_error)
+        worker.signals.finished.connect(self.handle_finished)
+
+        self.pool.start(worker)
+
+        if message:
+            self.progress.emit(message, 0)
+            if not was_busy:
+                self.busy.emit(True)
+
+    def is_busy(self):
+        """
+        Returns True if any job with a message is running
+        """
+        return any(job[2] for job in self.jobs.values())
+
+    def is_loading(self, key):
+        """
+        Returns True if the job with the given key is running
+        """
+        return key in self.jobs
+
+    def cancel(self, key):
+        """
+        Cancel the job with the given key, if any
+        """
+        job = self.jobs.pop(key, None)
+
+        if job is None:
+            return
+
+        worker = job[0]
+        worker.cancel()
+
+        try:
+            self.pool.tryTake(worker)
+        except AttributeError:
+            # QThreadPool.tryTake needs Qt >= 5.9
+            pass
+        except RuntimeError:
+            # the pool has already run and deleted the worker, e.g.
+            # when a job is restarted from the callback of its result
+            pass
+
+        self.job_done.emit(key)
+
+        if job[2] and not self.is_busy():
+            self.busy.emit(False)
+
+    def cancel_group(self, group):
+        """
+        Cancel all the jobs whose key is a tuple starting with group
+        """
+        for key in [k for k in self.jobs if isinstance(k, tuple) and k[0] == group]:
+            self.cancel(key)
+
+    def cancel_busy(self):
+        """
+        Cancel the jobs started with a message, e.g. when the user
+        cancels loading, leaving those running in the background
+        """
+        for key in [k for k, job in self.jobs.items() if job[2]]:
+            self.cancel(key)
+
+    def cancel_all(self):
+        """
+        Cancel all the jobs
+        """
+        for key in list(self.jobs):
+            self.cancel(key)
+
+    #
+    # Slots
+    #
+
+    def handle_progress(self, worker, done, total):
+        job = self.jobs.get(worker.key)
+
+        if job and job[0] is worker and job[2]:
+            percent = int(100 * done / total) if total else 100
+            self.progress.emit(job[2], percent)
+
+    def handle_result(self, worker, result):
+        job = self.jobs.get(worker.key)
+
+        if job and job[0] is worker:
+            job[1](result)
+
+    def handle_error(self, worker, e):
+        job = self.jobs.get(worker.key)
+
+        if job and job[0] is worker:
+            self.error.emit(f"{job[2] or 'Loading'} failed: {e}")
+
+    def handle_finished(self, worker):
+        job = self.jobs.get(worker.key)
+
+        if job and job[0] is worker:
+            self.jobs.pop(worker.key)
+            self.job_done.emit(worker.key)
+            if job[2] and not self.is_busy():
+                self.busy.emit(False)
+
+
+def iter_pieces(worker, node, sel):
+    """
+    Yields the selection sel of node in pieces along its first
+    sliced axis, reporting progress before each piece. The pieces
+    are whole multiples of the chunks of the dataset, if it has any.
+
+    Parameters
+    ----------
+    worker : Worker
+        The worker running the read.
+    node : h5py.Dataset
+        The dataset to read.
+    sel : TUPLE
+        Tuple of ints and/or slices, with one entry per axis.
+
+    Yields
+    ------
+    TUPLE
+        (start, stop, piece) where piece is the selection of the
+        positions start to stop along the first sliced axis.
+
+    """
+    length = len(IndexMapper(node.shape, sel).ranges[0])
+
+    for start, stop, piece in partition_selection(node, sel, PIECE_BYTES):
+        worker.report(start, length)
+        yield start, stop, piece
+
+    worker.report(length, length)
+
+
+def read_selection(worker, node, sel):
+    """
+    Reads node[sel] in pieces, reporting progress after each
+    piece, see iter_pieces. The chunks of each piece are
+    decompressed in parallel where possible, see read_data.
+
+    Parameters
+    ----------
+    worker : Worker
+        The worker running the read.
+    node : h5py.Dataset
+        The dataset to read.
+    sel : TUPLE
+        Tuple of ints and/or slices, with one entry per axis.
+
+    Returns
+    -------
+    numpy.ndarray
+        The same as node[sel].
+
+    """
+    sel = tuple(sel)
+    mapper = IndexMapper(node.shape, sel)
+
+    if not mapper.view_axes or len(sel) != node.ndim:
+        return node[sel]
+
+    out = np.empty(mapper.view_shape, dtype=node.dtype)
+
+    for start, stop, piece in iter_pieces(worker, node, sel):
+        read_data(node, piece, out[start:stop])
+
+    return out
+
+
+def read_fields(worker, node, sel, names):
+    """
+    As read_selection, but reads only the fields given by names
+    of a dataset with a compound dtype, so that HDF5 converts and
+    copies only those fields rather than whole records.
+    """
+    fields = node.fields(list(names))
+    sel = tuple(sel)
+    mapper = IndexMapper(node.shape, sel)
+
+    if not mapper.view_axes or len(sel) != node.ndim:
+        return fields[sel]
+
+    out = np.empty(mapper.view_shape, dtype=fields.read_dtype)
+
+    for start, stop, piece in iter_pieces(worker, node, sel):
+        out[start:stop] = fields[piece]
+
+    return out
+
+
+def read_tile(worker, node, sel, fields=None):
+    """
+    Reads one tile of a TileCache, see TileCache.tile_selection,
+    or only the given fields of it.
+    """
+    if fields:
+        return np.asarray(node.fields(list(fields))[sel])
+
+    return read_data(node, sel)
+
+
+def read_envelope(worker, node, sel, bins, field=None):
+    """
+    Reads node[sel], a selection with a single sliced axis, in
+    pieces and reduces it to the minimum and maximum of each of
+    (at most) bins bins of consecutive points, reporting progress
+    after each piece. Only one piece is held in memory at a time.
+
+    If the selection has no more than bins points, they are
+    returned as they are.
+
+    Parameters
+    ----------
+    worker : Worker
+        The worker running the read.
+    node : h5py.Dataset
+        The dataset to read.
+    sel : TUPLE
+        Tuple of ints and/or slices, with one entry per axis.
+    bins : INT
+        The number of bins, usually the width of the plot in pixels.
+    field : STR, optional
+        The field to read from a dataset with a compound dtype.
+
+    Returns
+    -------
+    TUPLE
+        (x, y) where x are the indices of the points along the sliced
+        axis of the dataset and y their values. When the data has been
+        reduced, each bin gives two points at the centre of the bin,
+        its minimum and its maximum.
+
+    """
+    sel = tuple(sel)
+    mapper = IndexMapper(node.shape, sel)
+
+    axis = mapper.view_axes[0]
+    r = mapper.ranges[0]
+    length = len(r)
+
+    size = -(-length // max(1, bins))
+
+    # Pieces are whole multiples of the bin size, so that
+    # no bin is split between two pieces
+    n = max(1, PIECE_BYTES // node.dtype.itemsize)
+    n = max(size, n - n % size)
+
+    xs = []
+    ys = []
+
+    for start in range(0, length, n):
+        worker.report(start, length)
+        stop = min(start + n, length)
+        piece = list(sel)
+        piece[axis] = slice(r[start], r[stop - 1] + 1, r.step)
+
+        if field is None:
+            data = read_data(node, tuple(piece))
+        else:
+            data = node.fields(field)[tuple(piece)]
+
+        if size == 1:
+            xs.append(np.asarray(r[start:stop]))
+            ys.append(data)
+            continue
+
+        # pad the last, partial bin with its last value
+        count = -(-len(data) // size)
+        padded = np.empty(count * size, dtype=data.dtype)
+        padded[:len(data)] = data
+        padded[len(data):] = data[-1]
+        padded = padded.reshape(count, size)
+
+        first = start + size * np.arange(count)
+        last = np.minimum(first + size, stop) - 1
+        centre = r.start + r.step * (first + last) / 2
+
+        xs.append(np.repeat(centre, 2))
+        ys.append(np.column_stack([np.fmin.reduce(padded, axis=1),
+                                   np.fmax.reduce(padded, axis=1)]).ravel())
+
+    worker.report(length, length)
+
+    if not xs:
+        return np.empty(0), np.empty(0, dtype=node.dtype if field is None else node.dtype[field])
+
+    return np.concatenate(xs), np.concatenate(ys)
+
+
+def read_statistics(worker, node):
+    """
+    Computes the statistics of a numeric dataset, reading it in
+    pieces so that only one piece is held in memory at a time.
+    Large datasets are scanned in parallel by the scan_pool.
+
+    Returns
+    -------
+    DICT
+        See StreamingStatistics.result.
+
+    """
+    stats = StreamingStatistics()
+
+    if node.ndim == 0:
+        stats.update(np.asarray(node[()]))
+        return stats.result()
+
+    if scan_pool.supports(node):
+        for part in scan_pool.map(worker, node, scan_statistics):
+            stats.merge(part)
+        return stats.result()
+
+    sel = tuple([slice(None)] * node.ndim)
+
+    for _, _, piece in iter_pieces(worker, node, sel):
+        stats.update(read_data(node, piece))
+
+    return stats.result()
+
+
+def read_sample(worker, node, size=SAMPLE_SIZE):
+    """
+    Estimates the levels of the images of a dataset from a sample of
+    about size values, see estimate_levels. For a chunked dataset the
+    sample is whole chunks evenly spread over the dataset, otherwise
+    every n-th value along each axis.
+    """
+    if node.chunks:
+        grid = [-(-s // c) for s, c in zip(node.shape, node.chunks)]
+        n_chunks = int(np.prod(grid))
+        count = max(1, min(n_chunks, size // int(np.prod(node.chunks))))
+
+        parts = []
+        for k, flat in enumerate(np.linspace(0, n_chunks - 1, count).astype(np.int64)):
+            worker.report(k, count)
+            index = np.unravel_index(flat, grid)
+            parts.append(node[tuple(slice(i * c, (i + 1) * c)
+                                    for i, c in zip(index, node.chunks))].ravel())
+
+        worker.report(count, count)
+        sample = np.concatenate(parts)
+
+    else:
+        step = max(1, int(np.ceil((node.size / size) ** (1 / node.ndim))))
+        sample = node[tuple([slice(None, None, step)] * node.ndim)]
+
+    return estimate_levels(sample)
+
+
+def read_tree_nodes(worker, hdf, paths):
+    """
+    Reads the columns of the TreeModel for the objects with the
+    given paths.
+
+    Parameters
+    ----------
+    worker : Worker
+        The worker running the read.
+    hdf : h5py.File
+        The file containing the objects.
+    paths : LIST
+        The paths of the objects.
+
+    Returns
+    -------
+    LIST
+        A tuple (kind, number of attributes, shape, dtype, storage
+        size, number of members) for each path. Links which cannot
+        be resolved are of kind KIND_LINK.
+
+    """
+    columns = []
+
+    for i, path in enumerate(paths):
+        worker.report(i, len(paths))
+        name = path.encode('utf-8', 'surrogateescape')
+
+        try:
+            info = h5py.h5o.get_info(hdf.id, name)
+        except (KeyError, RuntimeError, OSError):
+            columns.append((KIND_LINK, 0, '', '', 0, 0))
+            continue
+
+        if info.type == h5py.h5o.TYPE_GROUP:
+            gid = h5py.h5g.open(hdf.id, name)
+            columns.append((KIND_GROUP, info.num_attrs, '', '', 0, len(gid)))
+
+        elif info.type == h5py.h5o.TYPE_DATASET:
+            did = h5py.h5d.open(hdf.id, name)
+            columns.append((KIND_DATASET, info.num_attrs, str(did.shape), str(did.dtype),
+                            did.get_storage_size(), 0))
+
+        else:
+            tid = h5py.h5t.open(hdf.id, name)
+            columns.append((KIND_DATATYPE, info.num_attrs, '', str(tid.dtype), 0, 0))
+
+    return columns
+
+
+def build_index(worker, hdf):
+    """
+    Builds the MetadataIndex of a file.
+
+    The groups are walked one at a time, breadth first, using the low
+    level api of h5py, rather than with a single call to visititems,
+    which would hold the lock of h5py for the whole walk and block the
+    gui. Progress is reported every 1000 objects, against the number
+    of objects in the groups walked so far.
+
+    Parameters
+    ----------
+    worker : Worker
+        The worker running the walk.
+    hdf : h5py.File
+        The file to index.
+
+    Returns
+    -------
+    MetadataIndex
+
+    """
+    index = MetadataIndex()
+
+    root = index.add('/', -1, KIND_GROUP, LINK_HARD, attrs=len(hdf.attrs))
+    queue = deque([root])
+    seen = {h5py.h5o.get_info(hdf.id).addr}
+
+    done = 0
+    total = 0
+
+    while queue:
+        row = queue.popleft()
+        path = index.paths[row]
+        gid = h5py.h5g.open(hdf.id, path.encode('utf-8', 'surrogateescape'))
+        prefix = path if path == '/' else path + '/'
+
+        total += len(gid)
+
+        index.first_child[row] = len(index)
+
+        for name in gid:
+            child_path = prefix + name.decode('utf-8', 'surrogateescape')
+            link_type = gid.links.get_info(name).type
+
+            if link_type == h5py.h5l.TYPE_SOFT:
+                index.add(child_path, row, KIND_LINK, LINK_SOFT)
+
+            elif link_type != h5py.h5l.TYPE_HARD:
+                index.add(child_path, row, KIND_LINK, LINK_EXTERNAL)
+
+            else:
+                info = h5py.h5o.get_info(gid, name)
+
+                if info.type == h5py.h5o.TYPE_GROUP:
+                    child = index.add(child_path, row, KIND_GROUP, LINK_HARD,
+                                      attrs=info.num_attrs)
+
+                    if info.addr not in seen:
+                        seen.add(info.addr)
+                        queue.append(child)
+
+                elif info.type == h5py.h5o.TYPE_DATASET:
+                    did = h5py.h5d.open(gid, name)
+                    index.add(child_path, row, KIND_DATASET, LINK_HARD,
+                              shape=str(did.shape),
+                              dtype=str(did.dtype),
+                              attrs=info.num_attrs,
+                              storage=did.get_storage_size())
+
+                else:
+                    tid = h5py.h5t.open(gid, name)
+                    index.add(child_path, row, KIND_DATATYPE, LINK_HARD,
+                              dtype=str(tid.dtype),
+                              attrs=info.num_attrs)
+
+            done += 1
+            if done % 1000 == 0:
+                worker.report(done, total)
+
+        index.child_count[row] = len(index) - index.first_child[row]
+
+    worker.report(done, total)
+
+    return index
+
+
+def build_search(worker, index):
+    """
+    Builds the PathSearch over the paths of a MetadataIndex
+    """
+    return PathSearch(index.paths)
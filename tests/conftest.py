@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    import qtpy
+    os.environ.setdefault('PYQTGRAPH_QT_LIB', qtpy.API_NAME)
+
+    from qtpy.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
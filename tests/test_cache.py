@@ -0,0 +1,100 @@
+import h5py
+import numpy as np
+import pytest
+
+from hdf5view.cache import (
+    TileCache,
+    normalize_selection,
+    relative_index,
+)
+
+
+@pytest.fixture
+def node(tmp_path):
+    with h5py.File(tmp_path / 'test.h5', 'w') as f:
+        f.create_dataset('d', data=np.arange(64 * 64, dtype='f8').reshape(64, 64),
+                         chunks=(16, 16))
+
+    with h5py.File(tmp_path / 'test.h5', 'r') as f:
+        yield f['d']
+
+
+def test_tiles_are_chunks(node):
+    cache = TileCache()
+
+    assert tuple(cache.tile_shape(node)) == (16, 16)
+    assert cache.tile_index(node, (17, 63)) == (1, 3)
+    assert cache.tile_index(node, (-1, 0)) == (3, 0)
+    assert np.array_equal(cache.get_tile(node, (1, 3)), node[16:32, 48:64])
+
+
+def test_get_value(node):
+    cache = TileCache()
+
+    assert cache.get_value(node, (5, 7), read=False) is None
+    assert cache.get_value(node, (5, 7)) == node[5, 7]
+    assert cache.get_value(node, (-1, -1)) == node[63, 63]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    assert cache.get_value(node, (6, 8), read=False) == node[6, 8]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_missing_tiles(node):
+    cache = TileCache()
+    sel = (slice(10, 20), slice(None))
+
+    assert cache.tiles_for(node, sel) == [(i, j) for i in range(2) for j in range(4)]
+
+    cache.get_tile(node, (0, 1))
+    assert (0, 1) not in cache.missing_tiles(node, sel)
+    assert len(cache.missing_tiles(node, sel)) == 7
+
+
+def test_evicts_least_recently_used(node):
+    tile_bytes = 16 * 16 * 8
+    cache = TileCache(max_bytes=2 * tile_bytes)
+
+    cache.get_tile(node, (0, 0))
+    cache.get_tile(node, (0, 1))
+    cache.get_tile(node, (0, 0))
+    cache.get_tile(node, (0, 2))
+
+    assert cache.nbytes == 2 * tile_bytes
+    assert cache.lookup(node, (0, 1)) is None
+    assert cache.lookup(node, (0, 0)) is not None
+
+    cache.set_max_bytes(tile_bytes)
+    assert cache.nbytes == tile_bytes
+
+    cache.forget(node.file.filename)
+    assert cache.nbytes == 0
+
+
+@pytest.mark.parametrize('inner, expected', [
+    ((slice(None), slice(None)), (slice(0, 64, 1), slice(0, 64, 1))),
+    ((slice(2, 5), 3), (slice(2, 5, 1), 3)),
+    ((slice(0, 64, 4), slice(None)), (slice(0, 61, 4), slice(0, 64, 1))),
+    ((slice(10, 10), 0), (slice(0, 0), 0)),
+])
+def test_relative_index(inner, expected):
+    shape = (64, 64)
+    outer = normalize_selection(shape, (slice(None), slice(None)))
+
+    index = relative_index(outer, normalize_selection(shape, inner))
+    assert index == expected
+
+    data = np.arange(64 * 64).reshape(shape)
+    assert np.array_equal(data[index], data[inner])
+
+
+@pytest.mark.parametrize('inner', [
+    (slice(None, None, -1), slice(None)),
+    (slice(3, 1, -1), slice(None)),
+    (slice(None), slice(None, None, -2)),
+])
+def test_relative_index_reversed(inner):
+    shape = (64, 64)
+    outer = normalize_selection(shape, (slice(None), slice(None)))
+
+    assert relative_index(outer, normalize_selection(shape, inner)) is None
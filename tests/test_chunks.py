@@ -0,0 +1,97 @@
+import zlib
+
+import h5py
+import numpy as np
+import pytest
+
+from hdf5view import chunks
+from hdf5view.chunks import ChunkReader
+
+
+SELECTIONS = [
+    (slice(None), slice(None)),
+    (slice(3, 50), slice(7, 8)),
+    (slice(0, 64, 9), slice(1, 60, 3)),
+    (5, slice(None)),
+    (slice(10, 10), slice(None)),
+]
+
+
+@pytest.fixture
+def hdf(tmp_path):
+    data = np.arange(64 * 64, dtype='f4').reshape(64, 64)
+
+    with h5py.File(tmp_path / 'test.h5', 'w') as f:
+        f.create_dataset('gzip', data=data, chunks=(8, 8), compression='gzip')
+        f.create_dataset('shuffle', data=data, chunks=(8, 8), compression='gzip', shuffle=True)
+        f.create_dataset('lzf', data=data, chunks=(8, 8), compression='lzf')
+        f.create_dataset('sparse', shape=(64, 64), chunks=(8, 8), dtype='i4',
+                         compression='gzip', fillvalue=-1)[:8, :8] = 1
+
+        # a chunk written without the gzip filter
+        d = f.create_dataset('masked', shape=(64,), chunks=(16,), dtype='i4', compression='gzip')
+        d[:] = np.arange(64)
+        d.id.write_direct_chunk((16,), np.arange(100, 116, dtype='i4').tobytes(), filter_mask=1)
+
+        d = f.create_dataset('corrupt', data=data, chunks=(8, 8), compression='gzip')
+        d.id.write_direct_chunk((8, 8), b'not gzip')
+
+    with h5py.File(tmp_path / 'test.h5', 'r') as f:
+        yield f
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+@pytest.mark.parametrize('name', ['gzip', 'shuffle', 'sparse'])
+@pytest.mark.parametrize('sel', SELECTIONS)
+def test_read(hdf, threads, name, sel):
+    node = hdf[name]
+    data = ChunkReader(threads).read(node, sel)
+
+    assert data.dtype == node.dtype
+    assert np.array_equal(data, node[sel])
+
+
+def test_read_masked(hdf):
+    node = hdf['masked']
+    assert np.array_equal(ChunkReader(4).read(node, (slice(None),)), node[:])
+
+
+def test_supports(hdf):
+    reader = ChunkReader(4)
+
+    assert reader.supports(hdf['gzip'])
+    assert reader.supports(hdf['shuffle'])
+    assert not reader.supports(hdf['lzf'])
+    assert not ChunkReader(1).supports(hdf['gzip'])
+
+
+@pytest.mark.parametrize('sel', SELECTIONS)
+def test_chunk_count(hdf, sel):
+    node = hdf['gzip']
+    expected = len({(i // 8, j // 8)
+                    for i in np.arange(64)[sel[0]].reshape(-1)
+                    for j in np.arange(64)[sel[1]].reshape(-1)})
+
+    assert ChunkReader(4).chunk_count(node, sel) == expected
+
+
+def test_read_error(hdf):
+    reader = ChunkReader(4)
+
+    with pytest.raises(zlib.error):
+        reader.read(hdf['corrupt'], (slice(None), slice(None)))
+
+    assert reader.executor._work_queue.empty()
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_read_data(hdf, monkeypatch, threads):
+    monkeypatch.setattr(chunks, 'chunk_reader', ChunkReader(threads))
+
+    for name in ['gzip', 'lzf']:
+        node = hdf[name]
+        out = np.empty((64, 64), dtype=node.dtype)
+
+        assert np.array_equal(chunks.read_data(node, (slice(None), slice(None))), node[:])
+        assert chunks.read_data(node, (slice(None), slice(None)), out) is out
+        assert np.array_equal(out, node[:])
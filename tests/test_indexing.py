@@ -0,0 +1,97 @@
+import itertools
+
+import h5py
+import numpy as np
+import pytest
+
+from hdf5view.indexing import (
+    estimate_read,
+    partition_selection,
+    split_selection,
+)
+
+
+SELECTIONS = [
+    (slice(None), slice(None)),
+    (slice(3, 50), slice(7, 8)),
+    (slice(0, 64, 9), slice(1, 60, 3)),
+    (5, slice(None)),
+    (slice(None), 63),
+    (slice(10, 10), slice(None)),
+]
+
+
+@pytest.fixture
+def hdf(tmp_path):
+    with h5py.File(tmp_path / 'test.h5', 'w') as f:
+        data = np.arange(64 * 64, dtype='f8').reshape(64, 64)
+        f.create_dataset('chunked', data=data, chunks=(8, 16), compression='gzip')
+        f.create_dataset('contiguous', data=data)
+
+    with h5py.File(tmp_path / 'test.h5', 'r') as f:
+        yield f
+
+
+@pytest.mark.parametrize('sel', SELECTIONS)
+def test_split_selection(sel):
+    data = np.arange(64 * 64).reshape(64, 64)
+    blocks = (8, 16)
+
+    pieces, out_shape = split_selection(data.shape, blocks, sel)
+    assert tuple(out_shape) == data[sel].shape
+
+    out = np.full(out_shape, -1)
+
+    for combo in itertools.product(*pieces):
+        block = tuple(slice(p[0] * b, (p[0] + 1) * b) for p, b in zip(combo, blocks))
+        local = tuple(p[1] for p in combo)
+        out_key = tuple(p[2] for p in combo if p[2] is not None)
+        out[out_key] = data[block][local]
+
+    assert np.array_equal(out, data[sel])
+
+
+@pytest.mark.parametrize('name', ['chunked', 'contiguous'])
+@pytest.mark.parametrize('sel', [s for s in SELECTIONS if s[0] != 5])
+def test_partition_selection(hdf, name, sel):
+    node = hdf[name]
+    expected = node[sel]
+
+    parts = partition_selection(node, sel, 8 * 64 * 8)
+    pieces = [node[piece] for _, _, piece in parts]
+
+    if node.chunks:
+        # all but the last piece hold whole chunks
+        per_chunk = max(1, node.chunks[0] // sel[0].indices(64)[2])
+        for start, stop, _ in parts[:-1]:
+            assert (stop - start) % per_chunk == 0
+
+    assert sum(stop - start for start, stop, _ in parts) == len(expected)
+    if pieces:
+        assert np.array_equal(np.concatenate(pieces), expected)
+
+
+def test_partition_selection_reversed(hdf):
+    with pytest.raises(ValueError):
+        partition_selection(hdf['chunked'], (slice(None, None, -1), slice(None)), 8 * 64 * 8)
+
+
+@pytest.mark.parametrize('sel', SELECTIONS)
+def test_estimate_read(hdf, sel):
+    node = hdf['chunked']
+    estimate = estimate_read(node, sel)
+
+    pieces, _ = split_selection(node.shape, node.chunks, sel)
+    chunks = int(np.prod([len(p) for p in pieces]))
+
+    assert estimate['bytes'] == node[sel].nbytes
+    assert estimate['chunks'] == chunks
+    assert estimate['read bytes'] == chunks * 8 * 16 * 8
+
+
+def test_estimate_read_contiguous(hdf):
+    estimate = estimate_read(hdf['contiguous'], (slice(0, 4),))
+
+    assert estimate['bytes'] == 4 * 64 * 8
+    assert estimate['chunks'] == 0
+    assert estimate['read bytes'] == estimate['bytes']
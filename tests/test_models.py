@@ -0,0 +1,66 @@
+import h5py
+import numpy as np
+import pytest
+
+from qtpy.QtCore import Qt
+
+from hdf5view.models import (
+    DataTableModel,
+    DimsTableModel,
+    get_dims_from_str,
+)
+
+
+@pytest.fixture
+def hdf(tmp_path):
+    with h5py.File(tmp_path / 'test.h5', 'w') as f:
+        f['image'] = np.zeros((20, 30))
+
+    with h5py.File(tmp_path / 'test.h5', 'r') as f:
+        yield f
+
+
+def test_get_dims_from_str():
+    assert get_dims_from_str(('2:6:2', ':', '2', '-1')) == (slice(2, 6, 2), slice(None), 2, -1)
+
+    for value in ('::0', '::-1', '5:1:-2'):
+        with pytest.raises(ValueError):
+            get_dims_from_str((value, ':'))
+
+
+@pytest.mark.parametrize('value, ok', [
+    ('1:5:2', True),
+    ('5', True),
+    ('20', False),
+    ('::0', False),
+    ('::-1', False),
+    ('1:2:3:4', False),
+    ('a:b', False),
+])
+def test_set_dims(qapp, hdf, value, ok):
+    model = DimsTableModel(hdf)
+    model.update_node('/image')
+
+    assert model.setData(model.index(0, 0), value, Qt.EditRole) == ok
+    assert model.shape[0] == (value if ok else ':')
+
+
+def test_describe_bad_dims(qapp, hdf):
+    model = DimsTableModel(hdf)
+    model.update_node('/image')
+
+    assert model.index(0, 1).data(Qt.ToolTipRole)
+
+    model.shape[0] = '::0'
+    assert model.index(0, 0).data(Qt.ToolTipRole) is None
+    assert model.index(0, 1).data(Qt.ToolTipRole) is None
+
+
+def test_strings_size():
+    strings = np.empty(4, dtype=object)
+    strings[:] = ['x' * 1000, 'y', '', 'z' * 10]
+    size = DataTableModel.strings_size(strings)
+
+    # not the 8 bytes per cell of the pointers
+    assert size >= 1011 > strings.nbytes
+    assert size == DataTableModel.strings_size(strings.astype(str))
@@ -0,0 +1,34 @@
+import pytest
+
+from hdf5view.search import (
+    GLOB,
+    REGEX,
+    SUBSTRING,
+    PathSearch,
+)
+
+
+PATHS = ['/', '/entry', '/entry/data', '/entry/Temp1', '/other', '/other/temp2']
+
+
+@pytest.mark.parametrize('text, mode, rows', [
+    ('temp', SUBSTRING, [3, 5]),
+    ('ENTRY', SUBSTRING, [1, 2, 3]),
+    ('temp*', GLOB, [5]),
+    ('/entry/*', GLOB, [2, 3]),
+    ('[Tt]emp?', GLOB, [3, 5]),
+    (r'temp\d$', REGEX, [5]),
+    ('^/other', REGEX, [4, 5]),
+])
+def test_search(text, mode, rows):
+    assert list(PathSearch(PATHS).search(text, mode)) == rows
+
+
+@pytest.mark.parametrize('text, rows', [
+    (r'data\s/entry', []),
+    ('(?s)data.*other', []),
+    (r'Temp1[^x]+other', []),
+    (r'[^x]+temp2', [5]),
+])
+def test_regex_within_paths(text, rows):
+    assert list(PathSearch(PATHS).search(text, REGEX)) == rows
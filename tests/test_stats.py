@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from hdf5view.stats import StatisticsCache, StreamingStatistics
+
+
+def accumulate(pieces):
+    stats = StreamingStatistics()
+    for piece in pieces:
+        stats.update(piece)
+    return stats
+
+
+@pytest.mark.parametrize('data', [
+    np.arange(1000.0),
+    np.random.default_rng(0).standard_normal(10000),
+    np.full(10, 3.0),
+])
+def test_update(data):
+    result = accumulate(np.array_split(data, 7)).result()
+
+    assert result['min'] == data.min()
+    assert result['max'] == data.max()
+    assert result['mean'] == pytest.approx(data.mean())
+    assert result['std'] == pytest.approx(data.std(), abs=1e-12)
+    assert sum(result['histogram']['counts']) == data.size
+
+
+def test_nans():
+    result = accumulate([[1.0, np.nan], [np.nan, 3.0, np.inf]]).result()
+
+    assert result['nan count'] == 2
+    assert result['mean'] == 2.0
+    assert sum(result['histogram']['counts']) == 2
+
+
+def test_merge():
+    data = np.random.default_rng(1).standard_normal(10000) * 5 + 100
+    parts = np.array_split(data, 4)
+
+    stats = StreamingStatistics()
+    for part in parts:
+        stats.merge(accumulate(np.array_split(part, 3)))
+
+    result = stats.result()
+    whole = accumulate(parts).result()
+
+    assert result['min'] == whole['min']
+    assert result['max'] == whole['max']
+    assert result['mean'] == pytest.approx(whole['mean'])
+    assert result['std'] == pytest.approx(whole['std'])
+    assert sum(result['histogram']['counts']) == data.size
+
+
+def test_merge_empty():
+    stats = accumulate([[np.nan]])
+    stats.merge(accumulate([[1.0, 2.0]]))
+    stats.merge(accumulate([[np.nan, np.nan]]))
+
+    result = stats.result()
+    assert result['nan count'] == 3
+    assert result['mean'] == 1.5
+
+
+@pytest.mark.parametrize('data', [
+    np.array([1e300, -1e300, 5e299, -2e299]),
+    np.array([1.7e308, -1.7e308] * 3),
+    np.r_[np.arange(100.0), 1e300],
+])
+def test_huge_values(data):
+    scale = 1e300
+    mean = (data / scale).mean() * scale
+    std = (data / scale).std() * scale
+
+    result = accumulate(np.array_split(data, 2)).result()
+    assert result['mean'] == pytest.approx(mean, abs=1e-12 * scale)
+    assert result['std'] == pytest.approx(std)
+    assert sum(result['histogram']['counts']) == data.size
+
+    stats = StreamingStatistics()
+    for piece in np.array_split(data, 2):
+        stats.merge(accumulate([piece]))
+
+    result = stats.result()
+    assert result['mean'] == pytest.approx(mean, abs=1e-12 * scale)
+    assert result['std'] == pytest.approx(std)
+    assert sum(result['histogram']['counts']) == data.size
+
+
+def test_cache_saves_on_flush(tmp_path):
+    path = tmp_path / 'statistics.json'
+    cache = StatisticsCache(str(path))
+
+    cache.put('key', {'mean': 1.0})
+    assert not path.exists()
+
+    cache.flush()
+    assert StatisticsCache(str(path)).get('key') == {'mean': 1.0}
+
+    # nothing new to save
+    path.unlink()
+    cache.flush()
+    assert not path.exists()
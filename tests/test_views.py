@@ -0,0 +1,93 @@
+import h5py
+import numpy as np
+import pytest
+
+from qtpy.QtCore import QThreadPool
+
+
+@pytest.fixture
+def widget(qapp, tmp_path):
+    from hdf5view.views import HDF5Widget
+
+    with h5py.File(tmp_path / 'test.h5', 'w') as f:
+        f['stack'] = np.arange(4 * 30 * 40, dtype='f4').reshape(4, 30, 40)
+        f['image'] = np.ones((30, 40))
+        f['trace'] = np.arange(100.0)
+        f['group/stack'] = np.zeros((2, 30, 40), dtype='i2')
+
+    hdf = h5py.File(tmp_path / 'test.h5', 'r')
+    widget = HDF5Widget(hdf)
+
+    yield widget
+
+    widget.loader.cancel_all()
+    QThreadPool.globalInstance().waitForDone()
+    hdf.close()
+
+
+def process(qapp):
+    for _ in range(3):
+        qapp.processEvents()
+        QThreadPool.globalInstance().waitForDone()
+    qapp.processEvents()
+
+
+def select(qapp, widget, path):
+    widget.tree_view.setCurrentIndex(widget.tree_model.index_from_path(path))
+    process(qapp)
+
+
+def counts(widget):
+    return [(model.update_count, model.load_count)
+            for model in (widget.data_model, widget.image_model, widget.plot_model)]
+
+
+def test_hidden_tabs_do_no_io(qapp, widget):
+    select(qapp, widget, '/stack')
+    widget.add_image()
+    widget.add_plot()
+    process(qapp)
+
+    widget.tabs.setCurrentIndex(0)
+    process(qapp)
+    data, image, plot = counts(widget)
+
+    for path in ('/image', '/trace', '/stack'):
+        select(qapp, widget, path)
+
+    assert widget.data_model.node.name == '/stack'
+    assert widget.data_model.update_count == data[0] + 3
+    assert counts(widget)[1:] == [image, plot]
+
+    # the image model catches up when its tab is shown
+    widget.tabs.setCurrentIndex(1)
+    process(qapp)
+
+    assert widget.image_model.node.name == '/stack'
+    assert widget.image_model.update_count == image[0] + 1
+    assert counts(widget)[2] == plot
+
+
+def test_tabs_restore_their_node_after_a_reset(qapp, widget):
+    select(qapp, widget, '/group/stack')
+    widget.add_image()
+    process(qapp)
+
+    widget.tabs.setCurrentIndex(0)
+    select(qapp, widget, '/trace')
+
+    # rebuild the tree, e.g. when the metadata index is out of date
+    widget.tree_model.set_metadata_index(None, reset=True)
+    widget.tree_model.index_from_path('/trace')
+
+    widget.tabs.setCurrentIndex(1)
+    process(qapp)
+
+    assert widget.tree_model.path(widget.tree_view.currentIndex()) == '/group/stack'
+    assert widget.image_model.node.name == '/group/stack'
+
+    widget.tabs.setCurrentIndex(0)
+    process(qapp)
+
+    assert widget.tree_model.path(widget.tree_view.currentIndex()) == '/trace'
+    assert widget.data_model.node.name == '/trace'
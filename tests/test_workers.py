@@ -0,0 +1,35 @@
+import threading
+
+from qtpy.QtCore import QThreadPool
+
+from hdf5view.workers import DataLoader
+
+
+def wait(worker, event):
+    event.wait(10)
+    worker.report(1, 1)
+    return worker.key
+
+
+def test_cancel_busy(qapp):
+    pool = QThreadPool()
+    loader = DataLoader(pool)
+    event = threading.Event()
+    results = []
+
+    loader.load(('read',), results.append, wait, event, message='Reading')
+    loader.load(('index',), results.append, wait, event)
+
+    assert loader.is_busy()
+
+    loader.cancel_busy()
+
+    assert not loader.is_busy()
+    assert not loader.is_loading(('read',))
+    assert loader.is_loading(('index',))
+
+    event.set()
+    pool.waitForDone()
+    qapp.processEvents()
+
+    assert results == [('index',)]